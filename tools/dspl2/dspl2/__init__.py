@@ -6,21 +6,30 @@
 
 from dspl2.expander import Dspl2JsonLdExpander
 from dspl2.expander import Dspl2RdfExpander
+from dspl2.expander import SliceFilter
+from dspl2.expansioncache import ExpansionCache
 from dspl2.filegetter import HybridFileGetter
 from dspl2.filegetter import InternetFileGetter
 from dspl2.filegetter import LocalFileGetter
 from dspl2.filegetter import UploadedFileGetter
+from dspl2.filegetter import ZipFileGetter
+from dspl2.httpcache import HttpCache
 from dspl2.jsonutil import AsList
+from dspl2.jsonutil import CompactObservations
+from dspl2.jsonutil import ExpandCompactObservations
 from dspl2.jsonutil import GetSchemaId
 from dspl2.jsonutil import GetSchemaProp
 from dspl2.jsonutil import GetSchemaType
 from dspl2.jsonutil import GetUrl
 from dspl2.jsonutil import JsonToKwArgsDict
 from dspl2.jsonutil import MakeIdKeyedDict
+from dspl2.jsonutil import WriteJson
 from dspl2.rdfutil import LoadGraph
 from dspl2.rdfutil import FrameGraph
 from dspl2.rdfutil import MakeSparqlSelectQuery
+from dspl2.rdfutil import NTriplesWriter
 from dspl2.rdfutil import SelectFromGraph
+from dspl2.sqlitestore import SqliteStore
 from dspl2.validator import CheckDataset
 from dspl2.validator import CheckDimension
 from dspl2.validator import CheckMeasure
@@ -37,13 +46,17 @@ __all__ = [
     "CheckSlice",
     "CheckSliceData",
     "CheckStatisticalDataset",
+    "CompactObservations",
     "Dspl2JsonLdExpander",
     "Dspl2RdfExpander",
+    "ExpandCompactObservations",
+    "ExpansionCache",
     "FrameGraph",
     "GetSchemaId",
     "GetSchemaProp",
     "GetSchemaType",
     "GetUrl",
+    "HttpCache",
     "HybridFileGetter",
     "InternetFileGetter",
     "JsonToKwArgsDict",
@@ -51,7 +64,12 @@ __all__ = [
     "LocalFileGetter",
     "MakeIdKeyedDict",
     "MakeSparqlSelectQuery",
+    "NTriplesWriter",
     "SelectFromGraph",
+    "SliceFilter",
+    "SqliteStore",
     "UploadedFileGetter",
     "ValidateDspl2",
+    "WriteJson",
+    "ZipFileGetter",
 ]
@@ -4,23 +4,463 @@
 # license that can be found in the LICENSE file or at
 # https://developers.google.com/open-source/licenses/bsd
 
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+import csv
 from csv import DictReader
+import functools
+from functools import lru_cache
+import hashlib
+import io
+import itertools
+import json
+import os
+from pathlib import Path
+import pickle
+import tempfile
 from urllib.parse import urlparse, urldefrag
-from dspl2.jsonutil import (AsList, GetSchemaId, GetSchemaProp, GetUrl,
-                            MakeIdKeyedDict)
+from dspl2.filegetter import (_GetReferencedFiles, LocalFileGetter,
+                              _OpenLocalFile)
+from dspl2.jsonutil import (AsList, CompactObservations, GetSchemaId,
+                            GetSchemaProp, GetUrl, MakeIdKeyedDict)
 from dspl2.rdfutil import (_DataFileFrame, FrameGraph, MakeSparqlSelectQuery,
                            SCHEMA)
 import rdflib
 import sys
 
 
+# Terms used for every observation, resolved once rather than per row.
+_RdfType = rdflib.RDF.type
+_SchemaData = SCHEMA.data
+_SchemaDimensionValue = SCHEMA.dimensionValue
+_SchemaFootnote = SCHEMA.footnote
+_SchemaMeasureValue = SCHEMA.measureValue
+_SchemaSlice = SCHEMA.slice
+_SchemaValue = SCHEMA.value
+
+
+# Number of rows of a slice CSV file read and expanded at a time.
+_CsvChunkSize = 10000
+# Size of the chunks in which CSV files are hashed and copied.
+_ChunkSize = 1 << 16
+# Written after the lists of triples in cached RDF output, so that output
+# that was not written in full is not used.
+_TriplesEnd = pickle.dumps(None, pickle.HIGHEST_PROTOCOL)
+# Number of CSV files per worker process that are being expanded, or waiting
+# to be added to the output, at once when expanding in parallel.
+_FilesPerWorker = 2
+
+
+def _FindId(id, ids):
+  """Returns the one of `ids` naming `id` in full or by fragment, if any."""
+  id = str(id)
+  if id in ids:
+    return id
+  fragment = urldefrag(id).fragment
+  if fragment and '#' + fragment in ids:
+    return '#' + fragment
+  return None
+
+
+class SliceFilter(object):
+  """Selects the slices, and the rows of their CSV files, to expand.
+
+  `slices` holds the IDs of the slices to expand, and `codeValues` maps
+  dimension IDs to the code values of the rows to keep. IDs may be given in
+  full or as `#fragment`s. `timeRange` is a (start, end) pair of the first and
+  last time dimension values of the rows to keep, either of which may be None.
+  Times are compared as strings, so they should be in a sortable format such
+  as ISO 8601. Arguments left as None do not restrict the expansion.
+
+  Rows are filtered as the CSV files are read, before any observations are
+  built from them.
+  """
+  def __init__(self, *, slices=None, codeValues=None, timeRange=None):
+    self.slices = None if slices is None else set(slices)
+    self.codeValues = {dim: set(codes)
+                       for dim, codes in (codeValues or {}).items()}
+    self.timeRange = tuple(timeRange) if timeRange else (None, None)
+
+  def MatchesSlice(self, slice_id):
+    return self.slices is None or _FindId(slice_id, self.slices) is not None
+
+  def _GetRowFilters(self, dims):
+    """Returns the row filters for a slice's (ID, column, is time) dims.
+
+    Each filter is a (column, code values, start, end) tuple, with the code
+    values sorted so that the filters can be included in cache keys.
+    """
+    row_filters = []
+    for dim_id, column, is_time in dims:
+      dim = _FindId(dim_id, self.codeValues)
+      if dim is not None:
+        row_filters.append(
+            (column, tuple(sorted(self.codeValues[dim])), None, None))
+      if is_time and self.timeRange != (None, None):
+        row_filters.append((column, None) + self.timeRange)
+    return row_filters
+
+  def ToJson(self):
+    return {
+        'slices': None if self.slices is None else sorted(self.slices),
+        'codeValues': {dim: sorted(codes)
+                       for dim, codes in self.codeValues.items()},
+        'timeRange': list(self.timeRange),
+    }
+
+
+def _MakeRowFilter(row_filters, columns):
+  """Returns a test of whether a CSV row matches `row_filters`.
+
+  `columns` maps the names of the columns in the row to their keys in it, e.g.
+  their indexes for rows read by `csv.reader`. Filters on columns missing from
+  it are ignored.
+  """
+  tests = [(columns[column],
+            None if values is None else frozenset(values), start, end)
+           for column, values, start, end in row_filters
+           if column in columns]
+
+  def Matches(row):
+    for key, values, start, end in tests:
+      value = row[key]
+      if ((values is not None and value not in values) or
+          (start is not None and value < start) or
+          (end is not None and value > end)):
+        return False
+    return True
+  return Matches
+
+
+@lru_cache(maxsize=None)
+def _ImportPandas():
+  """Returns the pandas module, or None if it is not installed.
+
+  pandas is slow to import, so it is only imported when a CSV file is first
+  read.
+  """
+  try:
+    import pandas
+  except ImportError:
+    return None
+  return pandas
+
+
+def _ReadCsvColumns(f, columns, row_filters=()):
+  """Yields the values of `columns` in CSV file `f`, in batches of rows.
+
+  Each batch is a pair of its number of rows and a dict mapping the ones of
+  `columns` that are in the file's header to lists of their values, as
+  strings. Rows not matching the (column, code values, start, end) tuples in
+  `row_filters` are skipped. The file is parsed and filtered in chunks by
+  pandas' C parser if pandas is installed, and by `csv.DictReader` otherwise.
+  """
+  pandas = _ImportPandas()
+  if pandas is not None:
+    try:
+      chunks = pandas.read_csv(
+          f, dtype=str, na_filter=False, chunksize=_CsvChunkSize,
+          usecols=lambda column: column in columns)
+    except pandas.errors.EmptyDataError:
+      return
+    with chunks:
+      for chunk in chunks:
+        for column, values, start, end in row_filters:
+          if column not in chunk.columns:
+            continue
+          if values is not None:
+            chunk = chunk[chunk[column].isin(values)]
+          if start is not None:
+            chunk = chunk[chunk[column] >= start]
+          if end is not None:
+            chunk = chunk[chunk[column] <= end]
+        if len(chunk):
+          yield len(chunk), {column: chunk[column].tolist()
+                             for column in chunk.columns}
+    return
+  reader = DictReader(f)
+  fields = [column for column in columns
+            if column in (reader.fieldnames or [])]
+  matches = _MakeRowFilter(row_filters, {column: column for column in fields})
+  size, batch = 0, {column: [] for column in fields}
+  for row in reader:
+    if not matches(row):
+      continue
+    for column in fields:
+      batch[column].append(row[column])
+    size += 1
+    if size == _CsvChunkSize:
+      yield size, batch
+      size, batch = 0, {column: [] for column in fields}
+  if size:
+    yield size, batch
+
+
+class _TermCache(object):
+  """Bounded LRU cache of the terms and strings built from CSV cells.
+
+  Slice CSV files repeat a small number of dimension and footnote codes across
+  many rows, so expanding them through the cache reuses one object per
+  distinct value instead of allocating one per cell.
+  """
+  def __init__(self, maxsize=16384):
+    self.Literal = lru_cache(maxsize=maxsize)(rdflib.Literal)
+    self.URIRef = lru_cache(maxsize=maxsize)(rdflib.URIRef)
+    self.String = lru_cache(maxsize=maxsize)(str)
+
+
+class _SliceDataEmitter(object):
+  """Expansion plan for the rows of one slice CSV file.
+
+  Column indexes, constant triples, predicates and datatypes are resolved once
+  from the CSV header, so that expanding a row only needs to index into it and
+  build the row's literals and blank nodes.
+  """
+  def __init__(self, slice_id, dim_data, measure_data, tableMappings,
+               footnote_prefix, row_filters, header, terms):
+    columns = {field: i for i, field in enumerate(header)}
+    self.Matches = _MakeRowFilter(row_filters, columns)
+    self.slice_id = slice_id
+    self.footnote_prefix = footnote_prefix
+    self.terms = terms
+    self.id_prefix = str(slice_id)
+    if not urldefrag(slice_id).fragment:
+      self.id_prefix += '#'
+    else:
+      self.id_prefix += '/'
+    self.id_columns = []
+    for dim in dim_data:
+      dim_key = dim
+      for tableMapping in tableMappings:
+        if tableMapping['sourceEntity'] == dim:
+          if tableMapping['columnIdentifier']:
+            dim_key = str(tableMapping['columnIdentifier'])
+          break
+      self.id_columns.append((dim + '=', columns[dim_key]))
+    self.id_suffix = ''.join(measure + '/' for measure in measure_data)
+
+    # (node label suffix, column index, constant (predicate, object) pairs,
+    # value predicates and datatypes) for each dimension value node.
+    self.dims = []
+    for dim, data in dim_data.items():
+      consts = [(rdflib.RDF.type, SCHEMA.DimensionValue),
+                (SCHEMA.dimension, data['id'])]
+      values = []
+      for dim_type in data['type']:
+        if dim_type.endswith('CategoricalDimension'):
+          consts.extend((rdflib.RDF.type, type_id) for type_id in data['types'])
+          values.append((SCHEMA.codeValue, None))
+        elif data['types']:
+          values.append((SCHEMA.value, rdflib.URIRef(data['types'][0])))
+        else:
+          values.append((SCHEMA.value, None))
+      self.dims.append(('d' + str(len(self.dims)), columns[dim], consts,
+                        values))
+
+    # (node label suffix, column index, footnote column index, constant
+    # (predicate, object) pairs) for each measure value node.
+    self.measures = []
+    for measure, data in measure_data.items():
+      consts = [(rdflib.RDF.type, SCHEMA.MeasureValue),
+                (SCHEMA.measure, data['id'])]
+      consts.extend((SCHEMA.unitCode, terms.Literal(unit_code))
+                    for unit_code in data['unit_code'])
+      consts.extend((SCHEMA.unitCode, terms.Literal(unit_text))
+                    for unit_text in data['unit_text'])
+      self.measures.append(('m' + str(len(self.measures)), columns[measure],
+                            columns.get(measure + '*'), consts))
+
+  def Triples(self, row, row_num):
+    """Returns the triples for the observation in a CSV row.
+
+    `row_num` is the number of rows of the file expanded before this one. The
+    labels of the observation's blank nodes are derived from its ID and
+    `row_num`, so that a file's triples are the same whichever process expands
+    it and however its rows are read, and repeated rows keep distinct nodes.
+    """
+    literal = self.terms.Literal
+    row_id = (
+        self.id_prefix +
+        ''.join(dim + row[column] + '/' for dim, column in self.id_columns) +
+        self.id_suffix)
+    label = hashlib.blake2b(f'{row_id}\0{row_num}'.encode('utf-8'),
+                            digest_size=16).hexdigest()
+    row_id = rdflib.URIRef(row_id)
+    triples = [(self.slice_id, _SchemaData, row_id),
+               (row_id, _RdfType, SCHEMA.Observation),
+               (row_id, _SchemaSlice, self.slice_id)]
+    for suffix, column, consts, values in self.dims:
+      node_id = rdflib.BNode(label + suffix)
+      triples.append((row_id, _SchemaDimensionValue, node_id))
+      triples.extend((node_id, pred, obj) for pred, obj in consts)
+      triples.extend((node_id, pred, literal(row[column], datatype=datatype))
+                     for pred, datatype in values)
+    for suffix, column, footnote_column, consts in self.measures:
+      node_id = rdflib.BNode(label + suffix)
+      triples.append((row_id, _SchemaMeasureValue, node_id))
+      triples.extend((node_id, pred, obj) for pred, obj in consts)
+      triples.append((node_id, _SchemaValue, rdflib.Literal(row[column])))
+      if footnote_column is not None and row[footnote_column]:
+        for footnote in row[footnote_column].split(';'):
+          if footnote:
+            triples.append((node_id, _SchemaFootnote,
+                            self.terms.URIRef(self.footnote_prefix + footnote)))
+    return triples
+
+
+def _IterSliceTriples(plan, data_id, f, terms):
+  """Yields the triples for the observations in slice CSV file `f`.
+
+  The triples are yielded in lists, each for `_CsvChunkSize` rows at most.
+  """
+  reader = csv.reader(f)
+  try:
+    emitter = _SliceDataEmitter(*plan, next(reader, []), terms)
+    triples = []
+    rows = 0
+    for row in reader:
+      if emitter.Matches(row):
+        triples.extend(emitter.Triples(row, rows))
+        rows += 1
+        if rows % _CsvChunkSize == 0:
+          yield triples
+          triples = []
+    if triples:
+      yield triples
+  except Exception as e:
+    raise RuntimeError(f"Error processing {data_id} at line {reader.line_num}") from e
+
+
+def _ExpandSliceCsvFile(plan, data_id, opener, out_path):
+  """Writes the observation triples for a slice CSV file, in a worker.
+
+  The file is read from `opener()`, and its triples are written to `out_path`
+  by `_WriteTriples`, followed by `_TriplesEnd`.
+  """
+  with opener() as f, open(out_path, 'wb') as out:
+    for triples in _IterSliceTriples(plan, data_id, f, _TermCache()):
+      _WriteTriples(triples, out)
+    out.write(_TriplesEnd)
+
+
+def _WriteTriples(triples, out):
+  """Pickles a list of triples to binary file `out`."""
+  pickle.dump(triples, out, pickle.HIGHEST_PROTOCOL)
+
+
+def _ReadTriples(f):
+  """Returns an iterator of the lists of triples written by `_WriteTriples`.
+
+  None is returned if the file was not written in full, up to `_TriplesEnd`,
+  or if its first list cannot be unpickled.
+  """
+  try:
+    f.seek(-len(_TriplesEnd), io.SEEK_END)
+    if f.read() != _TriplesEnd:
+      return None
+    f.seek(0)
+    triples = pickle.load(f)
+  except Exception:
+    return None
+
+  def Iterate(triples):
+    while triples is not None:
+      yield triples
+      triples = pickle.load(f)
+  return Iterate(triples)
+
+
+def _GetRowsOpener(getter, filename, row_filters):
+  """Returns an opener of the rows of a CSV file that can match `row_filters`.
+
+  The code value filters of a `LocalFileGetter`'s files are looked up in its
+  row indexes, so that only the header and the matching rows are read. None
+  is returned for other files, and for files that cannot be indexed, which
+  are read in full.
+  """
+  if not isinstance(getter, LocalFileGetter):
+    return None
+  filters = {column: values for column, values, _, _ in row_filters
+             if values is not None}
+  if not filters:
+    return None
+  try:
+    return getter.RowsOpener(filename, filters)
+  except RuntimeError:
+    # The file is compressed, or lacks a filtered column.
+    return None
+
+
+def _FetchCsv(getter, filename, row_filters=()):
+  """Returns a text file of a CSV file, or of its rows that can match filters.
+
+  See `_GetRowsOpener`. The rows are still filtered as they are read.
+  """
+  opener = _GetRowsOpener(getter, filename, row_filters)
+  if opener is None:
+    return getter.Fetch(filename)
+  return opener()
+
+
+class _CsvSource(object):
+  """CSV file that can be read again, in this process or in a worker.
+
+  Files of a `LocalFileGetter` are reopened from their path, or read through
+  its row indexes if `row_filters` filter them by code value. Other files are
+  copied into a temporary file as they are fetched, which is removed on
+  leaving the `with` block. If `digest` is provided, it is updated with the
+  UTF-8 encoded contents read, which depend only on the file and the filters.
+  """
+  def __init__(self, getter, filename, digest=None, row_filters=()):
+    self.tmp_path = None
+    if isinstance(getter, LocalFileGetter):
+      self.opener = (_GetRowsOpener(getter, filename, row_filters) or
+                     functools.partial(_OpenLocalFile, getter._Path(filename)))
+      if digest is not None:
+        with self.opener() as f:
+          for chunk in iter(lambda: f.read(_ChunkSize), ''):
+            digest.update(chunk.encode('utf-8'))
+      return
+    with getter.Fetch(filename) as f, tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', newline='', suffix='.csv', delete=False) as tmp:
+      self.tmp_path = tmp.name
+      try:
+        for chunk in iter(lambda: f.read(_ChunkSize), ''):
+          tmp.write(chunk)
+          if digest is not None:
+            digest.update(chunk.encode('utf-8'))
+      except BaseException:
+        tmp.close()
+        self.Close()
+        raise
+    self.opener = functools.partial(open, self.tmp_path, encoding='utf-8',
+                                    newline='')
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.Close()
+
+  def Open(self):
+    return self.opener()
+
+  def Close(self):
+    if self.tmp_path is not None:
+      os.unlink(self.tmp_path)
+      self.tmp_path = None
+
+
 class Dspl2RdfExpander(object):
   """Expand CSV files in an DSPL2 via the RDF graph"""
   def __init__(self, getter):
     self.getter = getter
     self.graph = getter.graph
+    self.sink = self.graph
     self.subjects = set(self.graph.subjects())
+    self.terms = _TermCache()
+    self.cache = None
+    self.sliceFilter = None
 
   def _GetTableMappings(self, subject):
     tableMappings = []
@@ -209,95 +649,224 @@ class Dspl2RdfExpander(object):
       }
     return ret
 
-  def _MakeSliceDataRowId(self, slice_id, dims, measures, row, tableMappings):
-    ret = str(slice_id)
-    if not urldefrag(slice_id).fragment:
-      ret += '#'
-    else:
-      ret += '/'
-    for dim in dims:
-      dim_key = dim
-      for tableMapping in tableMappings:
-        if tableMapping['sourceEntity'] == dim:
-          if tableMapping['columnIdentifier']:
-            dim_key = str(tableMapping['columnIdentifier'])
-          break
-      ret += dim + '=' + row[dim_key]
-      ret += '/'
-    for measure in measures:
-      ret += measure
-      ret += '/'
-    return ret
+  def _GetSliceDataset(self, slice_id):
+    """Returns the IRI of a slice's StatisticalDataset.
 
-  def _ExpandObservationDimensionValue(self, dim, data, row_id, row):
-    node_id = rdflib.BNode()
-    self.graph.add((row_id, SCHEMA.dimensionValue, node_id))
-    self.graph.add((node_id, rdflib.RDF.type, SCHEMA.DimensionValue))
-    self.graph.add((node_id, SCHEMA.dimension, data['id']))
-    for dim_type in data['type']:
-      if dim_type.endswith('CategoricalDimension'):
-        for type_id in data['types']:
-          self.graph.add((node_id, rdflib.RDF.type, type_id))
-        self.graph.add((node_id, SCHEMA.codeValue, rdflib.Literal(row[dim])))
-      else:
-        if data['types']:
-          self.graph.add(
-              (node_id, SCHEMA.value,
-               rdflib.Literal(row[dim],
-                              datatype=rdflib.URIRef(data['types'][0]))))
-        else:
-          self.graph.add((node_id, SCHEMA.value, rdflib.Literal(row[dim])))
-
-  def _ExpandObservationMeasureValue(self, measure, data, row_id, row):
-    node_id = rdflib.BNode()
-    self.graph.add((row_id, SCHEMA.measureValue, node_id))
-    self.graph.add((node_id, rdflib.RDF.type, SCHEMA.MeasureValue))
-    for unit_code in data['unit_code']:
-      self.graph.add((node_id, SCHEMA.unitCode, rdflib.Literal(unit_code)))
-    for unit_text in data['unit_text']:
-      self.graph.add((node_id, SCHEMA.unitCode, rdflib.Literal(unit_text)))
-    self.graph.add((node_id, SCHEMA.value, rdflib.Literal(row[measure])))
-    for footnote in row.get(measure + '*', '').split(';'):
-      footnote_id = rdflib.BNode()
-      self.graph.add((node_id, SCHEMA.footnote, footnote_id))
-      self.graph.add((footnote_id, rdflib.RDF.type,
-                      SCHEMA.StatisticalAnnotation))
-      self.graph.add((footnote_id, SCHEMA.codeValue, rdflib.Literal(footnote)))
+    Values of the slice's `dataset` property that are not IRIs of a
+    StatisticalDataset, such as the empty literal in some datasets, are
+    skipped. The slice's own IRI is returned if no dataset is found.
+    """
+    candidates = itertools.chain(
+        self.graph.objects(slice_id, SCHEMA.dataset),
+        self.graph.subjects(SCHEMA.slice, slice_id),
+        self.graph.subjects(rdflib.RDF.type, SCHEMA.StatisticalDataset))
+    for dataset in candidates:
+      if (isinstance(dataset, rdflib.URIRef) and
+          (dataset, rdflib.RDF.type, SCHEMA.StatisticalDataset) in self.graph):
+        return dataset
+    return slice_id
 
-  def _ExpandSliceData(self, slice_id):
+  def _GetSliceDataPlan(self, slice_id):
     tableMappings = self._GetTableMappings(slice_id)
     dim_data = self._GetDimensionDataForSlice(slice_id, tableMappings)
     measure_data = self._GetMeasureDataForSlice(slice_id, tableMappings)
-    for data_id in self.graph.objects(
-        subject=slice_id,
-        predicate=SCHEMA.data):
-      if data_id not in self.subjects:
-        with self.getter.Fetch(data_id) as f:
-          reader = DictReader(f)
-          try:
-            for row in reader:
-              row_id = rdflib.URIRef(self._MakeSliceDataRowId(
-                  slice_id, dim_data, measure_data, row, tableMappings))
-              self.graph.add((slice_id, SCHEMA.data, row_id))
-              self.graph.add((row_id, rdflib.RDF.type, SCHEMA.Observation))
-              self.graph.add((row_id, SCHEMA.slice, slice_id))
-              for dim, data in dim_data.items():
-                self._ExpandObservationDimensionValue(dim, data, row_id, row)
-              for measure, data in measure_data.items():
-                self._ExpandObservationMeasureValue(measure, data, row_id, row)
-          except Exception as e:
-            raise RuntimeError(f"Error processing {data_id} at line {reader.line_num}") from e
-
-  def Expand(self):
+    # Footnote codes refer to the dataset's footnotes, as expanded by
+    # _ExpandFootnotes.
+    footnote_prefix = (urldefrag(str(self._GetSliceDataset(slice_id))).url +
+                       '#footnote=')
+    row_filters = []
+    if self.sliceFilter is not None:
+      row_filters = self.sliceFilter._GetRowFilters(
+          (data['id'], csv_id,
+           any(dim_type.endswith('TimeDimension') for dim_type in data['type']))
+          for csv_id, data in dim_data.items())
+    return (slice_id, dim_data, measure_data, tableMappings, footnote_prefix,
+            row_filters)
+
+  def _GetSliceDataIds(self, slice_id):
+    return sorted(data_id
+                  for data_id in self.graph.objects(
+                      subject=slice_id,
+                      predicate=SCHEMA.data)
+                  if data_id not in self.subjects)
+
+  def _AddTriples(self, triples):
+    sink = self.sink
+    sink.addN((sub, pred, obj, sink) for sub, pred, obj in triples)
+
+  def _AddCachedTriples(self, data_id, digest):
+    """Adds a CSV file's cached triples, and returns whether it had any.
+
+    Output that cannot be read is treated as missing, so that the file is
+    expanded again and its output replaced.
+    """
+    f = self.cache.Open('rdf', data_id, digest)
+    if f is None:
+      return False
+    with f:
+      batches = _ReadTriples(f)
+      if batches is None:
+        return False
+      for triples in batches:
+        self._AddTriples(triples)
+    return True
+
+  def _ExpandSliceData(self, slice_id):
+    plan = self._GetSliceDataPlan(slice_id)
+    for data_id in self._GetSliceDataIds(slice_id):
+      row_filters = plan[-1]
+      if self.cache is None:
+        with _FetchCsv(self.getter, data_id, row_filters) as f:
+          for triples in _IterSliceTriples(plan, data_id, f, self.terms):
+            self._AddTriples(triples)
+        continue
+      # The file is hashed as it is read, and its triples are cached as they
+      # are added, so that neither is held in memory in full. Triples are
+      # pickled rather than written as N-Triples, since observation IDs built
+      # from CSV values need not be valid IRIs.
+      digest = self.cache.Hasher(repr(plan))
+      with _CsvSource(self.getter, data_id, digest, row_filters) as source:
+        digest = digest.hexdigest()
+        if self._AddCachedTriples(data_id, digest):
+          continue
+        with source.Open() as f, \
+             self.cache.Writer('rdf', data_id, digest) as out:
+          for triples in _IterSliceTriples(plan, data_id, f, self.terms):
+            _WriteTriples(triples, out)
+            self._AddTriples(triples)
+          out.write(_TriplesEnd)
+
+  def _SubmitSliceFile(self, executor, plan, data_id):
+    """Starts expanding a slice CSV file in a worker, unless it is cached.
+
+    Returns a (data ID, hash, CSV source, future, output path) tuple for
+    `_FinishSliceFile`, whose future and output path are None if the file's
+    output is cached. Workers write their triples to a temporary file, in the
+    cache directory if there is one so that it can be moved into the cache.
+    """
+    digest = None
+    if self.cache is not None:
+      digest = self.cache.Hasher(repr(plan))
+    source = _CsvSource(self.getter, data_id, digest, plan[-1])
+    try:
+      if digest is not None:
+        digest = digest.hexdigest()
+        f = self.cache.Open('rdf', data_id, digest)
+        if f is not None:
+          f.close()
+          return data_id, digest, source, None, None
+      fd, out_path = tempfile.mkstemp(
+          suffix='.tmp', dir=None if self.cache is None else self.cache.path)
+      os.close(fd)
+      future = executor.submit(_ExpandSliceCsvFile, plan, data_id,
+                               source.opener, out_path)
+    except BaseException:
+      source.Close()
+      raise
+    return data_id, digest, source, future, out_path
+
+  def _FinishSliceFile(self, plan, data_id, digest, source, future, out_path):
+    """Adds the triples of a file started by `_SubmitSliceFile`."""
+    with source:
+      if future is None:
+        if self._AddCachedTriples(data_id, digest):
+          return
+        fd, out_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache.path)
+        os.close(fd)
+      try:
+        if future is None:
+          # The cached output cannot be read, so the file is expanded here.
+          _ExpandSliceCsvFile(plan, data_id, source.opener, out_path)
+        else:
+          future.result()
+        with open(out_path, 'rb') as f:
+          for triples in _ReadTriples(f):
+            self._AddTriples(triples)
+      except BaseException:
+        os.unlink(out_path)
+        raise
+      if digest is None:
+        os.unlink(out_path)
+      else:
+        self.cache.PutFile('rdf', data_id, digest, out_path)
+
+  def _ExpandSlicesInParallel(self, slice_ids, max_workers):
+    """Expands the slices' CSV files in worker processes.
+
+    Files are passed to the workers by reference, and their triples are added
+    in order as each one finishes. At most `_FilesPerWorker * max_workers`
+    files are being expanded or waiting to be added at once, so that neither
+    the files nor their triples are held in memory in full.
+    """
+    pending = deque()
+    try:
+      with ProcessPoolExecutor(max_workers) as executor:
+        for slice_id in slice_ids:
+          plan = self._GetSliceDataPlan(slice_id)
+          for data_id in self._GetSliceDataIds(slice_id):
+            pending.append(
+                (plan,) + self._SubmitSliceFile(executor, plan, data_id))
+            if len(pending) >= _FilesPerWorker * max_workers:
+              self._FinishSliceFile(*pending.popleft())
+        while pending:
+          self._FinishSliceFile(*pending.popleft())
+    finally:
+      # Files left by an error are removed once the workers have exited.
+      for _, _, _, source, _, out_path in pending:
+        source.Close()
+        if out_path is not None:
+          Path(out_path).unlink(missing_ok=True)
+
+  def Expand(self, *, stream=None, max_workers=None, cache=None,
+             sliceFilter=None):
+    """Expands the CSV files referenced by the graph and returns the graph.
+
+    If `stream` is provided (e.g. an `NTriplesWriter`), the graph is written to
+    it once the code lists and footnotes are expanded, and the slices'
+    observations are then written to it as each CSV row is read instead of
+    being added to the graph.
+
+    If `max_workers` is provided, the slices' CSV files are expanded in that
+    many worker processes, and their observations are added in the same order,
+    and with the same blank node labels, as when expanding them serially.
+
+    If `cache` (an `ExpansionCache`) is provided, slice CSV files whose
+    contents and metadata are unchanged since they were last expanded with it
+    are read from it instead of being expanded again.
+
+    If `sliceFilter` (a `SliceFilter`) is provided, only the slices and rows it
+    selects are expanded.
+    """
+    referenced_files = _GetReferencedFiles(self.graph)
     for dim in set(self.graph.subjects(
         predicate=rdflib.RDF.type,
         object=SCHEMA.CategoricalDimension)):
       self._ExpandCodeList(dim)
     self._ExpandFootnotes()
-    for slice_id in set(self.graph.subjects(
+    slice_ids = sorted(set(self.graph.subjects(
         predicate=rdflib.RDF.type,
-        object=SCHEMA.DataSlice)):
-      self._ExpandSliceData(slice_id)
+        object=SCHEMA.DataSlice)))
+    if sliceFilter is not None:
+      slice_ids = [slice_id for slice_id in slice_ids
+                   if sliceFilter.MatchesSlice(slice_id)]
+    if stream is not None:
+      stream.write(self.graph)
+      self.sink = stream
+    self.cache = cache
+    self.sliceFilter = sliceFilter
+    try:
+      if max_workers:
+        self._ExpandSlicesInParallel(slice_ids, max_workers)
+      else:
+        for slice_id in slice_ids:
+          self._ExpandSliceData(slice_id)
+    finally:
+      self.sink = self.graph
+      self.cache = None
+      self.sliceFilter = None
+    if cache is not None:
+      cache.Prune('rdf', referenced_files)
+      cache.Save()
     return self.graph
 
 
@@ -305,143 +874,396 @@ class Dspl2JsonLdExpander(object):
   """Expand CSV files in an DSPL2 directly as JSON-LD"""
   def __init__(self, getter):
     self.getter = getter
+    self.terms = _TermCache()
+    self.cache = None
+
+  def _GetCachedOutput(self, filename, digest):
+    """Returns the cached output for a CSV file with a hash, if any."""
+    output = self.cache.Get('jsonld', filename, digest)
+    if output is None:
+      return None
+    try:
+      return json.loads(output.decode('utf-8'))
+    except ValueError:
+      # Output that cannot be read is expanded again, and replaced.
+      return None
+
+  def _CacheOutput(self, filename, digest, data):
+    if digest is not None:
+      self.cache.Put('jsonld', filename, digest,
+                     json.dumps(data).encode('utf-8'))
+
+  def _ExpandCsv(self, filename, metadata, expand, row_filters=()):
+    """Returns `expand` applied to a CSV file, or its cached output.
+
+    With a cache, the file is hashed as it is read, and is only expanded if
+    its hash changed. Only the rows that can match `row_filters` are read
+    from files that have row indexes.
+    """
+    if self.cache is None:
+      with _FetchCsv(self.getter, filename, row_filters) as f:
+        return expand(f)
+    digest = self.cache.Hasher(json.dumps(metadata, sort_keys=True))
+    with _CsvSource(self.getter, filename, digest, row_filters) as source:
+      digest = digest.hexdigest()
+      data = self._GetCachedOutput(filename, digest)
+      if data is None:
+        with source.Open() as f:
+          data = expand(f)
+        self._CacheOutput(filename, digest, data)
+    return data
 
   def _ExpandCodeList(self, dim):
     """Load a code list from CSV and return a list of JSON-LD objects."""
-    codeList = []
-    dimProps = []
+    return self._ExpandCsv(GetSchemaProp(dim, 'codeList'), dim,
+                           lambda f: self._ExpandCodeListRows(dim, f))
+
+  @staticmethod
+  def _GetCodeListPlan(dim, fields):
+    """Returns the edits that turn each code list row into a DimensionValue.
+
+    Each edit is a tuple of an operation name and its arguments. They are
+    resolved once from the dimension's properties and table mappings and the
+    CSV header, and applied in order to every row.
+    """
+    plan = []
     tableMappings = {}
-    for dimProp in AsList(GetSchemaProp(dim, 'dimensionProperty')):
-      dimProps.append(dimProp)
     for tableMapping in AsList(GetSchemaProp(dim, 'tableMapping')):
       tableMappings[GetUrl(tableMapping['sourceEntity'])] = tableMapping
+    for dimProp in AsList(GetSchemaProp(dim, 'dimensionProperty')):
+      propId = GetSchemaProp(dimProp, 'propertyID')
+      value = dimProp.get('value')
+      if not propId:
+        continue
+      if value:
+        plan.append(('set', dimProp['propertyID'], value))
+        continue
+      columnId = propId
+      dimPropId = GetSchemaId(dimProp)
+      if dimPropId:
+        tableMapping = tableMappings.get(dimPropId)
+        if tableMapping and 'columnIdentifier' in tableMapping:
+          columnId = tableMapping.get('columnIdentifier')
+      for field in fields:
+        if field == columnId:
+          if columnId != propId:
+            plan.append(('rename', columnId, propId))
+        elif field.startswith(columnId + '.'):
+          plan.append(('nest', columnId, dimProp['propertyType'], field,
+                       field[len(columnId) + 1:]))
+    return plan
 
-    with self.getter.Fetch(GetSchemaProp(dim, 'codeList')) as f:
-      reader = DictReader(f)
-      for row in reader:
-        entry = {k: v for k, v in row.items()}
-        if GetSchemaProp(dim, 'equivalentType'):
-          entry['@type'] = ['DimensionValue']
-          entry['@type'] += AsList(GetSchemaProp(
-              dim, 'equivalentType'))
+  def _ExpandCodeListRows(self, dim, f):
+    codeList = []
+    if GetSchemaProp(dim, 'equivalentType'):
+      types = ['DimensionValue'] + AsList(GetSchemaProp(dim, 'equivalentType'))
+    else:
+      types = 'DimensionValue'
+    dimId = GetSchemaId(dim)
+    reader = DictReader(f)
+    plan = self._GetCodeListPlan(dim, reader.fieldnames or [])
+    for row in reader:
+      entry = dict(row)
+      entry['@type'] = list(types) if isinstance(types, list) else types
+      entry['@id'] = dimId + '=' + row['codeValue']
+      entry['dimension'] = dimId
+      for op, *args in plan:
+        if op == 'set':
+          key, value = args
+          entry[key] = value
+        elif op == 'rename':
+          columnId, propId = args
+          entry[propId] = entry.pop(columnId)
         else:
-          entry['@type'] = 'DimensionValue'
-        entry['@id'] = GetSchemaId(dim) + '='
-        entry['@id'] += row['codeValue']
-        entry['dimension'] = GetSchemaId(dim)
-        for dimProp in dimProps:
-          propId = GetSchemaProp(dimProp, 'propertyID')
-          value = dimProp.get('value')
-          if propId:
-            if value:
-              entry[dimProp['propertyID']] = value
-              continue
-            columnId = propId
-            dimPropId = GetSchemaId(dimProp)
-            if dimPropId:
-              tableMapping = tableMappings.get(dimPropId)
-              if tableMapping and 'columnIdentifier' in tableMapping:
-                columnId = tableMapping.get('columnIdentifier')
-              else:
-                columnId = propId
-            for field in row:
-              if field == columnId:
-                if columnId != propId:
-                  entry[propId] = entry[columnId]
-                  del entry[columnId]
-              elif field.startswith(columnId + '.'):
-                entry[columnId] = entry.get(columnId, {
-                    '@type': dimProp['propertyType']
-                })
-                if isinstance(entry[columnId], str):
-                  entry[columnId] = {
-                      '@type': dimProp['propertyType'],
-                      'name': row['columnId']
-                  }
-                entry[columnId][field[len(columnId) + 1:]] = entry[field]
-                del entry[field]
-        codeList.append(entry)
+          columnId, propertyType, field, subfield = args
+          if columnId not in entry:
+            entry[columnId] = {'@type': propertyType}
+          if isinstance(entry[columnId], str):
+            entry[columnId] = {
+                '@type': propertyType,
+                'name': row['columnId']
+            }
+          entry[columnId][subfield] = entry.pop(field)
+      codeList.append(entry)
     return codeList
 
   def _ExpandFootnotes(self, filename, json_val):
     """Load footnotes from CSV and return a list of JSON-LD objects."""
+    return self._ExpandCsv(filename, GetSchemaId(json_val),
+                           lambda f: self._ExpandFootnoteRows(f, json_val))
+
+  def _ExpandFootnoteRows(self, f, json_val):
     footnotes = []
-    with self.getter.Fetch(filename) as f:
-      reader = DictReader(f)
-      for row in reader:
-        row['@type'] = 'StatisticalAnnotation'
-        row['@id'] = GetSchemaId(json_val) + '#footnote='
-        row['@id'] += row['codeValue']
-        row['dataset'] = GetSchemaId(json_val)
-        footnotes.append(row)
+    reader = DictReader(f)
+    for row in reader:
+      row['@type'] = 'StatisticalAnnotation'
+      row['@id'] = GetSchemaId(json_val) + '#footnote='
+      row['@id'] += row['codeValue']
+      row['dataset'] = GetSchemaId(json_val)
+      footnotes.append(row)
     return footnotes
 
-  def _ExpandSliceData(self, slice, dim_defs_by_id, meas_defs_by_id):
-    data = []
+  @staticmethod
+  def _GetSliceMetadata(slice, dim_defs_by_id, meas_defs_by_id,
+                        footnote_prefix, sliceFilter=None, compact=False):
+    """Returns everything other than its CSV file that a slice expands from."""
+    metadata = [
+        slice,
+        [dim_defs_by_id.get(GetUrl(dim))
+         for dim in AsList(GetSchemaProp(slice, 'dimension'))],
+        [meas_defs_by_id.get(GetUrl(measure))
+         for measure in AsList(GetSchemaProp(slice, 'measure'))],
+        footnote_prefix,
+    ]
+    if sliceFilter is not None:
+      metadata.append(sliceFilter.ToJson())
+    if compact:
+      metadata.append({'compact': True})
+    return metadata
+
+  def _ExpandSliceData(self, slice, dim_defs_by_id, meas_defs_by_id,
+                       footnote_prefix, sliceFilter=None, compact=False):
+    return self._ExpandCsv(
+        GetSchemaProp(slice, 'data'),
+        self._GetSliceMetadata(slice, dim_defs_by_id, meas_defs_by_id,
+                               footnote_prefix, sliceFilter, compact),
+        lambda f: self._ExpandSliceRows(slice, f, dim_defs_by_id,
+                                        meas_defs_by_id, footnote_prefix,
+                                        sliceFilter, compact),
+        self._GetSliceRowFilters(slice, dim_defs_by_id, sliceFilter))
+
+  def _ExpandSliceRows(self, slice, f, dim_defs_by_id, meas_defs_by_id,
+                       footnote_prefix, sliceFilter=None, compact=False):
+    """Returns a slice's observations, or their compact form if `compact`.
+
+    The compact form is built as the rows are read, without a list of the
+    observations.
+    """
+    rows = self._IterSliceRows(slice, f, dim_defs_by_id, meas_defs_by_id,
+                               footnote_prefix, sliceFilter)
+    if compact:
+      return CompactObservations(rows)
+    return list(rows)
+
+  def _IterSliceData(self, filename, slice, dim_defs_by_id, meas_defs_by_id,
+                     footnote_prefix, sliceFilter=None):
+    with _FetchCsv(self.getter, filename,
+                   self._GetSliceRowFilters(slice, dim_defs_by_id,
+                                            sliceFilter)) as f:
+      yield from self._IterSliceRows(slice, f, dim_defs_by_id,
+                                     meas_defs_by_id, footnote_prefix,
+                                     sliceFilter)
+
+  @staticmethod
+  def _GetSliceColumns(slice, dim_defs_by_id):
+    """Returns a slice's dimension and measure columns.
+
+    Each dimension's and measure's column and value shape are resolved once,
+    rather than for every row, as lists of (dimension, column, key, value type)
+    and (measure, column) tuples.
+    """
     tableMappings = {}
     for tableMapping in AsList(GetSchemaProp(slice, 'tableMapping')):
       tableMappings[GetUrl(tableMapping['sourceEntity'])] = tableMapping
 
-    with self.getter.Fetch(GetSchemaProp(slice, 'data')) as f:
-      reader = DictReader(f)
-      for row in reader:
+    dims = []
+    for dim in AsList(GetSchemaProp(slice, 'dimension')):
+      dim = GetUrl(dim)
+      dim_def = dim_defs_by_id.get(dim)
+      if dim_def is None:
+        raise RuntimeError("Unable to find definition for dimension " + dim)
+      tableMapping = tableMappings.get(dim)
+      if tableMapping:
+        col_id = tableMapping['columnIdentifier']
+      else:
+        col_id = urlparse(dim).fragment
+      dim_type = GetSchemaProp(dim_def, '@type') if dim_def else None
+      if dim_type == 'CategoricalDimension':
+        key, value_type = 'codeValue', None
+      elif dim_type == 'TimeDimension':
+        key, value_type = 'value', GetSchemaProp(dim_def, 'equivalentType')
+      else:
+        key, value_type = None, None
+      dims.append((dim, col_id, key, value_type))
+    measures = []
+    for measure in AsList(GetSchemaProp(slice, 'measure')):
+      measure = GetUrl(measure)
+      tableMapping = tableMappings.get(measure)
+      if tableMapping:
+        col_id = tableMapping['columnIdentifier']
+      else:
+        col_id = urlparse(measure).fragment
+      measures.append((measure, col_id))
+    return dims, measures
+
+  @staticmethod
+  def _GetSliceRowFilters(slice, dim_defs_by_id, sliceFilter):
+    if sliceFilter is None:
+      return []
+    dims, _ = Dspl2JsonLdExpander._GetSliceColumns(slice, dim_defs_by_id)
+    return sliceFilter._GetRowFilters(
+        (dim, col_id, key == 'value') for dim, col_id, key, _ in dims)
+
+  def _IterSliceRows(self, slice, f, dim_defs_by_id, meas_defs_by_id,
+                     footnote_prefix, sliceFilter=None):
+    dims, measures = self._GetSliceColumns(slice, dim_defs_by_id)
+    row_filters = self._GetSliceRowFilters(slice, dim_defs_by_id, sliceFilter)
+
+    slice_id = GetSchemaId(slice)
+    columns = [col_id for _, col_id, _, _ in dims]
+    columns.extend(col_id for _, col_id in measures)
+    columns.extend(col_id + '*' for _, col_id in measures)
+    string = self.terms.String
+    for size, batch in _ReadCsvColumns(f, columns, row_filters):
+      # Intern the dimension values and build the footnote lists a column at
+      # a time.
+      dim_columns = []
+      for dim, col_id, key, value_type in dims:
+        if col_id not in batch:
+          raise RuntimeError(f"Unable to find column '{col_id}' for "
+                             f"dimension {dim}")
+        dim_columns.append(list(map(string, batch[col_id])) if key else None)
+      meas_columns = []
+      for measure, col_id in measures:
+        if col_id not in batch:
+          raise RuntimeError(f"Unable to find column '{col_id}' for "
+                             f"measure {measure}")
+        footnotes = batch.get(col_id + '*')
+        if footnotes is not None:
+          footnotes = [
+              [string(footnote_prefix + footnote)
+               for footnote in codes.split(';') if footnote]
+              if codes else None
+              for codes in footnotes
+          ]
+        meas_columns.append((batch[col_id], footnotes))
+
+      for i in range(size):
         val = {}
         val['@type'] = 'Observation'
-        val['slice'] = GetSchemaId(slice)
+        val['slice'] = slice_id
         val['dimensionValue'] = []
         val['measureValue'] = []
-        for dim in AsList(GetSchemaProp(slice, 'dimension')):
-          dim = GetUrl(dim)
-          dim_def = dim_defs_by_id.get(dim)
-          if dim_def is None:
-            raise RuntimeError("Unable to find definition for dimension " + dim)
-          tableMapping = tableMappings.get(dim)
-          if tableMapping:
-            col_id = tableMapping['columnIdentifier']
-          else:
-            col_id = urlparse(dim).fragment
+        for (dim, _, key, value_type), values in zip(dims, dim_columns):
           dim_val = {
               '@type': 'DimensionValue',
               'dimension': dim,
           }
-          if dim_def:
-            if GetSchemaProp(dim_def, '@type') == 'CategoricalDimension':
-              dim_val['codeValue'] = row[col_id]
-            elif GetSchemaProp(dim_def, '@type') == 'TimeDimension':
-              if GetSchemaProp(dim_def, 'equivalentType'):
-                dim_val['value'] = {
-                    '@type': GetSchemaProp(dim_def, 'equivalentType'),
-                    '@value': row[col_id]
-                }
-              else:
-                dim_val['value'] = row[col_id]
+          if value_type:
+            dim_val[key] = {'@type': value_type, '@value': values[i]}
+          elif key:
+            dim_val[key] = values[i]
           val['dimensionValue'].append(dim_val)
-
-        for measure in AsList(GetSchemaProp(slice, 'measure')):
-          measure = GetUrl(measure)
-          meas_def = meas_defs_by_id.get(measure)
-          tableMapping = tableMappings.get(measure)
-          if tableMapping:
-            col_id = tableMapping['columnIdentifier']
-          else:
-            col_id = urlparse(measure).fragment
+        for (measure, _), (values, footnotes) in zip(measures, meas_columns):
           val['measureValue'].append({
               '@type': 'MeasureValue',
               'measure': measure,
-              'value': row[col_id]
+              'value': values[i]
           })
-          if row.get(col_id + '*'):
-            val['measureValue'][-1]['footnote'] = [
-                {
-                    '@type': 'StatisticalAnnotation',
-                    'codeValue': footnote
-                }
-                for footnote in row[col_id + '*'].split(';')
-            ]
-        data.append(val)
-    return data
+          if footnotes is not None and footnotes[i] is not None:
+            val['measureValue'][-1]['footnote'] = footnotes[i]
+        yield val
+
+  def Expand(self, *, expandDimensions=True, expandSlices=True,
+             lazySlices=False, compactSlices=False, max_workers=None,
+             cache=None, sliceFilter=None):
+    """Expands the CSV files referenced by the dataset and returns it.
+
+    If `lazySlices` is true, each slice's `data` is a generator that reads its
+    CSV file and yields its observations as it is iterated, e.g. by
+    `WriteJson`, so that only one row at a time is held in memory. Lazy slices
+    are neither expanded in parallel nor cached.
+
+    If `compactSlices` is true, each slice's `data` holds its observations in
+    the compact, columnar form of `CompactObservations`, built as the CSV file
+    is read. That form is not JSON-LD, so the result cannot be framed or
+    loaded into a graph.
+
+    If `max_workers` is provided, the slices' CSV files are expanded in that
+    many worker processes.
+
+    If `cache` (an `ExpansionCache`) is provided, CSV files whose contents and
+    metadata are unchanged since they were last expanded with it are read from
+    it instead of being expanded again.
+
+    If `sliceFilter` (a `SliceFilter`) is provided, only the slices and rows it
+    selects are expanded. The `data` of the other slices is left as the name
+    of their CSV file.
+    """
+    if lazySlices and max_workers:
+      raise RuntimeError("Lazy slices cannot be expanded in parallel")
+    if lazySlices and compactSlices:
+      raise RuntimeError("Lazy slices cannot be compacted")
+    referenced_files = _GetReferencedFiles(self.getter.graph)
+    self.cache = cache
+    try:
+      json_val = self._Expand(expandDimensions, expandSlices, lazySlices,
+                              compactSlices, max_workers, sliceFilter)
+    finally:
+      self.cache = None
+    if cache is not None:
+      cache.Prune('jsonld', referenced_files)
+      cache.Save()
+    return json_val
 
-  def Expand(self, *, expandDimensions=True, expandSlices=True):
+  def _ExpandSlicesInParallel(self, slices, dim_defs_by_id, meas_defs_by_id,
+                              footnote_prefix, sliceFilter, compact,
+                              max_workers):
+    """Sets the slices' `data` to their observations, expanded in workers.
+
+    CSV files are passed to the workers by reference, and at most
+    `_FilesPerWorker * max_workers` of them are being expanded or waiting for
+    their output to be cached at once.
+    """
+    pending = deque()
+
+    def Finish():
+      slice, filename, digest, source, data = pending.popleft()
+      with source:
+        data = data.result()
+      self._CacheOutput(filename, digest, data)
+      slice['data'] = data
+
+    try:
+      with ProcessPoolExecutor(max_workers) as executor:
+        for slice in slices:
+          filename = GetSchemaProp(slice, 'data')
+          digest = None
+          if self.cache is not None:
+            digest = self.cache.Hasher(json.dumps(
+                self._GetSliceMetadata(slice, dim_defs_by_id, meas_defs_by_id,
+                                       footnote_prefix, sliceFilter, compact),
+                sort_keys=True))
+          source = _CsvSource(
+              self.getter, filename, digest,
+              self._GetSliceRowFilters(slice, dim_defs_by_id, sliceFilter))
+          try:
+            if digest is not None:
+              digest = digest.hexdigest()
+              data = self._GetCachedOutput(filename, digest)
+              if data is not None:
+                source.Close()
+                slice['data'] = data
+                continue
+            data = executor.submit(
+                _ExpandJsonLdSliceFile, slice, source.opener, dim_defs_by_id,
+                meas_defs_by_id, footnote_prefix, sliceFilter, compact)
+          except BaseException:
+            source.Close()
+            raise
+          pending.append((slice, filename, digest, source, data))
+          if len(pending) >= _FilesPerWorker * max_workers:
+            Finish()
+        while pending:
+          Finish()
+    finally:
+      # Temporary copies left by an error are removed once the workers have
+      # exited.
+      for _, _, _, source, _ in pending:
+        source.Close()
+
+  def _Expand(self, expandDimensions, expandSlices, lazySlices, compactSlices,
+              max_workers, sliceFilter):
     json_val = FrameGraph(self.getter.graph, frame=_DataFileFrame)
     if expandDimensions:
       for dim in AsList(GetSchemaProp(json_val, 'dimension')):
@@ -455,8 +1277,38 @@ class Dspl2JsonLdExpander(object):
           AsList(GetSchemaProp(json_val, 'dimension')))
       meas_defs_by_id = MakeIdKeyedDict(
           AsList(GetSchemaProp(json_val, 'measure')))
-      for slice in AsList(GetSchemaProp(json_val, 'slice')):
-        if isinstance(GetSchemaProp(slice, 'data'), str):
+      # Footnote codes refer to the dataset's footnotes, as expanded by
+      # _ExpandFootnotes.
+      footnote_prefix = GetSchemaId(json_val) + '#footnote='
+      slices = [slice for slice in AsList(GetSchemaProp(json_val, 'slice'))
+                if isinstance(GetSchemaProp(slice, 'data'), str) and
+                (sliceFilter is None or
+                 sliceFilter.MatchesSlice(GetSchemaId(slice)))]
+      if lazySlices:
+        for slice in slices:
+          slice['data'] = self._IterSliceData(
+              GetSchemaProp(slice, 'data'), slice, dim_defs_by_id,
+              meas_defs_by_id, footnote_prefix, sliceFilter)
+      elif max_workers:
+        self._ExpandSlicesInParallel(slices, dim_defs_by_id, meas_defs_by_id,
+                                     footnote_prefix, sliceFilter,
+                                     compactSlices, max_workers)
+      else:
+        for slice in slices:
           slice['data'] = self._ExpandSliceData(slice, dim_defs_by_id,
-                                                meas_defs_by_id)
+                                                meas_defs_by_id,
+                                                footnote_prefix, sliceFilter,
+                                                compactSlices)
     return json_val
+
+
+def _ExpandJsonLdSliceFile(slice, opener, dim_defs_by_id, meas_defs_by_id,
+                           footnote_prefix, sliceFilter, compact):
+  """Returns the observations for a slice CSV file, in a worker.
+
+  The file is read from `opener()`.
+  """
+  with opener() as f:
+    return Dspl2JsonLdExpander(None)._ExpandSliceRows(
+        slice, f, dim_defs_by_id, meas_defs_by_id, footnote_prefix,
+        sliceFilter, compact)
@@ -0,0 +1,142 @@
+# Copyright 2018 Google LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+import contextlib
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+
+
+# Included in every hash, so that cached output is discarded when the format
+# of the expanders' output changes.
+_FormatVersion = '3'
+
+
+class ExpansionCache(object):
+  """On-disk cache of the expanded output of the CSV files in a dataset.
+
+  The cache directory holds a manifest mapping each expanded file to the hash
+  of its contents and of the metadata it was expanded with, plus the expanded
+  output for each hash. An expander passed the same cache on a later run only
+  re-expands the files whose hash changed, and drops the output of files that
+  the dataset no longer references with `Prune`.
+
+  Output is written to a temporary file and renamed into place, so that an
+  interrupted run or a concurrent one never leaves partial output under a
+  hash.
+
+  Cached RDF output is pickled, so only use cache directories you trust.
+  """
+  def __init__(self, path):
+    self.path = Path(path)
+    self.path.mkdir(parents=True, exist_ok=True)
+    try:
+      with (self.path / 'manifest.json').open() as f:
+        self.manifest = json.load(f)
+    except FileNotFoundError:
+      self.manifest = {}
+
+  @staticmethod
+  def Hasher(metadata):
+    """Returns a hash of expansion metadata, to update with a CSV file.
+
+    The hash is updated with the UTF-8 encoded contents of the file, which can
+    be read a chunk at a time.
+    """
+    digest = hashlib.sha256(_FormatVersion.encode('utf-8'))
+    digest.update(metadata.encode('utf-8'))
+    digest.update(b'\0')
+    return digest
+
+  @staticmethod
+  def Hash(text, metadata):
+    """Returns the hash of a CSV file's contents and its expansion metadata."""
+    digest = ExpansionCache.Hasher(metadata)
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+  def Open(self, kind, file_id, digest):
+    """Returns a binary file of the cached output for a file, or None.
+
+    None is returned unless the file's hash is unchanged.
+    """
+    if self.manifest.get(kind, {}).get(str(file_id)) != digest:
+      return None
+    try:
+      return (self.path / digest).open('rb')
+    except FileNotFoundError:
+      return None
+
+  def Get(self, kind, file_id, digest):
+    """Returns the cached output for a file if its hash is unchanged."""
+    f = self.Open(kind, file_id, digest)
+    if f is None:
+      return None
+    with f:
+      return f.read()
+
+  @contextlib.contextmanager
+  def Writer(self, kind, file_id, digest):
+    """Returns a context manager of a binary file for a file's output.
+
+    The output is cached when the `with` block exits without an exception,
+    replacing any older output for the file, and discarded otherwise.
+    """
+    with tempfile.NamedTemporaryFile(dir=self.path, suffix='.tmp',
+                                     delete=False) as f:
+      tmp_path = Path(f.name)
+      try:
+        yield f
+      except BaseException:
+        f.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    self.PutFile(kind, file_id, digest, tmp_path)
+
+  def Put(self, kind, file_id, digest, output):
+    """Caches the output for a file, replacing any older output for it."""
+    with self.Writer(kind, file_id, digest) as f:
+      f.write(output)
+
+  def PutFile(self, kind, file_id, digest, path):
+    """Caches the output written to `path`, by moving it into the cache.
+
+    `path` must be on the same file system as the cache directory, e.g. a
+    temporary file created in it.
+    """
+    Path(path).replace(self.path / digest)
+    entries = self.manifest.setdefault(kind, {})
+    old_digest = entries.get(str(file_id))
+    entries[str(file_id)] = digest
+    if old_digest != digest:
+      self._RemoveOutput(old_digest)
+
+  def Prune(self, kind, file_ids):
+    """Removes the cached output of `kind` for files not in `file_ids`.
+
+    `file_ids` are the files that the dataset references, so that the output
+    of files it no longer references does not accumulate.
+    """
+    file_ids = {str(file_id) for file_id in file_ids}
+    entries = self.manifest.get(kind, {})
+    for file_id in list(entries):
+      if file_id not in file_ids:
+        self._RemoveOutput(entries.pop(file_id))
+
+  def _RemoveOutput(self, digest):
+    """Removes the output for digest, unless another file still has it."""
+    if digest and not any(digest in entries.values()
+                          for entries in self.manifest.values()):
+      (self.path / digest).unlink(missing_ok=True)
+
+  def Save(self):
+    """Writes the manifest."""
+    tmp_path = self.path / f'manifest.json.{os.getpid()}.tmp'
+    with tmp_path.open('w') as f:
+      json.dump(self.manifest, f, indent=2, sort_keys=True)
+    tmp_path.replace(self.path / 'manifest.json')
@@ -4,18 +4,134 @@
 # license that can be found in the LICENSE file or at
 # https://developers.google.com/open-source/licenses/bsd
 
+import bz2
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import csv
 import extruct
-from io import StringIO
+import functools
+import gzip
+import hashlib
+import io
+import itertools
+from io import BytesIO
 import json
-from pathlib import Path
+import lzma
+import mmap
+import os
+from pathlib import Path, PurePosixPath
+import re
 import requests
+from requests.adapters import HTTPAdapter
+import shutil
 import sys
-from urllib.parse import urljoin, urlparse
+import tempfile
+from urllib.parse import unquote, urljoin, urlparse
+from urllib3.util.retry import Retry
+import zipfile
 
-from dspl2.rdfutil import LoadGraph, SelectFromGraph
+from dspl2.rdfutil import _CachePath, LoadGraph, SCHEMA, SelectFromGraph
 
 
-def _ProcessDspl2File(filename, fileobj, *, type=''):
+# Number of files downloaded at once by the getters' Prefetch methods.
+_PrefetchWorkers = 8
+# Connections kept open per host by the getters' sessions.
+_PoolSize = _PrefetchWorkers
+# Retries of failed connections and of responses with `_RetryStatuses`, which
+# wait _BackoffFactor * 2**(retry - 1) seconds between attempts.
+_Retries = 3
+_BackoffFactor = 0.5
+_RetryStatuses = (429, 500, 502, 503, 504)
+# (connect, read) timeouts of each request, in seconds.
+_Timeout = (10, 60)
+# Size of the chunks in which response bodies are read.
+_ChunkSize = 1 << 16
+# Compression formats that files are decompressed from as they are read, as
+# (magic bytes pattern, file extension, open function) tuples.
+_CompressionFormats = (
+    (re.compile(rb'\x1f\x8b'), '.gz', gzip.open),
+    (re.compile(rb'BZh[1-9](?:1AY&SY|\x17rE8P\x90)'), '.bz2', bz2.open),
+    (re.compile(rb'\xfd7zXZ\x00'), '.xz', lzma.open),
+)
+# Number of bytes needed to match the magic bytes patterns.
+_MagicSize = 10
+# Size up to which each uploaded file is kept in memory rather than on disk.
+_SpoolSize = 1 << 20
+# Included in saved row indexes, so that indexes in an older format are
+# rebuilt.
+_RowIndexVersion = 1
+
+
+class _DecompressedFile(io.BufferedIOBase):
+  """Binary file of the decompressed contents of another file.
+
+  Unlike the files opened by `gzip`, `bz2` and `lzma`, it closes the
+  compressed file when closed.
+  """
+  def __init__(self, open_function, fileobj):
+    self.decompressed = open_function(fileobj)
+    self.fileobj = fileobj
+
+  def readable(self):
+    return True
+
+  def read(self, size=-1):
+    return self.decompressed.read(size)
+
+  def read1(self, size=-1):
+    return self.decompressed.read1(size)
+
+  def close(self):
+    if not self.closed:
+      self.decompressed.close()
+      self.fileobj.close()
+    super(_DecompressedFile, self).close()
+
+
+def _PeekMagic(fileobj):
+  """Returns the first bytes of fileobj without consuming them, or None."""
+  if hasattr(fileobj, 'peek'):
+    return fileobj.peek(_MagicSize)[:_MagicSize]
+  if fileobj.seekable():
+    pos = fileobj.tell()
+    magic = fileobj.read(_MagicSize)
+    fileobj.seek(pos)
+    return magic
+  return None
+
+
+def _OpenText(fileobj, name, encoding=None, errors=None, newline=None):
+  """Returns a text file reading binary fileobj, decompressing it if needed.
+
+  gzip, bzip2 and xz files are recognized by their first bytes, or by the
+  extension of `name` if fileobj cannot be peeked at. They are decompressed
+  as they are read.
+  """
+  magic = _PeekMagic(fileobj)
+  for pattern, extension, open_function in _CompressionFormats:
+    if (pattern.match(magic) if magic is not None
+        else name.endswith(extension)):
+      fileobj = _DecompressedFile(open_function, fileobj)
+      break
+  return io.TextIOWrapper(fileobj, encoding=encoding, errors=errors,
+                          newline=newline)
+
+
+def _StripCompression(filename):
+  """Returns filename without a compressed file extension."""
+  for _, extension, _ in _CompressionFormats:
+    if filename.endswith(extension):
+      return filename[:-len(extension)]
+  return filename
+
+
+def _ProcessDspl2File(filename, fileobj, *, type='', store='default'):
+  """Loads a DSPL 2 file into a graph, or returns None if it is not one.
+
+  A compressed file's format is determined by the extension under its
+  compressed one.
+  """
+  filename = _StripCompression(filename)
   if any([filename.endswith('.html'),
           type.startswith('text/html')]):
     data = extruct.extract(fileobj.read(), uniform='True')
@@ -27,83 +143,626 @@ def _ProcessDspl2File(filename, fileobj, *, type=''):
             for subdata_elem in subdata
             if subdata
         ]
-    }, filename)
+    }, filename, store=store)
   if any([filename.endswith('.json'),
           filename.endswith('.jsonld'),
           type.startswith('application/ld+json')]):
     json_val = json.load(fileobj)
-    return LoadGraph(json_val, filename)
+    return LoadGraph(json_val, filename, store=store)
+
+
+def _GetReferencedFiles(graph):
+  """Returns the URLs of the code list, footnote and slice CSV files in graph.
+
+  Objects of these properties that are subjects in the graph have already been
+  expanded inline, and are skipped.
+  """
+  return {
+      str(file)
+      for prop in (SCHEMA.codeList, SCHEMA.footnote, SCHEMA.data)
+      for file in graph.objects(predicate=prop)
+      if (file, None, None) not in graph
+  }
+
+
+def _MakeSession(pool_size=_PoolSize):
+  """Returns a session that keeps connections alive and retries failures."""
+  retry = Retry(total=_Retries, backoff_factor=_BackoffFactor,
+                status_forcelist=_RetryStatuses, allowed_methods={'GET'},
+                raise_on_status=False)
+  adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                        max_retries=retry)
+  session = requests.Session()
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  return session
+
+
+class _ResponseReader(io.RawIOBase):
+  """Raw binary file of a streamed response's body, read chunk by chunk.
+
+  Closing it closes the response, which returns the connection to the
+  session's pool once the body has been read.
+  """
+  def __init__(self, response):
+    self.response = response
+    self.chunks = response.iter_content(_ChunkSize)
+    self.pending = b''
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    # Fills the buffer, so that peeking sees enough of the body to detect
+    # compression.
+    size = 0
+    while size < len(buffer):
+      if not self.pending:
+        self.pending = next(self.chunks, b'')
+        if not self.pending:
+          break
+      count = min(len(buffer) - size, len(self.pending))
+      buffer[size:size + count] = self.pending[:count]
+      self.pending = self.pending[count:]
+      size += count
+    return size
+
+  def close(self):
+    if not self.closed:
+      self.response.close()
+    super(_ResponseReader, self).close()
+
+
+def _OpenBody(fileobj, url, encoding):
+  """Returns a text file of a binary file of the body of url."""
+  return _OpenText(fileobj, urlparse(url).path, encoding=encoding,
+                   errors='replace', newline='')
+
+
+def _OpenUrl(session, url, timeout, cache):
+  """Returns a text file of the body of url, and its content type.
+
+  Without a cache, the body is streamed: it is downloaded, decompressed and
+  decoded as the file is read, so only a chunk of it is held in memory at a
+  time.
+  """
+  if cache:
+    fileobj, content_type, encoding = cache.Open(session, url, timeout)
+  else:
+    r = session.get(url, timeout=timeout, stream=True)
+    if not r.ok:
+      # Read the (small) error body, so that it is available to the caller
+      # and the connection is released.
+      r.content
+      r.raise_for_status()
+    fileobj = io.BufferedReader(_ResponseReader(r), _ChunkSize)
+    content_type = r.headers.get('content-type', '')
+    encoding = r.encoding or 'utf-8'
+  return _OpenBody(fileobj, url, encoding), content_type
+
+
+def _DownloadUrl(session, url, timeout, cache):
+  """Returns a binary file of the downloaded body of url, and its charset.
+
+  The body is read from `cache` if there is one, and is otherwise written to
+  an anonymous temporary file, which is removed when it is closed.
+  """
+  if cache:
+    fileobj, _, encoding = cache.Open(session, url, timeout)
+    return fileobj, encoding
+  r = session.get(url, timeout=timeout, stream=True)
+  try:
+    if not r.ok:
+      # Read the (small) error body, so that the connection is released.
+      r.content
+      r.raise_for_status()
+    fileobj = tempfile.TemporaryFile()
+    try:
+      for chunk in r.iter_content(_ChunkSize):
+        fileobj.write(chunk)
+      fileobj.seek(0)
+    except BaseException:
+      fileobj.close()
+      raise
+    return fileobj, r.encoding or 'utf-8'
+  finally:
+    r.close()
+
+
+def _DownloadUrls(session, urls, max_workers, timeout, cache):
+  """Downloads urls concurrently, and returns a dict of their bodies.
+
+  Each body is a (binary file, charset) pair from `_DownloadUrl`. URLs that
+  fail to download are left out, so that the error is raised by the later
+  `Fetch` of the file, if any.
+  """
+  with ThreadPoolExecutor(max_workers) as executor:
+    futures = {url: executor.submit(_DownloadUrl, session, url, timeout, cache)
+               for url in urls}
+  bodies = {}
+  for url, future in futures.items():
+    if future.exception() is None:
+      bodies[url] = future.result()
+  return bodies
+
+
+def _IsSeekable(stream):
+  seekable = getattr(stream, 'seekable', None)
+  if seekable is None:
+    # SpooledTemporaryFile only has seekable from Python 3.11.
+    return hasattr(stream, 'seek')
+  return seekable()
+
+
+class _SpoolReader(io.RawIOBase):
+  """Raw binary file reading a seekable file from its own position.
+
+  Several readers of one file can be open at once, and closing a reader
+  leaves the file open.
+  """
+  def __init__(self, spool):
+    self.spool = spool
+    self.pos = 0
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    self.spool.seek(self.pos)
+    # SpooledTemporaryFile only has readinto from Python 3.11.
+    data = self.spool.read(len(buffer))
+    size = len(data)
+    buffer[:size] = data
+    self.pos += size
+    return size
 
 
 class UploadedFileGetter(object):
-  def __init__(self, files):
-    json_files = set()
+  """Gets a dataset and its CSV files from uploaded files.
+
+  `files` are objects with `filename` and a binary `stream`, such as Flask's
+  uploads, which are streamed and decompressed as needed on each `Fetch`.
+  Seekable streams, such as the temporary files Flask spools uploads to, are
+  read in place. Other streams are copied once into a temporary file, which
+  is kept in memory up to `_SpoolSize` bytes and on disk beyond that.
+
+  The temporary files are removed by `Close`, or on leaving a `with` block.
+  The uploads' own streams are left open.
+  """
+  def __init__(self, files, *, store='default'):
     self.graph = None
     self.file_map = {}
+    self.spools = []
+    try:
+      self._Load(files, store)
+    except Exception:
+      self.Close()
+      raise
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.Close()
+
+  def Close(self):
+    """Closes and removes the temporary files of the uploads."""
+    for spool in self.spools:
+      spool.close()
+    self.spools = []
+    self.file_map = {}
+
+  def _Load(self, files, store):
+    json_files = set()
     for f in files:
-      self.file_map[f.filename] = f
-      data = _ProcessDspl2File(f.filename, f.stream)
+      if _IsSeekable(f.stream):
+        self.file_map[f.filename] = f.stream
+      else:
+        spool = tempfile.SpooledTemporaryFile(_SpoolSize)
+        self.spools.append(spool)
+        self.file_map[f.filename] = spool
+        shutil.copyfileobj(f.stream, spool, _ChunkSize)
+      with self._Open(f.filename) as fileobj:
+        data = _ProcessDspl2File(f.filename, fileobj, store=store)
       if data:
         json_files.add(f.filename)
         self.base = f.filename
         self.graph = data
     if not self.graph:
       raise RuntimeError("DSPL 2 file not present in {}".format(
-          [file.filename for file in self.file_map.values()]))
+          list(self.file_map)))
     if len(json_files) > 1:
       raise RuntimeError("Multiple DSPL 2 files present: {}".format(json_files))
 
+  def _Open(self, filename):
+    return _OpenText(
+        io.BufferedReader(_SpoolReader(self.file_map[filename]), _ChunkSize),
+        filename, encoding='utf-8', newline='')
+
   def Fetch(self, filename):
-    f = self.file_map.get(filename)
-    if not f:
+    if filename not in self.file_map:
       raise IOError(None, 'File not found', filename)
-    f.stream.seek(0)
-    return StringIO(f.read().decode('utf-8'))
+    return self._Open(filename)
 
 
 class InternetFileGetter(object):
-  def __init__(self, url):
+  """Gets a dataset and its CSV files over HTTP.
+
+  Requests go through `session`, which defaults to a new `requests.Session`
+  keeping up to `pool_size` connections per host alive and retrying failed
+  requests. `timeout` is passed to each request. If `cache` is a
+  `dspl2.httpcache.HttpCache`, responses are cached in it.
+  """
+  def __init__(self, url, *, store='default', session=None,
+               pool_size=_PoolSize, timeout=_Timeout, cache=None):
     self.base = url
-    r = requests.get(self.base)
-    r.raise_for_status()
-    self.graph = _ProcessDspl2File(url, StringIO(r.text), type=r.headers['content-type'])
+    self.prefetched = {}
+    self.session = session or _MakeSession(pool_size)
+    self.timeout = timeout
+    self.cache = cache
+    fileobj, content_type = _OpenUrl(self.session, self.base, self.timeout,
+                                     self.cache)
+    with fileobj:
+      self.graph = _ProcessDspl2File(url, fileobj, type=content_type,
+                                     store=store)
+
+  def Prefetch(self, *, max_workers=_PrefetchWorkers):
+    """Concurrently downloads the CSV files referenced by the dataset.
+
+    The files are downloaded into `cache`, or into temporary files without
+    one. The next call to `Fetch` for each file streams it from there, and
+    later ones request it again.
+    """
+    self.prefetched.update(_DownloadUrls(
+        self.session,
+        {urljoin(self.base, file) for file in _GetReferencedFiles(self.graph)},
+        max_workers, self.timeout, self.cache))
 
   def Fetch(self, filename):
-    r = requests.get(urljoin(self.base, filename))
-    r.raise_for_status()
-    return StringIO(r.text)
+    url = urljoin(self.base, filename)
+    if url in self.prefetched:
+      fileobj, encoding = self.prefetched.pop(url)
+      return _OpenBody(fileobj, url, encoding)
+    return _OpenUrl(self.session, url, self.timeout, self.cache)[0]
 
 
-class LocalFileGetter(object):
+class _MappedFile(io.RawIOBase):
+  """Seekable raw binary file reading a memory-mapped local file."""
   def __init__(self, path):
+    with open(path, 'rb') as f:
+      try:
+        self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      except ValueError:
+        # Empty files cannot be mapped.
+        self.map = b''
+    self.pos = 0
+
+  def readable(self):
+    return True
+
+  def seekable(self):
+    return True
+
+  def readinto(self, buffer):
+    data = self.map[self.pos:self.pos + len(buffer)]
+    buffer[:len(data)] = data
+    self.pos += len(data)
+    return len(data)
+
+  def readline(self, size=-1):
+    end = self.map.find(b'\n', self.pos) + 1 or len(self.map)
+    if size >= 0:
+      end = min(end, self.pos + size)
+    line = self.map[self.pos:end]
+    self.pos += len(line)
+    return line
+
+  def seek(self, offset, whence=io.SEEK_SET):
+    if whence == io.SEEK_CUR:
+      offset += self.pos
+    elif whence == io.SEEK_END:
+      offset += len(self.map)
+    self.pos = max(offset, 0)
+    return self.pos
+
+  def tell(self):
+    return self.pos
+
+  def close(self):
+    if not self.closed and isinstance(self.map, mmap.mmap):
+      self.map.close()
+    super(_MappedFile, self).close()
+
+
+def _OpenMappedFile(path):
+  raw = _MappedFile(path)
+  magic = raw.map[:_MagicSize]
+  if any(pattern.match(magic) for pattern, _, _ in _CompressionFormats):
+    raw.close()
+    raise RuntimeError("Cannot memory-map compressed file {}".format(path))
+  return raw
+
+
+def _ReadCsvRecords(raw):
+  """Yields (byte offset, row) for the CSV records of raw from its position."""
+  lines = (line.decode('utf-8') for line in iter(raw.readline, b''))
+  start = raw.tell()
+  # csv.reader reads no further than the end of each record, so the position
+  # of raw after a record is the start of the next one.
+  for row in csv.reader(lines):
+    yield start, row
+    start = raw.tell()
+
+
+def _BuildRowIndex(raw, columns):
+  """Returns the header of a CSV file and the offsets of its rows by key.
+
+  Keys are JSON lists of the values of `columns` in each row.
+  """
+  records = _ReadCsvRecords(raw)
+  _, header = next(records, (0, []))
+  try:
+    key_columns = [header.index(column) for column in columns]
+  except ValueError:
+    raise RuntimeError("Columns {} not all present in {}".format(
+        columns, header))
+  rows = defaultdict(list)
+  for offset, row in records:
+    if row:
+      rows[json.dumps([row[column] for column in key_columns])].append(offset)
+  return {'header': header, 'rows': rows}
+
+
+class _RowsFile(io.RawIOBase):
+  """Raw binary file of a local CSV file's header and its rows at `offsets`.
+
+  The file is read through a memory map, and each row is copied out of it as
+  it is read.
+  """
+  def __init__(self, path, offsets):
+    self.raw = _OpenMappedFile(path)
+    self.records = self._IterRecords(offsets)
+    self.pending = b''
+
+  def _IterRecords(self, offsets):
+    for offset in itertools.chain([0], offsets):
+      self.raw.seek(offset)
+      next(_ReadCsvRecords(self.raw), None)
+      yield self.raw.map[offset:self.raw.tell()]
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    if not self.pending:
+      self.pending = next(self.records, b'')
+    size = min(len(buffer), len(self.pending))
+    buffer[:size] = self.pending[:size]
+    self.pending = self.pending[size:]
+    return size
+
+  def close(self):
+    if not self.closed:
+      self.raw.close()
+    super(_RowsFile, self).close()
+
+
+def _OpenRows(path, offsets):
+  """Returns a text file of a CSV file's header and its rows at `offsets`.
+
+  The file must be uncompressed. It is decoded as UTF-8, with its line endings
+  left unchanged as `csv` expects.
+  """
+  return io.TextIOWrapper(io.BufferedReader(_RowsFile(path, offsets)),
+                          encoding='utf-8', newline='')
+
+
+def _OpenLocalFile(path):
+  """Returns a text file of the local file at path, decompressing it."""
+  return _OpenText(Path(path).open('rb'), str(path))
+
+
+class LocalFileGetter(object):
+  """Gets a dataset and its CSV files from local paths.
+
+  Besides `Fetch`, the rows of an uncompressed CSV file with given values in
+  some columns can be read without parsing the whole file, through the opener
+  returned by `RowsOpener`. The expanders read files this way when filtering
+  rows by code value.
+  """
+  def __init__(self, path, *, store='default'):
     self.base = urlparse(path).path
-    with Path(self.base).open() as f:
-      self.graph = _ProcessDspl2File(path, f)
+    self.row_indexes = {}
+    with _OpenLocalFile(self.base) as f:
+      self.graph = _ProcessDspl2File(path, f, store=store)
 
-  def Fetch(self, filename):
+  def _Path(self, filename):
     filename = urlparse(filename).path
-    path = Path(self.base).parent.joinpath(Path(filename)).resolve()
-    return path.open()
+    return Path(self.base).parent.joinpath(Path(filename)).resolve()
+
+  def Fetch(self, filename):
+    return _OpenLocalFile(self._Path(filename))
+
+  def IndexRows(self, filename, columns, *, persist=True):
+    """Returns the byte offsets of a CSV file's rows by their key values.
+
+    The result maps tuples of the values of `columns` to the offsets of the
+    rows that have them, in file order. The index is built by reading the file
+    once, and kept for the getter's lifetime. If `persist` is true it is also
+    saved under `_CachePath`, never next to the file, and reused while the
+    file's size and modification time are unchanged.
+    """
+    path = self._Path(filename)
+    stat = path.stat()
+    key = [_RowIndexVersion, stat.st_size, stat.st_mtime_ns]
+    columns_key = json.dumps(list(columns))
+    cache_key = (path, columns_key)
+    if cache_key in self.row_indexes and self.row_indexes[cache_key][0] == key:
+      return self.row_indexes[cache_key][1]
+    index_path = (_CachePath / 'indexes' /
+                  (hashlib.sha256(str(path).encode('utf-8')).hexdigest() +
+                   '.json'))
+    saved = {'key': key, 'indexes': {}}
+    if persist:
+      try:
+        with index_path.open() as f:
+          loaded = json.load(f)
+        if loaded['key'] == key:
+          saved = loaded
+      except (OSError, ValueError, KeyError):
+        pass
+    if columns_key not in saved['indexes']:
+      with _OpenMappedFile(path) as raw:
+        saved['indexes'][columns_key] = _BuildRowIndex(raw, columns)
+      if persist:
+        try:
+          index_path.parent.mkdir(parents=True, exist_ok=True)
+          tmp_path = index_path.with_name(
+              f'{index_path.name}.{os.getpid()}.tmp')
+          with tmp_path.open('w') as f:
+            json.dump(saved, f)
+          tmp_path.replace(index_path)
+        except OSError:
+          pass
+    index = saved['indexes'][columns_key]
+    ret = {tuple(json.loads(values)): offsets
+           for values, offsets in index['rows'].items()}
+    self.row_indexes[cache_key] = (key, ret)
+    return ret
+
+  def RowsOpener(self, filename, filters, *, persist=True):
+    """Returns an opener of a CSV file's rows that match `filters`.
+
+    `filters` maps columns to the values of the rows to keep. The rows are
+    found with an index of each column from `IndexRows`, and the opener
+    returns a text file of the header and those rows, in file order, read
+    from a memory map of the file. The opener can be passed to worker
+    processes. A RuntimeError is raised if the file is compressed or is
+    missing one of the columns.
+    """
+    path = self._Path(filename)
+    if not filters:
+      return functools.partial(_OpenLocalFile, path)
+    offsets = None
+    for column, values in filters.items():
+      index = self.IndexRows(filename, [column], persist=persist)
+      matches = set(itertools.chain.from_iterable(
+          index.get((value,), ()) for value in values))
+      offsets = matches if offsets is None else offsets & matches
+    return functools.partial(_OpenRows, path, sorted(offsets))
 
 
 class HybridFileGetter(object):
-  @staticmethod
-  def _load_file(base, rel=None):
+  """Gets a dataset and its CSV files from local paths or over HTTP.
+
+  Remote files are requested through `session` and cached in `cache`, as for
+  InternetFileGetter.
+  """
+  def _load_file(self, base, rel=None):
     uri = urlparse(base)
     if rel:
       uri = urlparse(urljoin(base, rel))
     if not uri.scheme or uri.scheme == 'file':
-      return Path(uri.path).open()
+      return _OpenLocalFile(uri.path)
     elif uri.scheme == 'http' or uri.scheme == 'https':
-      r = requests.get(uri)
-      r.raise_for_status()
-      return StringIO(r.text)
+      return _OpenUrl(self.session, uri.geturl(), self.timeout, self.cache)[0]
 
-  def __init__(self, json_uri):
+  def __init__(self, json_uri, *, store='default', session=None,
+               pool_size=_PoolSize, timeout=_Timeout, cache=None):
     self.base = json_uri
+    self.prefetched = {}
+    self.session = session or _MakeSession(pool_size)
+    self.timeout = timeout
+    self.cache = cache
     self.graph = _ProcessDspl2File(
         json_uri,
-        HybridFileGetter._load_file(json_uri))
+        self._load_file(json_uri),
+        store=store)
+
+  def Prefetch(self, *, max_workers=_PrefetchWorkers):
+    """Concurrently downloads the remote CSV files referenced by the dataset.
+
+    The files are downloaded as by `InternetFileGetter.Prefetch`. Local files
+    are not prefetched.
+    """
+    urls = {urljoin(self.base, file)
+            for file in _GetReferencedFiles(self.graph)}
+    self.prefetched.update(_DownloadUrls(
+        self.session,
+        {url for url in urls if urlparse(url).scheme in ('http', 'https')},
+        max_workers, self.timeout, self.cache))
 
   def Fetch(self, uri):
-    return HybridFileGetter._load_file(self.base, uri)
+    url = urljoin(self.base, uri)
+    if url in self.prefetched:
+      fileobj, encoding = self.prefetched.pop(url)
+      return _OpenBody(fileobj, url, encoding)
+    return self._load_file(self.base, uri)
+
+
+class ZipFileGetter(object):
+  """Gets a dataset and its CSV files from a zip archive, without extracting it.
+
+  `file` is the path of the archive, its contents as bytes, or a seekable
+  binary file of it. The archive must hold exactly one DSPL 2 document, and
+  the files it references are read from the archive relative to it. Member
+  files are decompressed as they are read.
+
+  IDs in the graph are file URLs under the archive's path, or under
+  `/<name>` if the archive is not a file on disk.
+
+  The archive is closed by `Close`, or on leaving a `with` block.
+  """
+  def __init__(self, file, *, name='dataset.zip', store='default'):
+    if isinstance(file, (str, os.PathLike)):
+      self.root = PurePosixPath(Path(file).resolve().as_posix())
+    else:
+      self.root = PurePosixPath('/', name)
+      if isinstance(file, (bytes, bytearray, memoryview)):
+        file = BytesIO(file)
+    self.graph = None
+    self.zip = zipfile.ZipFile(file)
+    try:
+      self._Load(store)
+    except Exception:
+      self.Close()
+      raise
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.Close()
+
+  def Close(self):
+    """Closes the archive, and the file it was opened from if it opened it."""
+    self.zip.close()
+
+  def _Load(self, store):
+    json_files = set()
+    for info in self.zip.infolist():
+      if info.is_dir() or info.filename.startswith('__MACOSX/'):
+        continue
+      with self._OpenMember(info.filename) as f:
+        data = _ProcessDspl2File(str(self.root / info.filename), f,
+                                 store=store)
+      if data:
+        json_files.add(info.filename)
+        self.base = str(self.root / info.filename)
+        self.graph = data
+    if not self.graph:
+      raise RuntimeError("DSPL 2 file not present in {}".format(
+          self.zip.namelist()))
+    if len(json_files) > 1:
+      raise RuntimeError("Multiple DSPL 2 files present: {}".format(json_files))
+
+  def _OpenMember(self, member):
+    return _OpenText(self.zip.open(member), member, encoding='utf-8')
+
+  def Fetch(self, filename):
+    path = PurePosixPath(unquote(urlparse(
+        urljoin(Path(self.base).as_uri(), filename)).path))
+    try:
+      return self._OpenMember(str(path.relative_to(self.root)))
+    except (KeyError, ValueError):
+      raise IOError(None, 'File not found', filename)
@@ -0,0 +1,172 @@
+# Copyright 2018 Google LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+import contextlib
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+import time
+try:
+  import fcntl
+except ImportError:
+  # Not available on Windows, where the cache is only shared by threads.
+  fcntl = None
+
+
+# Default bound on the total size of the cached bodies, in bytes.
+_MaxSize = 1 << 30
+# Size of the chunks in which bodies are written to disk.
+_ChunkSize = 1 << 16
+
+
+class HttpCache(object):
+  """On-disk cache of the HTTP responses fetched by the file getters.
+
+  The cache directory holds a manifest mapping each URL to its response's
+  validators, content type and access times, plus the body of each response.
+  Cached responses are revalidated with a conditional GET on each use, unless
+  they were fetched less than `ttl` seconds ago, in which case they are used
+  without contacting the server. When the bodies exceed `max_size` bytes, the
+  least recently used ones are evicted.
+
+  The cache can be shared by the getters' concurrent downloads, and by other
+  processes using the same directory. The manifest is changed under a lock
+  file, after merging in the changes other processes saved, and is saved
+  after every download or revalidation. The access times of responses used
+  within their `ttl` are only saved with the next change, or by `Save`.
+  """
+  def __init__(self, path, *, max_size=_MaxSize, ttl=None):
+    self.path = Path(path)
+    self.path.mkdir(parents=True, exist_ok=True)
+    self.max_size = max_size
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    # Access times of responses that are not saved yet, by URL.
+    self.used = {}
+    self.manifest = self._Load()
+
+  def _Load(self):
+    try:
+      with (self.path / 'manifest.json').open() as f:
+        return json.load(f)
+    except FileNotFoundError:
+      return {}
+
+  @contextlib.contextmanager
+  def _Locked(self):
+    """Returns a context manager holding the cache's locks.
+
+    The manifest is reloaded once they are acquired, with the unsaved access
+    times merged into it, and saved when the `with` block exits.
+    """
+    with self.lock, (self.path / 'manifest.lock').open('a') as lock_file:
+      if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+      self.manifest = self._Load()
+      for url, used in self.used.items():
+        if url in self.manifest:
+          self.manifest[url]['used'] = max(self.manifest[url]['used'], used)
+      self.used = {}
+      yield
+      tmp_path = self.path / f'manifest.json.{os.getpid()}.tmp'
+      with tmp_path.open('w') as f:
+        json.dump(self.manifest, f, indent=2, sort_keys=True)
+      tmp_path.replace(self.path / 'manifest.json')
+
+  @staticmethod
+  def _Filename(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+  def _Fetch(self, session, url, timeout, entry):
+    """Fetches url, and returns its new manifest entry.
+
+    If `entry` is still valid, it is returned with an updated fetch time.
+    """
+    headers = {}
+    if entry and entry.get('etag'):
+      headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+      headers['If-Modified-Since'] = entry['last_modified']
+    with session.get(url, headers=headers, timeout=timeout,
+                     stream=True) as r:
+      if entry and r.status_code == 304:
+        return dict(entry, fetched=time.time())
+      r.raise_for_status()
+      filename = HttpCache._Filename(url)
+      tmp_path = self.path / (
+          f'{filename}.{os.getpid()}.{threading.get_ident()}.tmp')
+      size = 0
+      with tmp_path.open('wb') as f:
+        for chunk in r.iter_content(_ChunkSize):
+          f.write(chunk)
+          size += len(chunk)
+      tmp_path.replace(self.path / filename)
+      return {
+          'file': filename,
+          'etag': r.headers.get('etag'),
+          'last_modified': r.headers.get('last-modified'),
+          'content_type': r.headers.get('content-type', ''),
+          'encoding': r.encoding or 'utf-8',
+          'size': size,
+          'fetched': time.time(),
+      }
+
+  def Open(self, session, url, timeout=None):
+    """Returns a binary file of the body of url, its content type and charset.
+
+    The body is requested through `session` if it is not cached, or may have
+    changed. Errors are raised as `requests` exceptions.
+    """
+    with self.lock:
+      entry = self.manifest.get(url)
+    if (entry and self.ttl is not None and
+        time.time() - entry['fetched'] < self.ttl):
+      try:
+        fileobj = open(self.path / entry['file'], 'rb')
+      except FileNotFoundError:
+        # Evicted, e.g. by another process.
+        entry = None
+      else:
+        with self.lock:
+          self.used[url] = time.time()
+        return fileobj, entry['content_type'], entry['encoding']
+    while True:
+      if entry and not (self.path / entry['file']).exists():
+        entry = None
+      entry = self._Fetch(session, url, timeout, entry)
+      entry['used'] = time.time()
+      with self._Locked():
+        self.manifest[url] = entry
+        self._Evict(url)
+        try:
+          # Opened under the locks, so that a concurrent eviction cannot
+          # remove the body first.
+          return (open(self.path / entry['file'], 'rb'),
+                  entry['content_type'], entry['encoding'])
+        except FileNotFoundError:
+          # Removed since it was fetched or validated, so it is fetched again.
+          del self.manifest[url]
+          entry = None
+
+  def _Evict(self, keep_url):
+    """Evicts least recently used bodies other than keep_url's to fit."""
+    size = sum(entry['size'] for entry in self.manifest.values())
+    for url, entry in sorted(self.manifest.items(),
+                             key=lambda item: item[1]['used']):
+      if size <= self.max_size:
+        break
+      if url == keep_url:
+        continue
+      del self.manifest[url]
+      (self.path / entry['file']).unlink(missing_ok=True)
+      size -= entry['size']
+
+  def Save(self):
+    """Writes the manifest, with the access times not saved yet."""
+    with self._Locked():
+      pass
@@ -4,6 +4,9 @@
 # license that can be found in the LICENSE file or at
 # https://developers.google.com/open-source/licenses/bsd
 
+from collections.abc import Iterator
+import json
+
 
 def AsList(val):
   """Ensures the JSON-LD object is a list."""
@@ -71,3 +74,153 @@ def GetUrl(obj):
     return obj
   elif isinstance(obj, dict):
     return GetSchemaId(obj)
+
+
+def CompactObservations(observations):
+  """Returns a slice's observations in compact, columnar form.
+
+  The compact form holds the slice ID and each dimension and measure ID once,
+  with arrays of the values of every observation in place of single values:
+
+    {
+      "slice": "#slice",
+      "dimensionValue": [
+        {"dimension": "#dim", "codeValue": ["AA", "BB"]},
+        {"dimension": "#year", "value": {"type": "Date",
+                                         "values": ["2019", "2019"]}}
+      ],
+      "measureValue": [
+        {"measure": "#measure", "value": ["1.5", "2"],
+         "footnote": [["#footnote=p"], null]}
+      ]
+    }
+
+  Typed values are held as their type and an array of their lexical forms.
+
+  The compact form is plain JSON, not JSON-LD: its arrays stand for one value
+  per observation rather than for sets of values, so it must not be framed or
+  loaded into a graph. `ExpandCompactObservations` turns it back into the
+  observations.
+
+  `observations` is an iterable of observations as expanded by
+  `Dspl2JsonLdExpander`, all with the same dimensions and measures. It is
+  iterated once, so it can be a generator.
+  """
+  ret = {'dimensionValue': [], 'measureValue': []}
+  count = 0
+  for observation in observations:
+    if count == 0:
+      ret['slice'] = observation['slice']
+      for dim_val in observation['dimensionValue']:
+        compact_val = {'dimension': dim_val['dimension']}
+        for key in ('codeValue', 'value'):
+          if isinstance(dim_val.get(key), dict):
+            compact_val[key] = {'type': dim_val[key]['@type'], 'values': []}
+          elif key in dim_val:
+            compact_val[key] = []
+        ret['dimensionValue'].append(compact_val)
+      for meas_val in observation['measureValue']:
+        ret['measureValue'].append({'measure': meas_val['measure'],
+                                    'value': []})
+    for dim_val, compact_val in zip(observation['dimensionValue'],
+                                    ret['dimensionValue']):
+      for key in ('codeValue', 'value'):
+        if isinstance(compact_val.get(key), dict):
+          compact_val[key]['values'].append(dim_val[key]['@value'])
+        elif key in compact_val:
+          compact_val[key].append(dim_val[key])
+    for meas_val, compact_val in zip(observation['measureValue'],
+                                     ret['measureValue']):
+      compact_val['value'].append(meas_val['value'])
+      if 'footnote' in meas_val and 'footnote' not in compact_val:
+        compact_val['footnote'] = [None] * count
+      if 'footnote' in compact_val:
+        compact_val['footnote'].append(meas_val.get('footnote'))
+    count += 1
+  return ret
+
+
+def ExpandCompactObservations(compact):
+  """Returns the observations in the output of `CompactObservations`."""
+  count = 0
+  for compact_val in compact['dimensionValue'] + compact['measureValue']:
+    for key in ('codeValue', 'value'):
+      if isinstance(compact_val.get(key), dict):
+        count = len(compact_val[key]['values'])
+      elif key in compact_val:
+        count = len(compact_val[key])
+  observations = []
+  for i in range(count):
+    observation = {
+        '@type': 'Observation',
+        'slice': compact['slice'],
+        'dimensionValue': [],
+        'measureValue': [],
+    }
+    for compact_val in compact['dimensionValue']:
+      dim_val = {
+          '@type': 'DimensionValue',
+          'dimension': compact_val['dimension'],
+      }
+      for key in ('codeValue', 'value'):
+        if isinstance(compact_val.get(key), dict):
+          dim_val[key] = {'@type': compact_val[key]['type'],
+                          '@value': compact_val[key]['values'][i]}
+        elif key in compact_val:
+          dim_val[key] = compact_val[key][i]
+      observation['dimensionValue'].append(dim_val)
+    for compact_val in compact['measureValue']:
+      meas_val = {
+          '@type': 'MeasureValue',
+          'measure': compact_val['measure'],
+          'value': compact_val['value'][i],
+      }
+      if compact_val.get('footnote') and compact_val['footnote'][i] is not None:
+        meas_val['footnote'] = compact_val['footnote'][i]
+      observation['measureValue'].append(meas_val)
+    observations.append(observation)
+  return observations
+
+
+def _HasIterator(val):
+  if isinstance(val, dict):
+    return any(_HasIterator(item) for item in val.values())
+  elif isinstance(val, list):
+    return any(_HasIterator(item) for item in val)
+  return isinstance(val, Iterator)
+
+
+def _WriteJson(val, fileobj, indent, newline):
+  if isinstance(val, Iterator) or (isinstance(val, (dict, list)) and
+                                   _HasIterator(val)):
+    if isinstance(val, dict):
+      start, end = '{', '}'
+      items = ((json.dumps(key) + ': ', item) for key, item in val.items())
+    else:
+      start, end = '[', ']'
+      items = (('', item) for item in val)
+    inner = newline + indent if indent is not None else ''
+    separator = ',' if indent is not None else ', '
+    fileobj.write(start)
+    empty = True
+    for prefix, item in items:
+      fileobj.write(('' if empty else separator) + inner + prefix)
+      _WriteJson(item, fileobj, indent, inner)
+      empty = False
+    if not empty and indent is not None:
+      fileobj.write(newline)
+    fileobj.write(end)
+  else:
+    fileobj.write(json.dumps(val, indent=indent).replace('\n', newline))
+
+
+def WriteJson(val, fileobj, *, indent=None):
+  """Writes `val` to `fileobj` as JSON, the same way as `json.dump`.
+
+  Iterators in `val` (e.g. the slice data generators of
+  `Dspl2JsonLdExpander.Expand(lazySlices=True)`) are written as arrays while
+  they are iterated, so that their items need not all be held in memory.
+  """
+  if isinstance(indent, int):
+    indent = ' ' * indent
+  _WriteJson(val, fileobj, indent, '\n')
@@ -4,11 +4,22 @@
 # license that can be found in the LICENSE file or at
 # https://developers.google.com/open-source/licenses/bsd
 
+from collections import defaultdict
+from functools import lru_cache
+import hashlib
 import json
+import os
 from pathlib import Path
+import pickle
 from pyld import jsonld
-from rdflib import Graph, Namespace
+from rdflib import BNode, Graph, Literal, Namespace, RDF, URIRef, Variable, XSD
+from rdflib.plugins.shared.jsonld.context import (Context as JsonLdContext,
+                                                  NODE_KEYS)
+from rdflib.plugins.shared.jsonld.util import norm_url, VOCAB_DELIMS
+from rdflib.plugins.sparql import prepareQuery
 from rdflib.serializer import Serializer
+from rdflib.term import Identifier
+import re
 import sys
 
 from dspl2.jsonutil import AsList
@@ -17,8 +28,8 @@ from dspl2.jsonutil import AsList
 SCHEMA = Namespace('http://schema.org/')
 
 
-_Schema = {}
 _Context = {}
+_Terms = None
 _DataFileFrame = {
     '@context': [_Context, {'schema': 'http://schema.org/'}],
     '@type': 'StatisticalDataset',
@@ -57,38 +68,333 @@ _FullFrame = {
 }
 _Initialized = False
 _Module_path = Path(__file__).parent
+# Directory holding parsed copies of the schema files, which load faster than
+# the JSON.
+_CachePath = Path(os.environ.get('XDG_CACHE_HOME',
+                                 Path.home() / '.cache')) / 'dspl2'
 _RdfPrefixes = {
     'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
     'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
     'schema': 'http://schema.org/',
 }
+# URLs of the schema.org context, which is served from the bundled copy.
+_SchemaContextUrls = frozenset(
+    url + suffix
+    for url in ('http://schema.org', 'https://schema.org')
+    for suffix in ('', '/', '/docs/jsonldcontext.json',
+                   '/docs/jsonldcontext.jsonld'))
+# Patterns for the constraint fields that SelectFromGraph matches itself.
+_VariableName = re.compile(r'\w+')
+_BracketedIri = re.compile(r'<[^<>"{}|^`\\\s]*>')
+_LocalName = re.compile(r'\w(?:[\w.-]*\w)?')
+# Number of prepared SPARQL queries kept, by constraints and graph namespaces.
+_PreparedQueriesSize = 256
 
 
-def _Init(context, schema):
-  global _Context, _Schema, _Initialized
+def _LoadCachedJson(path):
+  """Returns the parsed contents of JSON file `path`.
+
+  The parsed contents are pickled in `_CachePath` on first use, and read from
+  there while the file's size and modification time are unchanged.
+  """
+  stat = path.stat()
+  key = (stat.st_size, stat.st_mtime_ns)
+  cache_path = _CachePath / (path.name + '.pickle')
+  try:
+    with cache_path.open('rb') as f:
+      cached_key, val = pickle.load(f)
+    if cached_key == key:
+      return val
+  except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+    pass
+  with path.open() as f:
+    val = json.load(f)
+  try:
+    _CachePath.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+    with tmp_path.open('wb') as f:
+      pickle.dump((key, val), f, pickle.HIGHEST_PROTOCOL)
+    tmp_path.replace(cache_path)
+  except OSError:
+    pass
+  return val
+
+
+def _Init():
+  global _Initialized
   if not _Initialized:
-    with schema.open() as schema:
-      _Schema.update(json.load(schema))
-    with context.open() as context:
-      _Context.update(json.load(context))
-    del _Context['@context']['id']
-    del _Context['@context']['type']
+    _Context.update(_LoadCachedJson(
+        _Module_path / 'schema' / 'jsonldcontext.json')['@context'])
+    del _Context['id']
+    del _Context['type']
     _Initialized = True
 
 
-def _LoadJsonLd(json_val, public_id):
-  _Init(_Module_path / 'schema' / 'jsonldcontext.json',
-        _Module_path / 'schema' / 'schema.jsonld')
+def _RemoteDocument(url, document, context_url=None):
+  return {
+      'contentType': 'application/ld+json',
+      'contextUrl': context_url,
+      'documentUrl': url,
+      'document': document,
+  }
+
+
+def _DocumentLoader(url, options=None):
+  """pyld document loader that avoids the network where it can.
+
+  The schema.org context is served from the bundled `schema` directory, as
+  loaded by _Init. Other documents are fetched by pyld's default loader once,
+  and then read from `_CachePath`.
+  """
+  if url in _SchemaContextUrls:
+    _Init()
+    return _RemoteDocument(url, {'@context': _Context})
+  cache_path = (_CachePath / 'contexts' /
+                (hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json'))
+  try:
+    with cache_path.open() as f:
+      cached = json.load(f)
+    return _RemoteDocument(cached['documentUrl'], cached['document'],
+                           cached['contextUrl'])
+  except (OSError, ValueError, KeyError):
+    pass
+  remote = jsonld.get_document_loader()(url, options or {})
+  document = remote['document']
+  if isinstance(document, str):
+    document = json.loads(document)
+  ret = _RemoteDocument(remote['documentUrl'], document, remote['contextUrl'])
+  try:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+    with tmp_path.open('w') as f:
+      json.dump(ret, f)
+    tmp_path.replace(cache_path)
+  except OSError:
+    pass
+  return ret
+
+
+class _UnsupportedJsonLd(Exception):
+  """Raised for JSON-LD that _JsonLdLoader leaves to rdflib's parser."""
+
+
+class _JsonLdTerms(object):
+  """The terms of the schema.org context, processed once for loading."""
+  def __init__(self, context):
+    processed = JsonLdContext(context)
+    self.vocab = processed.vocab
+    self.language = processed.language
+    self.ids = {}
+    # Maps each term to its predicate and type coercion, or to None if the
+    # term uses features that are left to rdflib.
+    self.terms = {}
+    self.prefixes = {}
+    self.namespaces = [(None, self.vocab)] if self.vocab else []
+    for name, term in processed.terms.items():
+      self.ids[name] = term.id
+      if term.id and term.id.endswith(VOCAB_DELIMS):
+        self.namespaces.append((name, term.id))
+      if term.prefix and term.id:
+        self.prefixes[name] = term.id
+      if (not term.id or term.id.startswith('@') or term.container or
+          term.reverse or term.context or term.language or
+          term.type == '@json'):
+        self.terms[name] = None
+      else:
+        self.terms[name] = (URIRef(term.id), term.type or None)
+
+
+class _JsonLdLoader(object):
+  """Converts parsed JSON-LD into the triples rdflib's parser would produce.
+
+  The documents are expected to use the schema.org context. Other contexts,
+  lists, reverse properties and named graphs raise _UnsupportedJsonLd.
+  """
+  def __init__(self, terms, base):
+    self.terms = terms
+    self.base = base
+    self.triples = []
+    self.resolved = {}
+    self.nodes = {}
+    self.predicates = {}
+
+  def Load(self, json_val):
+    """Returns the triples for a JSON-LD document, in rdflib's order."""
+    self._AddNode(json_val, top=True)
+    return self.triples
+
+  def _Expand(self, value, use_vocab=True):
+    if (len(value) > 1 and value[0] == '@' and value[1].isalnum() and
+        value not in NODE_KEYS):
+      return ''
+    if use_vocab and value in self.terms.ids:
+      return self.terms.ids[value]
+    prefix, colon, local = value.partition(':')
+    if colon and not local.startswith('//'):
+      if prefix == '_':
+        return value
+      if prefix in self.terms.prefixes:
+        return self.terms.prefixes[prefix] + local
+    elif not colon and use_vocab:
+      return self.terms.vocab + value if self.terms.vocab else None
+    return norm_url(self.base, value)
+
+  def _Resolve(self, value):
+    if value not in self.resolved:
+      iri = self._Expand(value, False)
+      if not iri.startswith('_:'):
+        iri = '' if ' ' in iri else norm_url(self.base, iri)
+      self.resolved[value] = iri
+    return self.resolved[value]
+
+  def _RdfId(self, value):
+    if value not in self.nodes:
+      if value.startswith('_:') and len(value) > 2:
+        self.nodes[value] = BNode(value[2:])
+      else:
+        iri = self._Resolve(value)
+        if ':' not in iri:
+          self.nodes[value] = None
+        elif not iri:
+          self.nodes[value] = BNode()
+        else:
+          self.nodes[value] = URIRef(iri)
+    return self.nodes[value]
+
+  def _Predicate(self, key):
+    if key not in self.predicates:
+      if key == '@type' or self.terms.ids.get(key) == '@type':
+        self.predicates[key] = (RDF.type, '@vocab')
+      elif key.startswith('@'):
+        raise _UnsupportedJsonLd(key)
+      elif key in self.terms.terms:
+        if self.terms.terms[key] is None:
+          raise _UnsupportedJsonLd(key)
+        self.predicates[key] = self.terms.terms[key]
+      else:
+        iri = self._Expand(key)
+        if not iri or iri.startswith('_:'):
+          self.predicates[key] = (None, None)
+        else:
+          self.predicates[key] = (URIRef(iri), None)
+    return self.predicates[key]
+
+  def _AddNode(self, node, top=False):
+    if '@context' in node and not top:
+      raise _UnsupportedJsonLd('@context')
+    id = node.get('@id')
+    if isinstance(id, str):
+      subject = self._RdfId(id)
+      if subject is None:
+        return None
+    else:
+      subject = BNode()
+    for key, val in node.items():
+      if key != '@context' and key != '@id':
+        self._AddValues(subject, key, val)
+    return subject
+
+  def _Flatten(self, vals):
+    for val in vals:
+      if isinstance(val, dict) and '@set' in val:
+        val = val['@set']
+      if isinstance(val, list):
+        yield from self._Flatten(val)
+      else:
+        yield val
+
+  def _AddValues(self, subject, key, vals):
+    predicate, coercion = self._Predicate(key)
+    vals = list(self._Flatten(vals if isinstance(vals, list) else [vals]))
+    if predicate is None:
+      return
+    for val in vals:
+      obj = self._Object(coercion, val)
+      if obj is not None:
+        self.triples.append((subject, predicate, obj))
+
+  def _Object(self, coercion, val):
+    if isinstance(val, dict):
+      if '@list' in val:
+        raise _UnsupportedJsonLd('@list')
+      lang = val.get('@language')
+      if lang or '@value' in val:
+        value = val.get('@value')
+        if value is None or lang and ' ' in lang:
+          return None
+        elif lang:
+          return Literal(value, lang=lang)
+        elif val.get('@type'):
+          if val['@type'] == '@json':
+            raise _UnsupportedJsonLd('@json')
+          return Literal(value, datatype=self._Expand(val['@type']))
+        return Literal(value)
+      return self._AddNode(val)
+    elif val is None:
+      return None
+    elif coercion == '@id' and isinstance(val, str):
+      return self._RdfId(self._Resolve(val))
+    elif coercion == '@vocab' and isinstance(val, str):
+      return self._RdfId(self._Expand(val) or norm_url(self.base, val))
+    elif coercion in ('@id', '@vocab'):
+      raise _UnsupportedJsonLd(coercion)
+    elif coercion:
+      return Literal(val, datatype=coercion)
+    elif isinstance(val, float):
+      return Literal(val, datatype=XSD.double)
+    return Literal(val, lang=self.terms.language)
+
+
+def _GetJsonLdTerms():
+  """Returns the processed terms of the context, processing them once."""
+  global _Terms
+  if _Terms is None:
+    _Terms = _JsonLdTerms(_Context)
+  return _Terms
+
+
+def _ParseJsonLd(json_val, public_id, store):
   json_val['@context'] = _Context
   graph = Graph().parse(
       data=json.dumps(json_val).encode('utf-8'),
       format='json-ld',
       publicID=public_id
   )
+  if store != 'default':
+    # The JSON-LD parser requires a context-aware store, so the (small)
+    # metadata graph is parsed in memory and then copied into `store`.
+    stored = Graph(store=store)
+    stored.addN((sub, pred, obj, stored) for sub, pred, obj in graph)
+    for prefix, namespace in graph.namespaces():
+      stored.bind(prefix, namespace)
+    return stored
   return graph
 
 
-def LoadGraph(input, public_id):
+def _LoadJsonLd(json_val, public_id, store):
+  _Init()
+  graph = Graph(store=store)
+  terms = _GetJsonLdTerms()
+  try:
+    triples = _JsonLdLoader(terms, graph.absolutize(public_id)).Load(json_val)
+  except _UnsupportedJsonLd:
+    return _ParseJsonLd(json_val, public_id, store)
+  for prefix, namespace in terms.namespaces:
+    graph.bind(prefix, namespace)
+  graph.addN((sub, pred, obj, graph) for sub, pred, obj in triples)
+  return graph
+
+
+def LoadGraph(input, public_id, *, store='default'):
+  """Loads DSPL 2 JSON-LD into a graph.
+
+  The document's context is replaced by the schema.org context, and its
+  triples are added to the graph directly. JSON-LD features outside what
+  that context needs, such as lists, are parsed by rdflib instead.
+
+  `store` is the rdflib store to load it into: a plugin name, or a store
+  instance such as a `dspl2.sqlitestore.SqliteStore` for a graph on disk.
+  """
   if isinstance(input, dict):
     data = input
   elif isinstance(input, str):
@@ -96,21 +402,319 @@ def LoadGraph(input, public_id):
   else:
     data = json.load(input)
 
-  return _LoadJsonLd(data, public_id)
+  return _LoadJsonLd(data, public_id, store)
 
 
-def FrameGraph(graph, frame=_FullFrame):
+# Term selection preferences for compacting properties and types, as
+# (inverse context map, preferred keys) pairs.
+_NodePrefs = ('@type', ('@id', '@vocab', '@none'))
+_NullPrefs = ('@type', ('@id', '@none'))
+_PlainPrefs = ('@language', ('@null', '@none'))
+_TypePrefs = ('@type', ('@id', '@none'))
+# Literals of these types are serialized as native JSON values.
+_NativeLiteralTypes = frozenset((XSD.boolean, XSD.double, XSD.integer,
+                                 XSD.string))
+_NativeFrames = {}
+
+
+def _LiteralPrefs(literal):
+  if literal.language:
+    return ('@language', (literal.language.lower(), '@none'))
+  elif literal.datatype:
+    return ('@type', (str(literal.datatype), '@none'))
+  return _PlainPrefs
+
+
+def _NodeKey(node):
+  if isinstance(node, BNode):
+    return '_:' + node
+  return str(node)
+
+
+class _Frame(object):
+  """A JSON-LD frame, with its properties expanded to IRIs."""
+  def __init__(self, embed, types=frozenset(), props=None):
+    self.embed = embed
+    self.types = types
+    self.props = props or {}
+    self.implicit = None
+
+  def Subframe(self, prop):
+    """Returns the frame for the values of `prop`."""
+    if prop in self.props:
+      return self.props[prop]
+    if self.implicit is None:
+      self.implicit = _Frame(self.embed)
+    return self.implicit
+
+
+class _Compactor(object):
+  """Compacts IRIs and values against a JSON-LD context as pyld does.
+
+  Only the parts of JSON-LD used by the schema.org context are supported:
+  term definitions with an @id and an optional @type, prefixes and @vocab.
+  """
+  def __init__(self, contexts):
+    self.definitions = {}
+    for context in contexts:
+      self.definitions.update(context)
+    self.vocab = self.definitions.get('@vocab')
+    self.iris = {}
+    self.terms = {}
+    for term, definition in self.definitions.items():
+      if (term.startswith('@') or definition is None or
+          isinstance(definition, str) and definition.startswith('@')):
+        continue
+      iri = self._TermIri(term)
+      if isinstance(definition, str):
+        type_ = None
+        prefix = ':' not in term and iri[-1:] in ':/?#[]@'
+      else:
+        type_ = definition.get('@type')
+        if type_ is not None:
+          type_ = self.ExpandIri(type_)
+        prefix = False
+      self.terms[term] = (iri, type_, prefix)
+    self.inverse = {}
+    for term in sorted(self.terms, key=lambda term: (len(term), term)):
+      iri, type_, _ = self.terms[term]
+      entry = self.inverse.setdefault(iri, {'@type': {}, '@language': {}})
+      if type_ is not None:
+        entry['@type'].setdefault(type_, term)
+      else:
+        entry['@type'].setdefault('@none', term)
+        entry['@language'].setdefault('@none', term)
+    self.prefixes = [(iri, term) for term, (iri, _, prefix)
+                     in self.terms.items() if prefix]
+    self.cache = {}
+
+  def _TermIri(self, term):
+    if term not in self.iris:
+      definition = self.definitions[term]
+      if isinstance(definition, dict):
+        definition = definition.get('@id', term)
+      self.iris[term] = self.ExpandIri(definition, term)
+    return self.iris[term]
+
+  def ExpandIri(self, value, term=None):
+    """Expands a term, compact IRI or vocabulary-relative IRI."""
+    if value.startswith('@'):
+      return value
+    if value != term and value in self.definitions:
+      return self._TermIri(value)
+    prefix, colon, suffix = value.partition(':')
+    if colon:
+      if prefix in self.definitions and not suffix.startswith('//'):
+        return self._TermIri(prefix) + suffix
+      return value
+    return self.vocab + value
+
+  def ParseFrame(self, frame):
+    """Returns the _Frame for a frame object."""
+    return _Frame(
+        frame.get('@embed', '@always'),
+        frozenset(self.ExpandIri(type_)
+                  for type_ in AsList(frame.get('@type'))),
+        {URIRef(self.ExpandIri(key)): self.ParseFrame(val)
+         for key, val in frame.items() if not key.startswith('@')})
+
+  def CompactIri(self, iri, prefs=None):
+    """Compacts an IRI, as a vocabulary term if `prefs` is provided."""
+    key = (iri, prefs)
+    if key in self.cache:
+      return self.cache[key]
+    ret = None
+    if prefs is not None:
+      selections = self.inverse.get(iri, {}).get(prefs[0], {})
+      for pref in prefs[1]:
+        if pref in selections:
+          ret = selections[pref]
+          break
+      if (ret is None and self.vocab and iri.startswith(self.vocab) and
+          iri[len(self.vocab):] not in self.terms):
+        ret = iri[len(self.vocab):] or None
+    if ret is None:
+      for prefix_iri, term in self.prefixes:
+        if iri.startswith(prefix_iri) and iri != prefix_iri:
+          curie = term + ':' + iri[len(prefix_iri):]
+          if curie not in self.terms and (
+              ret is None or (len(curie), curie) < (len(ret), ret)):
+            ret = curie
+    if ret is None:
+      ret = iri
+    self.cache[key] = ret
+    return ret
+
+  def TermType(self, key):
+    """Returns the type that term `key` coerces its values to."""
+    term = self.terms.get(key)
+    return term[1] if term else None
+
+  def CompactLiteral(self, key, literal):
+    """Compacts a literal that is a value of term `key`."""
+    if literal.datatype in _NativeLiteralTypes:
+      value = literal.toPython()
+      if isinstance(value, Literal):
+        value = str(literal)
+    else:
+      value = str(literal)
+    if literal.language:
+      return {'@language': literal.language.lower(), '@value': value}
+    elif literal.datatype:
+      datatype = str(literal.datatype)
+      if datatype == self.TermType(key):
+        return value
+      return {'@type': self.CompactIri(datatype, _TypePrefs), '@value': value}
+    return value
+
+
+class _Framer(object):
+  """Frames a graph by walking its indexes, matching pyld's output.
+
+  Nodes are embedded wherever they are referenced ('@embed': '@always'),
+  except where a frame says '@never' or the embedding would be circular.
+  """
+  def __init__(self, graph, compactor):
+    self.graph = graph
+    self.compactor = compactor
+    self.bnode_counts = defaultdict(int)
+    self.bnode_ids = {}
+
+  def Frame(self, frame):
+    """Returns the compacted top-level nodes that match `frame`."""
+    subjects = set()
+    for type_ in frame.types:
+      subjects.update(self.graph.subjects(RDF.type, URIRef(type_)))
+    framed = [self._FrameNode(subject, frame, [], False)
+              for subject in sorted(subjects, key=_NodeKey)]
+    return [self._CompactNode(node) for node in framed]
+
+  def _Matches(self, node, frame):
+    if frame.types:
+      return any((node, RDF.type, URIRef(type_)) in self.graph
+                 for type_ in frame.types)
+    return not frame.props or any(
+        (node, prop, None) in self.graph for prop in frame.props)
+
+  def _FrameNode(self, node, frame, stack, embedded):
+    output = {'@id': node}
+    if isinstance(node, BNode):
+      self.bnode_counts[node] += 1
+    if embedded and (frame.embed == '@never' or node in stack[:-1]):
+      return output
+    stack.append(node)
+    values = defaultdict(list)
+    for prop, obj in self.graph.predicate_objects(node):
+      if prop == RDF.type and isinstance(obj, URIRef):
+        output.setdefault('@type', []).append(str(obj))
+      else:
+        values[prop].append(obj)
+    for prop in sorted(values.keys() | frame.props.keys(), key=str):
+      subframe = frame.Subframe(prop)
+      framed = [
+          obj if isinstance(obj, Literal) else
+          self._FrameNode(obj, subframe, stack, True)
+          for obj in values.get(prop, ())
+          if isinstance(obj, Literal) or self._Matches(obj, subframe)
+      ]
+      if framed:
+        output[prop] = framed
+      elif prop in frame.props:
+        output[prop] = None
+    stack.pop()
+    return output
+
+  def _CompactId(self, node):
+    if isinstance(node, BNode):
+      return self.bnode_ids.setdefault(node, f'_:b{len(self.bnode_ids)}')
+    return self.compactor.CompactIri(str(node))
+
+  def _CompactNode(self, output):
+    compactor = self.compactor
+    ret = {}
+    node = output['@id']
+    # Blank node identifiers are only kept if the node is output twice.
+    if self.bnode_counts.get(node, 2) > 1:
+      ret['@id'] = self._CompactId(node)
+    if '@type' in output:
+      types = [compactor.CompactIri(type_, _TypePrefs)
+               for type_ in output['@type']]
+      ret['@type'] = types[0] if len(types) == 1 else types
+    for prop, values in output.items():
+      if prop.startswith('@'):
+        continue
+      if values is None:
+        ret[compactor.CompactIri(str(prop), _NullPrefs)] = None
+        continue
+      for value in values:
+        if isinstance(value, Literal):
+          key = compactor.CompactIri(str(prop), _LiteralPrefs(value))
+          value = compactor.CompactLiteral(key, value)
+        else:
+          key = compactor.CompactIri(str(prop), _NodePrefs)
+          value = self._CompactValue(key, value)
+        if key not in ret:
+          ret[key] = value
+        elif isinstance(ret[key], list):
+          ret[key].append(value)
+        else:
+          ret[key] = [ret[key], value]
+    return ret
+
+  def _CompactValue(self, key, output):
+    if len(output) > 1:
+      return self._CompactNode(output)
+    node = output['@id']
+    if self.bnode_counts[node] == 1:
+      return {}
+    type_ = self.compactor.TermType(key)
+    if type_ == '@id':
+      return self._CompactId(node)
+    elif type_ == '@vocab' and not isinstance(node, BNode):
+      return self.compactor.CompactIri(str(node), _TypePrefs)
+    return {'@id': self._CompactId(node)}
+
+
+def _GetNativeFrame(frame):
+  """Returns the compactor and _Frame for a frame, creating them once."""
+  if id(frame) not in _NativeFrames:
+    compactor = _Compactor(frame['@context'])
+    _NativeFrames[id(frame)] = (compactor, compactor.ParseFrame(frame))
+  return _NativeFrames[id(frame)]
+
+
+def _FrameGraphWithPyld(graph, frame):
   serialized = graph.serialize(format='json-ld')
   json_val = json.loads(serialized)
   json_val = {
       '@context': _Context,
       '@graph': AsList(json_val)
   }
-  framed = jsonld.frame(json_val, frame, {'embed': '@always'})
-  framed['@context'] = 'http://schema.org'
-  for items in framed['@graph']:
-    framed.update(items)
-  del framed['@graph']
+  framed = jsonld.frame(json_val, frame, {'embed': '@always',
+                                         'documentLoader': _DocumentLoader})
+  del framed['@context']
+  # Newer pyld versions omit @graph when a single node is framed.
+  return framed.get('@graph', [framed])
+
+
+def FrameGraph(graph, frame=_FullFrame):
+  """Frames the dataset in a graph as a JSON-LD object.
+
+  `_FullFrame` and `_DataFileFrame` are framed natively from the graph's
+  indexes. Other frames, and graphs with RDF lists, are framed with pyld,
+  which is much slower. Remote contexts in those frames are resolved by
+  `_DocumentLoader`, so the schema.org context is never fetched.
+  """
+  _Init()
+  if ((frame is _FullFrame or frame is _DataFileFrame) and
+      (None, RDF.first, None) not in graph):
+    compactor, native_frame = _GetNativeFrame(frame)
+    nodes = _Framer(graph, compactor).Frame(native_frame)
+  else:
+    nodes = _FrameGraphWithPyld(graph, frame)
+  framed = {'@context': 'http://schema.org'}
+  for node in nodes:
+    framed.update(node)
   return framed
 
 
@@ -135,16 +739,140 @@ def MakeSparqlSelectQuery(*constraints,
   return ret
 
 
+def _PatternTerm(field):
+  """Returns the term or variable that a constraint field denotes.
+
+  Only variables, 'a', IRIs in angle brackets and names with one of the
+  `_RdfPrefixes` are understood; None is returned for anything else.
+  """
+  if not isinstance(field, str) or isinstance(field, Identifier):
+    return None
+  if field == 'a':
+    return RDF.type
+  if field[:1] in ('?', '$') and _VariableName.fullmatch(field[1:]):
+    return Variable(field[1:])
+  if _BracketedIri.fullmatch(field):
+    return URIRef(field[1:-1])
+  prefix, colon, local = field.partition(':')
+  if colon and prefix in _RdfPrefixes and _LocalName.fullmatch(local):
+    return URIRef(_RdfPrefixes[prefix] + local)
+  return None
+
+
+def _MatchPatterns(graph, patterns, bindings):
+  """Yields the extensions of `bindings` that match all triple patterns."""
+  if not patterns:
+    yield bindings
+    return
+  # Match the pattern with the most known terms first.
+  index = max(range(len(patterns)), key=lambda i: sum(
+      not isinstance(term, Variable) or term in bindings
+      for term in patterns[i]))
+  pattern = patterns[index]
+  rest = patterns[:index] + patterns[index + 1:]
+  query = tuple(bindings.get(term) if isinstance(term, Variable) else term
+                for term in pattern)
+  for triple in graph.triples(query):
+    matched = dict(bindings)
+    if all(matched.setdefault(term, val) == val
+           for term, val in zip(pattern, triple)
+           if isinstance(term, Variable)):
+      yield from _MatchPatterns(graph, rest, matched)
+
+
+@lru_cache(maxsize=_PreparedQueriesSize)
+def _PrepareQuery(constraints, namespaces):
+  return prepareQuery(MakeSparqlSelectQuery(*constraints),
+                      initNs=dict(namespaces))
+
+
+def _PreparedQuery(graph, constraints):
+  """Returns the prepared SPARQL query for constraints.
+
+  The `_PreparedQueriesSize` most recently used queries are kept, so that
+  repeated queries are only prepared once.
+  """
+  constraints = tuple(tuple(_N3(field, graph.namespace_manager)
+                            for field in constraint)
+                      for constraint in constraints)
+  return _PrepareQuery(constraints, tuple(sorted(graph.namespaces())))
+
+
 def SelectFromGraph(graph, *constraints):
-  result = graph.query(
-      MakeSparqlSelectQuery(
-          *constraints,
-          ns_manager=graph.namespace_manager))
+  """Returns the variable bindings that satisfy all the triple constraints.
+
+  Constraints made of variables and IRIs are matched against the graph's
+  indexes directly. Others are run as SPARQL queries, which are prepared
+  once per set of constraints.
+  """
+  patterns = [tuple(_PatternTerm(field) for field in constraint)
+              for constraint in constraints]
+  if all(term is not None for pattern in patterns for term in pattern):
+    return [{str(k): str(v) for k, v in bindings.items()}
+            for bindings in _MatchPatterns(graph, patterns, {})]
+  result = graph.query(_PreparedQuery(graph, constraints))
   return list({str(k): str(v)
                for k, v in binding.items()}
               for binding in result.bindings)
 
 
+_NTriplesEscapes = str.maketrans({
+    '\\': '\\\\',
+    '"': '\\"',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+# Characters that are not allowed in N-Triples IRIs, which are percent-encoded.
+# Observation IDs built from CSV values may contain them, e.g. spaces.
+_NTriplesIriEscapes = str.maketrans({
+    char: '%{:02X}'.format(ord(char))
+    for char in [chr(i) for i in range(0x21)] + list('<>"{}|^`\\')
+})
+
+
+def _NTriplesTerm(term):
+  # Terms are converted to plain strs before concatenation, since adding to an
+  # rdflib term constructs a new term.
+  if isinstance(term, Literal):
+    ret = '"' + str(term).translate(_NTriplesEscapes) + '"'
+    if term.language:
+      ret += '@' + term.language
+    elif term.datatype:
+      ret += '^^<' + str(term.datatype).translate(_NTriplesIriEscapes) + '>'
+    return ret
+  elif isinstance(term, BNode):
+    return '_:' + str(term)
+  return '<' + str(term).translate(_NTriplesIriEscapes) + '>'
+
+
+class NTriplesWriter(object):
+  """Graph-like sink that writes triples to a file as soon as they are added.
+
+  Triples are written as N-Triples, or as N-Quads in the named graph
+  `graph_id` if one is provided. Nothing is retained in memory, so triples are
+  not deduplicated.
+  """
+  def __init__(self, fileobj, graph_id=None):
+    self.fileobj = fileobj
+    self.suffix = ' .\n'
+    if graph_id is not None:
+      self.suffix = ' ' + _NTriplesTerm(graph_id) + self.suffix
+
+  def add(self, triple):
+    self.fileobj.write(' '.join(_NTriplesTerm(term) for term in triple) +
+                       self.suffix)
+
+  def addN(self, quads):
+    """Adds (subject, predicate, object, context) quads; context is ignored."""
+    self.fileobj.write(''.join(
+        ' '.join(_NTriplesTerm(term) for term in quad[:3]) + self.suffix
+        for quad in quads))
+
+  def write(self, graph):
+    """Writes all the triples in an rdflib graph."""
+    self.addN(graph.triples((None, None, None)))
+
+
 def main(args, context, schema):
   with open(args[1]) as f:
     normalized = FrameGraph(LoadGraph(f, args[1]))
@@ -0,0 +1,143 @@
+# Copyright 2018 Google LLC
+#
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file or at
+# https://developers.google.com/open-source/licenses/bsd
+
+import json
+from rdflib import BNode, Literal, URIRef
+from rdflib.store import Store, VALID_STORE
+import sqlite3
+
+
+_Schema = '''
+CREATE TABLE IF NOT EXISTS triples (
+    s TEXT NOT NULL,
+    p TEXT NOT NULL,
+    o TEXT NOT NULL,
+    PRIMARY KEY (s, p, o)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+CREATE TABLE IF NOT EXISTS namespaces (
+    prefix TEXT PRIMARY KEY,
+    uri TEXT NOT NULL UNIQUE
+);
+'''
+_BatchSize = 1000
+
+
+def _EncodeTerm(term):
+  if isinstance(term, Literal):
+    return 'L' + json.dumps([str(term), term.datatype, term.language])
+  elif isinstance(term, BNode):
+    return 'B' + term
+  return 'U' + term
+
+
+def _DecodeTerm(text):
+  if text[0] == 'L':
+    value, datatype, language = json.loads(text[1:])
+    return Literal(value, datatype=datatype, lang=language)
+  elif text[0] == 'B':
+    return BNode(text[1:])
+  return URIRef(text[1:])
+
+
+class SqliteStore(Store):
+  """rdflib store that keeps the triples of one graph in an SQLite file.
+
+  This lets datasets larger than memory be loaded, expanded and queried, e.g.
+  with `LocalFileGetter(path, store=SqliteStore('dataset.db'))`. Changes are
+  committed by `commit()` and `close()`.
+  """
+  context_aware = False
+  formula_aware = False
+  transaction_aware = False
+  graph_aware = False
+
+  def __init__(self, configuration=None, identifier=None):
+    self.db = None
+    self.identifier = identifier
+    super(SqliteStore, self).__init__(configuration)
+
+  def open(self, configuration, create=True):
+    self.db = sqlite3.connect(configuration)
+    self.db.executescript(_Schema)
+    return VALID_STORE
+
+  def close(self, commit_pending_transaction=False):
+    self.db.commit()
+    self.db.close()
+    self.db = None
+
+  def commit(self):
+    self.db.commit()
+
+  def rollback(self):
+    self.db.rollback()
+
+  def add(self, triple, context, quoted=False):
+    self.db.execute('INSERT OR IGNORE INTO triples VALUES (?, ?, ?)',
+                    [_EncodeTerm(term) for term in triple])
+
+  def addN(self, quads):
+    self.db.executemany(
+        'INSERT OR IGNORE INTO triples VALUES (?, ?, ?)',
+        ((_EncodeTerm(s), _EncodeTerm(p), _EncodeTerm(o))
+         for s, p, o, _ in quads))
+
+  @staticmethod
+  def _Where(triple_pattern):
+    clauses = []
+    args = []
+    for column, term in zip('spo', triple_pattern):
+      if term is not None:
+        clauses.append(column + ' = ?')
+        args.append(_EncodeTerm(term))
+    if not clauses:
+      return '', args
+    return ' WHERE ' + ' AND '.join(clauses), args
+
+  def remove(self, triple_pattern, context=None):
+    where, args = SqliteStore._Where(triple_pattern)
+    self.db.execute('DELETE FROM triples' + where, args)
+
+  def triples(self, triple_pattern, context=None):
+    where, args = SqliteStore._Where(triple_pattern)
+    cursor = self.db.execute('SELECT s, p, o FROM triples' + where, args)
+    rows = cursor.fetchmany(_BatchSize)
+    while rows:
+      for row in rows:
+        yield tuple(_DecodeTerm(term) for term in row), iter(())
+      rows = cursor.fetchmany(_BatchSize)
+
+  def __len__(self, context=None):
+    return self.db.execute('SELECT COUNT(*) FROM triples').fetchone()[0]
+
+  def contexts(self, triple=None):
+    return iter(())
+
+  def bind(self, prefix, namespace, override=True):
+    if not override and (self.namespace(prefix) is not None or
+                         self.prefix(namespace) is not None):
+      return
+    self.db.execute('DELETE FROM namespaces WHERE prefix = ? OR uri = ?',
+                    (prefix, namespace))
+    self.db.execute('INSERT INTO namespaces VALUES (?, ?)',
+                    (prefix, namespace))
+
+  def namespace(self, prefix):
+    row = self.db.execute('SELECT uri FROM namespaces WHERE prefix = ?',
+                          (prefix,)).fetchone()
+    return URIRef(row[0]) if row else None
+
+  def prefix(self, namespace):
+    row = self.db.execute('SELECT prefix FROM namespaces WHERE uri = ?',
+                          (namespace,)).fetchone()
+    return row[0] if row else None
+
+  def namespaces(self):
+    for prefix, uri in self.db.execute(
+        'SELECT prefix, uri FROM namespaces').fetchall():
+      yield prefix, URIRef(uri)
@@ -1,8 +1,22 @@
-from dspl2.expander import Dspl2JsonLdExpander, Dspl2RdfExpander
-from dspl2.rdfutil import SCHEMA
+import dspl2.expander
+from dspl2.expander import (Dspl2JsonLdExpander, Dspl2RdfExpander,
+                            SliceFilter, _TermCache)
+from dspl2.expansioncache import ExpansionCache
+import dspl2.filegetter
+from dspl2.filegetter import LocalFileGetter
+from dspl2.jsonutil import CompactObservations
+from dspl2.rdfutil import FrameGraph, NTriplesWriter, SCHEMA
 from io import StringIO
+import json
+import os
+from pathlib import Path
 import rdflib
+import rdflib.compare
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 
 
 class DummyGetter(object):
@@ -17,6 +31,34 @@ class DummyGetter(object):
     return self.data.get(filename, StringIO(''))
 
 
+_SliceCsvId = rdflib.URIRef('http://foo.invalid/slice.csv')
+
+
+def _MakeSliceGraph():
+  graph = rdflib.Graph()
+  ds = rdflib.URIRef('http://foo.invalid/test.json')
+  dim = rdflib.URIRef('http://foo.invalid/test.json#dim')
+  year = rdflib.URIRef('http://foo.invalid/test.json#year')
+  measure = rdflib.URIRef('http://foo.invalid/test.json#measure')
+  slice_id = rdflib.URIRef('http://foo.invalid/test.json#slice')
+  graph.add((ds, rdflib.RDF.type, SCHEMA.StatisticalDataset))
+  graph.add((dim, rdflib.RDF.type, SCHEMA.CategoricalDimension))
+  graph.add((dim, SCHEMA.equivalentType, SCHEMA.Place))
+  graph.add((year, rdflib.RDF.type, SCHEMA.TimeDimension))
+  graph.add((measure, rdflib.RDF.type, SCHEMA.StatisticalMeasure))
+  graph.add((measure, SCHEMA.unitCode, rdflib.Literal('P1')))
+  graph.add((slice_id, rdflib.RDF.type, SCHEMA.DataSlice))
+  graph.add((slice_id, SCHEMA.dataset, ds))
+  graph.add((slice_id, SCHEMA.dimension, dim))
+  graph.add((slice_id, SCHEMA.dimension, year))
+  graph.add((slice_id, SCHEMA.measure, measure))
+  graph.add((slice_id, SCHEMA.data, _SliceCsvId))
+  return graph
+
+
+_SliceCsv = 'dim,year,measure,measure*\nAA,2019,1.5,\nBB,2019,2,\n'
+
+
 class ExpanderTests(unittest.TestCase):
   def test_Dspl2RdfExpander_ExpandDimensionValue(self):
     graph = rdflib.Graph()
@@ -76,16 +118,369 @@ class ExpanderTests(unittest.TestCase):
                      {rdflib.term.Literal('p')})
 
   def test_Dspl2RdfExpander_ExpandSliceData(self):
-    pass
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    slice_id = rdflib.URIRef('http://foo.invalid/test.json#slice')
+    Dspl2RdfExpander(getter)._ExpandSliceData(slice_id)
+    row_id = rdflib.URIRef(
+        'http://foo.invalid/test.json#slice/dim=AA/year=2019/measure/')
+    self.assertIn((slice_id, SCHEMA.data, row_id), graph)
+    self.assertEqual(set(graph.objects(subject=row_id,
+                                       predicate=rdflib.RDF.type)),
+                     {SCHEMA.Observation})
+    dim_values = {
+        graph.value(node_id, SCHEMA.dimension): node_id
+        for node_id in graph.objects(subject=row_id,
+                                     predicate=SCHEMA.dimensionValue)
+    }
+    dim = dim_values[rdflib.URIRef('http://foo.invalid/test.json#dim')]
+    self.assertEqual(set(graph.objects(subject=dim,
+                                       predicate=rdflib.RDF.type)),
+                     {SCHEMA.DimensionValue, SCHEMA.Place})
+    self.assertEqual(graph.value(dim, SCHEMA.codeValue),
+                     rdflib.Literal('AA'))
+    year = dim_values[rdflib.URIRef('http://foo.invalid/test.json#year')]
+    self.assertEqual(graph.value(year, SCHEMA.value),
+                     rdflib.Literal('2019'))
+    measure = graph.value(row_id, SCHEMA.measureValue)
+    self.assertEqual(graph.value(measure, SCHEMA.value),
+                     rdflib.Literal('1.5'))
+    self.assertEqual(graph.value(measure, SCHEMA.unitCode),
+                     rdflib.Literal('P1'))
+
+  def test_Dspl2RdfExpander_ExpandSliceDataFramed(self):
+    graph = _MakeSliceGraph()
+    graph.add((rdflib.URIRef('http://foo.invalid/test.json'), SCHEMA.slice,
+               rdflib.URIRef('http://foo.invalid/test.json#slice')))
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    framed = FrameGraph(Dspl2RdfExpander(getter).Expand())
+    observations = framed['slice']['data']
+    self.assertEqual(len(observations), 2)
+    for observation in observations:
+      self.assertEqual(observation['measureValue']['measure'],
+                       'http://foo.invalid/test.json#measure')
+      self.assertIn(observation['measureValue']['value'], ('1.5', '2'))
+
+  def test_Dspl2RdfExpander_ExpandStream(self):
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    out = StringIO()
+    Dspl2RdfExpander(getter).Expand(stream=NTriplesWriter(out))
+    observations = set(
+        graph.subjects(predicate=rdflib.RDF.type, object=SCHEMA.Observation))
+    self.assertEqual(observations, set())
+    streamed = rdflib.Graph().parse(data=out.getvalue(), format='nt')
+    observations = set(
+        streamed.subjects(predicate=rdflib.RDF.type, object=SCHEMA.Observation))
+    self.assertEqual(len(observations), 2)
+    self.assertIn((None, SCHEMA.value, rdflib.Literal('1.5')), streamed)
+    self.assertIn((None, rdflib.RDF.type, SCHEMA.DataSlice), streamed)
+
+    expected = _MakeSliceGraph()
+    getter = DummyGetter(expected)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    Dspl2RdfExpander(getter).Expand()
+    self.assertTrue(rdflib.compare.isomorphic(streamed, expected))
+
+  def test_Dspl2RdfExpander_ExpandSliceDataFootnotes(self):
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId,
+               'dim,year,measure,measure*\nAA,2019,1,p;q\nBB,2019,2,\n')
+    Dspl2RdfExpander(getter).Expand()
+    footnotes = set(graph.objects(predicate=SCHEMA.footnote))
+    self.assertEqual(footnotes, {
+        rdflib.URIRef('http://foo.invalid/test.json#footnote=p'),
+        rdflib.URIRef('http://foo.invalid/test.json#footnote=q'),
+    })
+    self.assertEqual(
+        len(set(graph.subjects(predicate=SCHEMA.footnote))), 1)
+
+  def test_Dspl2RdfExpander_ExpandSliceDataFootnotesLiteralDataset(self):
+    graph = _MakeSliceGraph()
+    ds = rdflib.URIRef('http://foo.invalid/test.json')
+    slice_id = rdflib.URIRef('http://foo.invalid/test.json#slice')
+    graph.remove((slice_id, SCHEMA.dataset, ds))
+    graph.add((slice_id, SCHEMA.dataset, rdflib.Literal('')))
+    graph.add((ds, SCHEMA.slice, slice_id))
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, 'dim,year,measure,measure*\nAA,2019,1,p\n')
+    Dspl2RdfExpander(getter).Expand()
+    self.assertEqual(set(graph.objects(predicate=SCHEMA.footnote)), {
+        rdflib.URIRef('http://foo.invalid/test.json#footnote=p'),
+    })
+
+  def test_Dspl2RdfExpander_ExpandInParallel(self):
+    slice_id = rdflib.URIRef('http://foo.invalid/test.json#slice')
+    data_ids = [rdflib.URIRef(f'http://foo.invalid/slice{i}.csv')
+                for i in range(5)]
+    open_sources = []
+    max_open = []
+
+    class CountingCsvSource(dspl2.expander._CsvSource):
+      def __init__(self, *args):
+        super().__init__(*args)
+        open_sources.append(self)
+        max_open.append(len(open_sources))
+
+      def Close(self):
+        if self in open_sources:
+          open_sources.remove(self)
+        super().Close()
+
+    def Expand(max_workers, cache=None):
+      graph = _MakeSliceGraph()
+      graph.remove((slice_id, SCHEMA.data, _SliceCsvId))
+      getter = DummyGetter(graph)
+      for i, data_id in enumerate(data_ids):
+        graph.add((slice_id, SCHEMA.data, data_id))
+        getter.Set(data_id, f'dim,year,measure,measure*\nA{i},2019,{i},\n'
+                            f'B{i},2019,{i},p\n')
+      out = StringIO()
+      Dspl2RdfExpander(getter).Expand(stream=NTriplesWriter(out),
+                                      max_workers=max_workers, cache=cache)
+      return out.getvalue()
+
+    expected = Expand(None)
+    with mock.patch.object(dspl2.expander, '_CsvSource', CountingCsvSource):
+      self.assertEqual(Expand(1), expected)
+      self.assertEqual(Expand(2), expected)
+      with tempfile.TemporaryDirectory() as tmp:
+        self.assertEqual(Expand(1, ExpansionCache(tmp)), expected)
+        self.assertEqual(Expand(1, ExpansionCache(tmp)), expected)
+    self.assertEqual(open_sources, [])
+    self.assertLessEqual(max(max_open), 2 * dspl2.expander._FilesPerWorker)
+
+  def test_Dspl2RdfExpander_ExpandFiltered(self):
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv.replace('BB,2019', 'BB,2020'))
+    Dspl2RdfExpander(getter).Expand(
+        sliceFilter=SliceFilter(codeValues={'#dim': ['BB', 'CC']}))
+    self.assertEqual(set(graph.objects(predicate=SCHEMA.codeValue)),
+                     {rdflib.Literal('BB')})
+
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv.replace('BB,2019', 'BB,2020'))
+    Dspl2RdfExpander(getter).Expand(
+        sliceFilter=SliceFilter(timeRange=(None, '2019')))
+    self.assertEqual(set(graph.objects(predicate=SCHEMA.codeValue)),
+                     {rdflib.Literal('AA')})
+
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    Dspl2RdfExpander(getter).Expand(
+        sliceFilter=SliceFilter(slices=['#other']))
+    self.assertEqual(set(graph.objects(predicate=SCHEMA.codeValue)), set())
+
+  def test_ExpandFilteredWithRowIndex(self):
+    dataset = {
+        '@context': {'@vocab': 'http://schema.org/'},
+        '@type': 'StatisticalDataset',
+        '@id': '#ds',
+        'dimension': [{'@type': 'CategoricalDimension', '@id': '#dim'},
+                      {'@type': 'TimeDimension', '@id': '#year'}],
+        'measure': {'@type': 'StatisticalMeasure', '@id': '#measure'},
+        'slice': {
+            '@type': 'DataSlice',
+            '@id': '#slice',
+            'dimension': [{'@id': '#dim'}, {'@id': '#year'}],
+            'measure': {'@id': '#measure'},
+            'data': {'@id': 'slice.csv'},
+        },
+    }
+    sliceFilter = SliceFilter(codeValues={'#dim': ['BB', 'DD']})
+    with tempfile.TemporaryDirectory() as tmp, \
+         mock.patch.object(dspl2.filegetter, '_CachePath', Path(tmp)):
+      path = Path(tmp) / 'dataset.json'
+      path.write_text(json.dumps(dataset))
+      (Path(tmp) / 'slice.csv').write_text(
+          'dim,year,measure\nAA,2019,1\nBB,2019,2\nCC,2020,3\nBB,2020,4\n')
+
+      def Expand(**kwargs):
+        out = StringIO()
+        Dspl2RdfExpander(LocalFileGetter(str(path))).Expand(
+            stream=NTriplesWriter(out), sliceFilter=sliceFilter, **kwargs)
+        jsonld = Dspl2JsonLdExpander(LocalFileGetter(str(path))).Expand(
+            sliceFilter=sliceFilter, **kwargs)
+        return out.getvalue(), jsonld
+
+      # Files are read in full when they cannot be indexed.
+      with mock.patch.object(LocalFileGetter, 'RowsOpener',
+                             side_effect=RuntimeError):
+        expected = Expand()
+      self.assertEqual(
+          [obs['measureValue'][0]['value']
+           for obs in expected[1]['slice']['data']], ['2', '4'])
+
+      with mock.patch.object(LocalFileGetter, 'RowsOpener', autospec=True,
+                             side_effect=LocalFileGetter.RowsOpener) as opener:
+        self.assertEqual(Expand(), expected)
+        self.assertEqual(Expand(max_workers=2), expected)
+        self.assertEqual(
+            Expand(cache=ExpansionCache(Path(tmp) / 'cache')), expected)
+        self.assertEqual(opener.call_args[0][2], {'dim': ('BB', 'DD')})
+
+  def test_TermCache(self):
+    terms = _TermCache(maxsize=2)
+    literal = terms.Literal(''.join(['A', 'A']))
+    self.assertIs(terms.Literal(''.join(['A', 'A'])), literal)
+    self.assertIsNot(terms.Literal('AA', datatype=SCHEMA.Date), literal)
+    string = terms.String(''.join(['A', 'A']))
+    self.assertIs(terms.String(''.join(['A', 'A'])), string)
+    terms.Literal('BB')
+    terms.Literal('CC')
+    self.assertIsNot(terms.Literal(''.join(['A', 'A'])), literal)
+
+  def test_Dspl2RdfExpander_ExpandSliceDataInternsCodes(self):
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, 'dim,year,measure\nAA,2019,1\nAA,2019,2\n')
+    Dspl2RdfExpander(getter).Expand()
+    codes = [code for code in graph.objects(predicate=SCHEMA.codeValue)
+             if code == rdflib.Literal('AA')]
+    self.assertEqual(len(codes), 2)
+    self.assertIs(codes[0], codes[1])
 
   def test_Dspl2JsonLdExpander_ExpandCodeList(self):
-    pass
+    getter = DummyGetter(None)
+    getter.Set('cities.csv',
+               'codeValue,name,state_code,county.name\n'
+               'c1,City 1,AA,County 1\n'
+               'c2,City 2,BB,County 2\n')
+    dim = {
+        '@id': '#city',
+        '@type': 'CategoricalDimension',
+        'codeList': 'cities.csv',
+        'equivalentType': 'City',
+        'dimensionProperty': [
+            {'@id': '#stateProperty', 'propertyID': 'state'},
+            {'propertyID': 'county', 'propertyType': 'AdministrativeArea'},
+            {'propertyID': 'country', 'value': 'US'},
+        ],
+        'tableMapping': [
+            {'sourceEntity': '#stateProperty',
+             'columnIdentifier': 'state_code'},
+        ],
+    }
+    codeList = Dspl2JsonLdExpander(getter)._ExpandCodeList(dim)
+    self.assertEqual(codeList, [{
+        'codeValue': 'c1',
+        'name': 'City 1',
+        '@type': ['DimensionValue', 'City'],
+        '@id': '#city=c1',
+        'dimension': '#city',
+        'state': 'AA',
+        'county': {'@type': 'AdministrativeArea', 'name': 'County 1'},
+        'country': 'US',
+    }, {
+        'codeValue': 'c2',
+        'name': 'City 2',
+        '@type': ['DimensionValue', 'City'],
+        '@id': '#city=c2',
+        'dimension': '#city',
+        'state': 'BB',
+        'county': {'@type': 'AdministrativeArea', 'name': 'County 2'},
+        'country': 'US',
+    }])
+    self.assertEqual(list(codeList[0]), list(codeList[1]))
 
   def test_Dspl2JsonLdExpander_ExpandFootnotes(self):
     pass
 
   def test_Dspl2JsonLdExpander_ExpandSliceData(self):
-    pass
+    getter = DummyGetter(None)
+    getter.Set('slice.csv', _SliceCsv.replace('1.5,', '1.5,p;q'))
+    slice = {
+        '@id': '#slice',
+        '@type': 'DataSlice',
+        'dimension': ['#dim', '#year'],
+        'measure': ['#measure'],
+        'data': 'slice.csv',
+    }
+    dim_defs_by_id = {
+        '#dim': {'@id': '#dim', '@type': 'CategoricalDimension'},
+        '#year': {'@id': '#year', '@type': 'TimeDimension'},
+    }
+    meas_defs_by_id = {
+        '#measure': {'@id': '#measure', '@type': 'StatisticalMeasure'},
+    }
+    data = Dspl2JsonLdExpander(getter)._ExpandSliceData(
+        slice, dim_defs_by_id, meas_defs_by_id, 'test.json#footnote=')
+    self.assertEqual(len(data), 2)
+    self.assertEqual(data[0]['dimensionValue'], [
+        {'@type': 'DimensionValue', 'dimension': '#dim', 'codeValue': 'AA'},
+        {'@type': 'DimensionValue', 'dimension': '#year', 'value': '2019'},
+    ])
+    self.assertEqual(data[0]['measureValue'], [{
+        '@type': 'MeasureValue',
+        'measure': '#measure',
+        'value': '1.5',
+        'footnote': ['test.json#footnote=p', 'test.json#footnote=q'],
+    }])
+    self.assertNotIn('footnote', data[1]['measureValue'][0])
+
+    getter.Set('slice.csv', _SliceCsv.replace('1.5,', '1.5,p;q'))
+    lazy = Dspl2JsonLdExpander(getter)._IterSliceData(
+        'slice.csv', slice, dim_defs_by_id, meas_defs_by_id,
+        'test.json#footnote=')
+    self.assertEqual(next(lazy), data[0])
+    self.assertEqual(list(lazy), data[1:])
+
+    # Compacted as the rows are read, without a list of the observations.
+    getter.Set('slice.csv', _SliceCsv.replace('1.5,', '1.5,p;q'))
+    with mock.patch.object(dspl2.expander, 'CompactObservations',
+                           wraps=CompactObservations) as compact:
+      self.assertEqual(
+          Dspl2JsonLdExpander(getter)._ExpandSliceData(
+              slice, dim_defs_by_id, meas_defs_by_id, 'test.json#footnote=',
+              compact=True),
+          CompactObservations(data))
+      self.assertNotIsInstance(compact.call_args[0][0], list)
+
+    # Without pandas, and in batches of a row.
+    for pandas in (dspl2.expander._ImportPandas(), None):
+      with mock.patch.object(dspl2.expander, '_ImportPandas',
+                             return_value=pandas), \
+           mock.patch.object(dspl2.expander, '_CsvChunkSize', 1):
+        getter.Set('slice.csv', _SliceCsv.replace('1.5,', '1.5,p;q'))
+        self.assertEqual(Dspl2JsonLdExpander(getter)._ExpandSliceData(
+            slice, dim_defs_by_id, meas_defs_by_id, 'test.json#footnote='),
+                         data)
+
+    # Filtered while reading, with and without pandas.
+    for pandas in (dspl2.expander._ImportPandas(), None):
+      with mock.patch.object(dspl2.expander, '_ImportPandas',
+                             return_value=pandas):
+        getter.Set('slice.csv', _SliceCsv.replace('BB,2019', 'BB,2020'))
+        filtered = Dspl2JsonLdExpander(getter)._ExpandSliceData(
+            slice, dim_defs_by_id, meas_defs_by_id, 'test.json#footnote=',
+            SliceFilter(codeValues={'#dim': ['BB']}, timeRange=('2020', None)))
+        self.assertEqual(
+            [obs['dimensionValue'][0]['codeValue'] for obs in filtered],
+            ['BB'])
+        getter.Set('slice.csv', _SliceCsv)
+        self.assertEqual(Dspl2JsonLdExpander(getter)._ExpandSliceData(
+            slice, dim_defs_by_id, meas_defs_by_id, 'test.json#footnote=',
+            SliceFilter(timeRange=('2020', '2021'))), [])
+
+    getter.Set('slice.csv', _SliceCsv.replace('dim,', 'other,'))
+    with self.assertRaisesRegex(RuntimeError, "column 'dim'"):
+      Dspl2JsonLdExpander(getter)._ExpandSliceData(
+          slice, dim_defs_by_id, meas_defs_by_id, 'test.json#footnote=')
+
+  def test_ImportPandasLazily(self):
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parents[2]))
+    result = subprocess.run(
+        [sys.executable, '-c',
+         "import sys, dspl2.expander; print('pandas' in sys.modules)"],
+        check=True, env=env, stdout=subprocess.PIPE, text=True)
+    self.assertEqual(result.stdout.strip(), 'False')
 
 
 if __name__ == '__main__':
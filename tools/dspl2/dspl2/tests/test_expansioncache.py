@@ -0,0 +1,187 @@
+import dspl2.expander
+from dspl2.expander import Dspl2JsonLdExpander, Dspl2RdfExpander
+from dspl2.expansioncache import ExpansionCache
+from dspl2.rdfutil import NTriplesWriter, SCHEMA
+from dspl2.tests.test_expander import (DummyGetter, _MakeSliceGraph,
+                                       _SliceCsv, _SliceCsvId)
+from io import StringIO
+import os
+import rdflib
+import rdflib.compare
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+
+class _ChunkedFile(StringIO):
+  """File that fails if it is read in full, rather than a chunk at a time."""
+  def read(self, size=-1):
+    if size is None or size < 0:
+      raise AssertionError('File read in full')
+    return super(_ChunkedFile, self).read(size)
+
+
+class _ChunkedGetter(DummyGetter):
+  def Set(self, filename, data):
+    self.data[filename] = _ChunkedFile(data)
+
+
+class ExpansionCacheTests(unittest.TestCase):
+  def setUp(self):
+    self.tempdir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tempdir.cleanup()
+
+  def test_GetPut(self):
+    cache = ExpansionCache(self.tempdir.name)
+    digest = cache.Hash('a,b\n1,2\n', 'metadata')
+    self.assertNotEqual(digest, cache.Hash('a,b\n1,2\n', 'other metadata'))
+    self.assertIsNone(cache.Get('rdf', 'a.csv', digest))
+    cache.Put('rdf', 'a.csv', digest, b'output')
+    self.assertEqual(cache.Get('rdf', 'a.csv', digest), b'output')
+    self.assertIsNone(cache.Get('jsonld', 'a.csv', digest))
+    cache.Save()
+
+    cache = ExpansionCache(self.tempdir.name)
+    self.assertEqual(cache.Get('rdf', 'a.csv', digest), b'output')
+    new_digest = cache.Hash('a,b\n1,3\n', 'metadata')
+    self.assertIsNone(cache.Get('rdf', 'a.csv', new_digest))
+    cache.Put('rdf', 'a.csv', new_digest, b'new output')
+    self.assertIsNone(cache.Get('rdf', 'a.csv', digest))
+    self.assertFalse(os.path.exists(os.path.join(self.tempdir.name, digest)))
+
+    # Output is only cached once it is written in full.
+    with self.assertRaises(ValueError):
+      with cache.Writer('rdf', 'a.csv', digest) as f:
+        f.write(b'partial')
+        raise ValueError()
+    self.assertEqual(cache.Get('rdf', 'a.csv', new_digest), b'new output')
+    self.assertEqual(sorted(os.listdir(self.tempdir.name)),
+                     sorted(['manifest.json', new_digest]))
+
+  def test_Prune(self):
+    cache = ExpansionCache(self.tempdir.name)
+    digests = {}
+    for name in ('a.csv', 'b.csv'):
+      digests[name] = cache.Hash(name, 'metadata')
+      cache.Put('rdf', name, digests[name], name.encode('utf-8'))
+      cache.Put('jsonld', name, digests[name], name.encode('utf-8'))
+    cache.Prune('rdf', ['a.csv'])
+    self.assertEqual(cache.Get('rdf', 'a.csv', digests['a.csv']), b'a.csv')
+    self.assertIsNone(cache.Get('rdf', 'b.csv', digests['b.csv']))
+    # Output still used by another kind is kept.
+    self.assertEqual(cache.Get('jsonld', 'b.csv', digests['b.csv']), b'b.csv')
+    cache.Prune('jsonld', [])
+    self.assertEqual(sorted(os.listdir(self.tempdir.name)),
+                     [digests['a.csv']])
+
+  def test_Dspl2RdfExpander_Expand(self):
+    graphs = []
+    for csv in (_SliceCsv, _SliceCsv, _SliceCsv.replace('AA', 'CC')):
+      graph = _MakeSliceGraph()
+      getter = DummyGetter(graph)
+      getter.Set(_SliceCsvId, csv)
+      Dspl2RdfExpander(getter).Expand(
+          cache=ExpansionCache(self.tempdir.name))
+      graphs.append(graph)
+    self.assertTrue(rdflib.compare.isomorphic(graphs[0], graphs[1]))
+    codes = set(graphs[2].objects(predicate=SCHEMA.codeValue))
+    self.assertIn(rdflib.Literal('CC'), codes)
+    self.assertNotIn(rdflib.Literal('AA'), codes)
+
+  def test_Dspl2RdfExpander_ExpandStream(self):
+    outputs = []
+    for _ in range(2):
+      graph = _MakeSliceGraph()
+      getter = _ChunkedGetter(graph)
+      getter.Set(_SliceCsvId, _SliceCsv)
+      out = StringIO()
+      with mock.patch.object(dspl2.expander, '_CsvChunkSize', 1):
+        Dspl2RdfExpander(getter).Expand(
+            stream=NTriplesWriter(out),
+            cache=ExpansionCache(self.tempdir.name))
+      outputs.append(re.sub(r'_:\w+', '_:b', out.getvalue()))
+    self.assertEqual(outputs[0], outputs[1])
+    self.assertIn('"1.5"', outputs[0])
+
+    # The output is cached as plain triples, a list per batch of rows.
+    cache = ExpansionCache(self.tempdir.name)
+    digest = cache.manifest['rdf'][str(_SliceCsvId)]
+    with cache.Open('rdf', _SliceCsvId, digest) as f:
+      batches = list(dspl2.expander._ReadTriples(f))
+    self.assertEqual(len(batches), 2)
+    self.assertTrue(all(len(triple) == 3
+                        for triples in batches for triple in triples))
+
+  def test_Dspl2RdfExpander_ExpandUnreadableOutput(self):
+    expected = _MakeSliceGraph()
+    getter = DummyGetter(expected)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    Dspl2RdfExpander(getter).Expand(cache=ExpansionCache(self.tempdir.name))
+    cache = ExpansionCache(self.tempdir.name)
+    digest = cache.manifest['rdf'][str(_SliceCsvId)]
+    path = os.path.join(self.tempdir.name, digest)
+    with open(path, 'r+b') as f:
+      f.truncate(10)
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    Dspl2RdfExpander(getter).Expand(cache=cache)
+    self.assertTrue(rdflib.compare.isomorphic(graph, expected))
+    self.assertGreater(os.path.getsize(path), 10)
+
+  def test_Dspl2RdfExpander_ExpandPrunes(self):
+    graph = _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    Dspl2RdfExpander(getter).Expand(cache=ExpansionCache(self.tempdir.name))
+    self.assertIn(str(_SliceCsvId),
+                  ExpansionCache(self.tempdir.name).manifest['rdf'])
+
+    # The slice now reads another file, so the first one's output is removed.
+    graph = _MakeSliceGraph()
+    other_id = rdflib.URIRef('http://foo.invalid/other.csv')
+    graph.remove((None, SCHEMA.data, _SliceCsvId))
+    graph.add((rdflib.URIRef('http://foo.invalid/test.json#slice'),
+               SCHEMA.data, other_id))
+    getter = DummyGetter(graph)
+    getter.Set(other_id, _SliceCsv)
+    Dspl2RdfExpander(getter).Expand(cache=ExpansionCache(self.tempdir.name))
+    cache = ExpansionCache(self.tempdir.name)
+    self.assertEqual(list(cache.manifest['rdf']), [str(other_id)])
+    self.assertEqual(
+        sorted(os.listdir(self.tempdir.name)),
+        sorted(['manifest.json', cache.manifest['rdf'][str(other_id)]]))
+
+  def test_Dspl2JsonLdExpander_ExpandSliceData(self):
+    slice = {
+        '@id': '#slice',
+        '@type': 'DataSlice',
+        'dimension': ['#dim', '#year'],
+        'measure': ['#measure'],
+        'data': 'slice.csv',
+    }
+    dim_defs_by_id = {
+        '#dim': {'@id': '#dim', '@type': 'CategoricalDimension'},
+        '#year': {'@id': '#year', '@type': 'TimeDimension'},
+    }
+    meas_defs_by_id = {
+        '#measure': {'@id': '#measure', '@type': 'StatisticalMeasure'},
+    }
+    results = []
+    for csv in (_SliceCsv, _SliceCsv, _SliceCsv.replace('AA', 'CC')):
+      getter = _ChunkedGetter(None)
+      getter.Set('slice.csv', csv)
+      expander = Dspl2JsonLdExpander(getter)
+      expander.cache = ExpansionCache(self.tempdir.name)
+      results.append(expander._ExpandSliceData(
+          slice, dim_defs_by_id, meas_defs_by_id, '#footnote='))
+      expander.cache.Save()
+    self.assertEqual(results[0], results[1])
+    self.assertEqual(results[2][0]['dimensionValue'][0]['codeValue'], 'CC')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,434 @@
+import bz2
+import dspl2.filegetter
+from dspl2.filegetter import (HybridFileGetter, InternetFileGetter,
+                              LocalFileGetter, UploadedFileGetter,
+                              ZipFileGetter)
+from dspl2.rdfutil import SCHEMA
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import lzma
+from pathlib import Path
+import requests
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import zipfile
+
+
+_Dataset = {
+    '@context': {'@vocab': 'http://schema.org/'},
+    '@type': 'StatisticalDataset',
+    '@id': 'http://foo.invalid/dataset.json',
+    'dimension': {
+        '@type': 'CategoricalDimension',
+        '@id': 'http://foo.invalid/dataset.json#dim',
+        'codeList': {'@id': 'dim.csv'},
+    },
+    'footnote': {'@id': 'footnotes.csv'},
+    'slice': {
+        '@type': 'DataSlice',
+        '@id': 'http://foo.invalid/dataset.json#slice',
+        'data': {'@id': 'slice.csv'},
+    },
+}
+_LastModified = 'Mon, 01 Jul 2019 00:00:00 GMT'
+
+
+class _FakeResponse(object):
+  def __init__(self, url, text):
+    self.url = url
+    self.text = text
+    self.ok = text is not None
+    self.content = (text or '').encode('utf-8')
+    self.encoding = 'utf-8'
+    self.headers = {'content-type': 'application/ld+json'}
+
+  def raise_for_status(self):
+    if self.text is None:
+      raise requests.HTTPError('404 Not Found: ' + self.url)
+
+  def iter_content(self, chunk_size):
+    for start in range(0, len(self.content), chunk_size):
+      yield self.content[start:start + chunk_size]
+
+  def close(self):
+    pass
+
+
+class _UnseekableStream(io.BytesIO):
+  def seekable(self):
+    return False
+
+
+class _FakeUpload(object):
+  def __init__(self, filename, contents, *, seekable=True):
+    self.filename = filename
+    self.stream = (io.BytesIO if seekable else _UnseekableStream)(contents)
+
+
+class _FakeSession(object):
+  def __init__(self, files, requested):
+    self.files = files
+    self.requested = requested
+
+  def get(self, url, timeout=None, stream=False):
+    self.requested.append(url)
+    return _FakeResponse(url, self.files.get(url))
+
+
+class _Handler(BaseHTTPRequestHandler):
+  """Serves `server.files`, recording the client port of each request.
+
+  Responses carry an ETag of the file's version in `server.versions` and a
+  fixed Last-Modified date, and conditional requests are answered with 304.
+  """
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    self.server.ports.append(self.client_address[1])
+    self.server.requests.append((self.path, dict(self.headers)))
+    etag = '"{}"'.format(self.server.versions.get(self.path, 0))
+    headers = {}
+    if self.server.failures.get(self.path):
+      self.server.failures[self.path] -= 1
+      status, body = 503, b''
+    elif self.path not in self.server.files:
+      status, body = 404, b''
+    elif (self.headers.get('If-None-Match') == etag or
+          (not self.server.etags and
+           self.headers.get('If-Modified-Since') == _LastModified)):
+      status, body = 304, b''
+    else:
+      status, body = 200, self.server.files[self.path]
+      if isinstance(body, str):
+        body = body.encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/ld+json')
+    self.send_header('Content-Length', str(len(body)))
+    if self.server.etags:
+      self.send_header('ETag', etag)
+    self.send_header('Last-Modified', _LastModified)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+
+def _StartServer(test, files):
+  """Starts serving files, keyed by URL path, until the end of test."""
+  server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+  server.files = files
+  server.versions = {}
+  server.etags = True
+  server.ports = []
+  server.requests = []
+  server.failures = {}
+  thread = threading.Thread(target=server.serve_forever, args=(0.01,),
+                            daemon=True)
+  thread.start()
+  test.addCleanup(thread.join)
+  test.addCleanup(server.server_close)
+  test.addCleanup(server.shutdown)
+  return server, 'http://127.0.0.1:{}/'.format(server.server_port)
+
+
+class FileGetterTests(unittest.TestCase):
+  def setUp(self):
+    self.files = {
+        'http://foo.invalid/dataset.json': json.dumps(_Dataset),
+        'http://foo.invalid/dim.csv': 'codeValue\nAA\n',
+        'http://foo.invalid/slice.csv': 'dim,measure\nAA,1\n',
+    }
+    self.requested = []
+    self.session = _FakeSession(self.files, self.requested)
+
+  def _StartServer(self):
+    return _StartServer(self, {
+        url.replace('http://foo.invalid', ''): text
+        for url, text in self.files.items()
+    })
+
+  def test_InternetFileGetter_Prefetch(self):
+    getter = InternetFileGetter('http://foo.invalid/dataset.json',
+                                session=self.session)
+    getter.Prefetch()
+    self.assertEqual(sorted(self.requested), [
+        'http://foo.invalid/dataset.json',
+        'http://foo.invalid/dim.csv',
+        'http://foo.invalid/footnotes.csv',
+        'http://foo.invalid/slice.csv',
+    ])
+    self.requested.clear()
+    self.assertEqual(getter.Fetch('slice.csv').read(), 'dim,measure\nAA,1\n')
+    self.assertEqual(getter.Fetch('http://foo.invalid/dim.csv').read(),
+                     'codeValue\nAA\n')
+    self.assertEqual(self.requested, [])
+    with self.assertRaises(requests.HTTPError):
+      getter.Fetch('footnotes.csv')
+    self.assertEqual(self.requested, ['http://foo.invalid/footnotes.csv'])
+    # Prefetched files are only kept until they are fetched.
+    self.assertEqual(getter.prefetched, {})
+    self.assertEqual(getter.Fetch('slice.csv').read(), 'dim,measure\nAA,1\n')
+    self.assertEqual(self.requested[-1], 'http://foo.invalid/slice.csv')
+
+  def test_HybridFileGetter_Prefetch(self):
+    getter = HybridFileGetter('http://foo.invalid/dataset.json',
+                              session=self.session)
+    getter.Prefetch(max_workers=2)
+    self.requested.clear()
+    self.assertEqual(getter.Fetch('slice.csv').read(), 'dim,measure\nAA,1\n')
+    self.assertEqual(self.requested, [])
+
+  def test_InternetFileGetter_ReusesConnections(self):
+    server, base = self._StartServer()
+    getter = InternetFileGetter(base + 'dataset.json')
+    for _ in range(3):
+      self.assertEqual(getter.Fetch('dim.csv').read(), 'codeValue\nAA\n')
+      self.assertEqual(getter.Fetch('slice.csv').read(), 'dim,measure\nAA,1\n')
+    self.assertEqual(len(server.ports), 7)
+    self.assertEqual(len(set(server.ports)), 1)
+    getter.Prefetch(max_workers=2)
+    self.assertLessEqual(len(set(server.ports)), 2)
+    getter.session.close()
+
+  def test_HybridFileGetter_ReusesConnections(self):
+    server, base = self._StartServer()
+    getter = HybridFileGetter(base + 'dataset.json')
+    for filename in ('dim.csv', 'slice.csv'):
+      with getter.Fetch(filename) as f:
+        f.read()
+    self.assertEqual(len(server.ports), 3)
+    self.assertEqual(len(set(server.ports)), 1)
+    getter.session.close()
+
+  def test_InternetFileGetter_Streams(self):
+    lines = ['name\r\n'] + ['Zürich Ωmega {}\r\n'.format(i)
+                             for i in range(100)]
+    self.files['http://foo.invalid/utf8.csv'] = ''.join(lines)
+    server, base = self._StartServer()
+    getter = InternetFileGetter(base + 'dataset.json')
+    with mock.patch.object(dspl2.filegetter, '_ChunkSize', 5):
+      with getter.Fetch('utf8.csv') as f:
+        self.assertEqual(next(f), 'name\r\n')
+      with getter.Fetch('utf8.csv') as f:
+        self.assertEqual(list(f), lines)
+    getter.session.close()
+
+  def test_LocalFileGetter_Compressed(self):
+    with tempfile.TemporaryDirectory() as tempdir:
+      path = Path(tempdir)
+      dataset = dict(_Dataset, footnote={'@id': 'footnotes.csv.xz'})
+      dataset['dimension'] = dict(_Dataset['dimension'],
+                                  codeList={'@id': 'dim.csv.bz2'})
+      (path / 'dataset.json.gz').write_bytes(
+          gzip.compress(json.dumps(dataset).encode('utf-8')))
+      (path / 'slice.csv.gz').write_bytes(
+          gzip.compress(b'dim,measure\nAA,1\n'))
+      (path / 'dim.csv.bz2').write_bytes(bz2.compress(b'codeValue\nAA\n'))
+      (path / 'footnotes.csv.xz').write_bytes(lzma.compress(b'codeValue\n'))
+      # Compression is detected from the contents, not the extension.
+      (path / 'plain.csv.gz').write_text('codeValue\nBB\n')
+      (path / 'gzipped.csv').write_bytes(gzip.compress(b'codeValue\nCC\n'))
+      getter = LocalFileGetter(str(path / 'dataset.json.gz'))
+      self.assertIn((None, None, SCHEMA.StatisticalDataset),
+                    getter.graph)
+      for filename, text in [('slice.csv.gz', 'dim,measure\nAA,1\n'),
+                             ('dim.csv.bz2', 'codeValue\nAA\n'),
+                             ('footnotes.csv.xz', 'codeValue\n'),
+                             ('plain.csv.gz', 'codeValue\nBB\n'),
+                             ('gzipped.csv', 'codeValue\nCC\n')]:
+        with getter.Fetch(filename) as f:
+          self.assertEqual(f.read(), text)
+
+  def test_LocalFileGetter_RowsOpener(self):
+    csv_text = ('dim,year,measure\r\n'
+                'AA,2000,1\r\n'
+                'BB,2000,"multi\r\nline"\r\n'
+                'AA,2001,"Zürich, 3"\r\n'
+                '\r\n'
+                'AA,2000,4\r\n')
+    header = 'dim,year,measure\r\n'
+    with tempfile.TemporaryDirectory() as tempdir, \
+        tempfile.TemporaryDirectory() as cachedir, \
+        mock.patch.object(dspl2.filegetter, '_CachePath', Path(cachedir)):
+      path = Path(tempdir)
+      (path / 'dataset.json').write_text(json.dumps(_Dataset))
+      (path / 'slice.csv').write_bytes(csv_text.encode('utf-8'))
+      (path / 'empty.csv').write_bytes(b'')
+      (path / 'slice.csv.gz').write_bytes(gzip.compress(b'dim\nAA\n'))
+      getter = LocalFileGetter(str(path / 'dataset.json'))
+
+      def ReadRows(filename, filters):
+        with getter.RowsOpener(filename, filters)() as f:
+          return f.read()
+
+      index = getter.IndexRows('slice.csv', ['dim', 'year'])
+      self.assertEqual(sorted(index), [('AA', '2000'), ('AA', '2001'),
+                                       ('BB', '2000')])
+      self.assertEqual(
+          ReadRows('slice.csv', {'dim': ['AA'], 'year': ['2000']}),
+          header + 'AA,2000,1\r\nAA,2000,4\r\n')
+      self.assertEqual(ReadRows('slice.csv', {'dim': ['BB']}),
+                       header + 'BB,2000,"multi\r\nline"\r\n')
+      self.assertEqual(ReadRows('slice.csv', {'year': ['2001', '2002']}),
+                       header + 'AA,2001,"Zürich, 3"\r\n')
+      self.assertEqual(ReadRows('slice.csv', {'dim': ['CC']}), header)
+      with getter.Fetch('slice.csv') as f:
+        self.assertEqual(ReadRows('slice.csv', {}), f.read())
+      self.assertEqual(ReadRows('empty.csv', {}), '')
+      with self.assertRaises(RuntimeError):
+        getter.RowsOpener('slice.csv', {'missing': ['AA']})
+      with self.assertRaises(RuntimeError):
+        getter.RowsOpener('slice.csv.gz', {'dim': ['AA']})
+
+      # A new getter reuses the saved index, until the file changes. It is
+      # saved in the cache directory, not next to the file.
+      self.assertEqual(len(list((Path(cachedir) / 'indexes').iterdir())), 1)
+      self.assertEqual(sorted(p.name for p in path.iterdir()),
+                       ['dataset.json', 'empty.csv', 'slice.csv',
+                        'slice.csv.gz'])
+      getter = LocalFileGetter(str(path / 'dataset.json'))
+      with mock.patch.object(dspl2.filegetter, '_BuildRowIndex') as build:
+        self.assertEqual(getter.IndexRows('slice.csv', ['dim', 'year']),
+                         index)
+        build.assert_not_called()
+      (path / 'slice.csv').write_text('dim,year,measure\nCC,2000,5\n')
+      self.assertEqual(ReadRows('slice.csv', {'dim': ['CC']}),
+                       'dim,year,measure\nCC,2000,5\n')
+      getter.IndexRows('empty.csv', [], persist=False)
+      self.assertEqual(len(list((Path(cachedir) / 'indexes').iterdir())), 1)
+
+  def test_InternetFileGetter_Compressed(self):
+    self.files['http://foo.invalid/slice.csv.gz'] = gzip.compress(
+        'dim,measure\nÅÅ,1\n'.encode('utf-8'))
+    self.files['http://foo.invalid/dim.csv.xz'] = lzma.compress(
+        b'codeValue\nAA\n')
+    server, base = self._StartServer()
+    getter = InternetFileGetter(base + 'dataset.json')
+    with mock.patch.object(dspl2.filegetter, '_ChunkSize', 5):
+      with getter.Fetch('slice.csv.gz') as f:
+        self.assertEqual(list(f), ['dim,measure\n', 'ÅÅ,1\n'])
+    with getter.Fetch('dim.csv.xz') as f:
+      self.assertEqual(f.read(), 'codeValue\nAA\n')
+    getter.session.close()
+
+  def test_UploadedFileGetter(self):
+    rows = ''.join('AA,{}\n'.format(i) for i in range(1000))
+    uploads = [
+        _FakeUpload('dataset.json', json.dumps(_Dataset).encode('utf-8')),
+        _FakeUpload('slice.csv', ('dim,measure\r\n' + rows).encode('utf-8'),
+                    seekable=False),
+        _FakeUpload('dim.csv.gz', gzip.compress(b'codeValue\nAA\n'),
+                    seekable=False),
+    ]
+    with mock.patch.object(dspl2.filegetter, '_SpoolSize', 100):
+      getter = UploadedFileGetter(uploads)
+    self.assertEqual(getter.base, 'dataset.json')
+    self.assertIn((None, None, SCHEMA.StatisticalDataset), getter.graph)
+    # Seekable uploads are read in place. Others are copied, and large ones
+    # are spooled to disk.
+    self.assertIs(getter.file_map['dataset.json'], uploads[0].stream)
+    self.assertTrue(getter.file_map['slice.csv']._rolled)
+    self.assertFalse(getter.file_map['dim.csv.gz']._rolled)
+    with getter.Fetch('slice.csv') as f, getter.Fetch('slice.csv') as g:
+      self.assertEqual(next(f), 'dim,measure\r\n')
+      self.assertEqual(g.read(), 'dim,measure\r\n' + rows)
+      self.assertEqual(next(f), 'AA,0\n')
+    # Spools are read without readinto, which they lack before Python 3.11.
+    with mock.patch.object(tempfile.SpooledTemporaryFile, 'readinto',
+                           side_effect=AttributeError), \
+         getter.Fetch('slice.csv') as f:
+      self.assertEqual(next(f), 'dim,measure\r\n')
+    with getter.Fetch('dim.csv.gz') as f:
+      self.assertEqual(f.read(), 'codeValue\nAA\n')
+    with self.assertRaises(IOError):
+      getter.Fetch('footnotes.csv')
+    spools = [getter.file_map['slice.csv'], getter.file_map['dim.csv.gz']]
+    getter.Close()
+    self.assertTrue(all(spool.closed for spool in spools))
+    self.assertFalse(uploads[0].stream.closed)
+    with self.assertRaises(IOError):
+      getter.Fetch('slice.csv')
+
+    with UploadedFileGetter([_FakeUpload(
+        'dataset.json', json.dumps(_Dataset).encode('utf-8'),
+        seekable=False)]) as getter:
+      spool = getter.file_map['dataset.json']
+    self.assertTrue(spool.closed)
+    with self.assertRaises(RuntimeError):
+      UploadedFileGetter([_FakeUpload('dim.csv', b'codeValue\nAA\n')])
+
+  def _MakeZip(self, files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+      for name, contents in files.items():
+        z.writestr(name, contents)
+    return buffer.getvalue()
+
+  def test_ZipFileGetter(self):
+    dataset = dict(_Dataset, footnote={'@id': '../notes/foot%20notes.csv'})
+    del dataset['@id']
+    contents = self._MakeZip({
+        'ds/dataset.jsonld': json.dumps(dataset),
+        'ds/dim.csv': 'codeValue\nAA\n',
+        'ds/slice.csv.gz': gzip.compress(b'dim,measure\nAA,1\n'),
+        'notes/foot notes.csv': 'codeValue\n',
+        'ds/README.md': 'Not a DSPL 2 document',
+    })
+    with tempfile.TemporaryDirectory() as tempdir:
+      path = Path(tempdir) / 'dataset.zip'
+      path.write_bytes(contents)
+      for getter, root in [
+          (ZipFileGetter(contents, name='upload.zip'), '/upload.zip'),
+          (ZipFileGetter(io.BytesIO(contents)), '/dataset.zip'),
+          (ZipFileGetter(path), path.resolve().as_posix()),
+      ]:
+        with getter:
+          self.assertEqual(getter.base, root + '/ds/dataset.jsonld')
+          footnotes = list(getter.graph.objects(predicate=SCHEMA.footnote))
+          self.assertEqual(len(footnotes), 1)
+          with getter.Fetch(str(footnotes[0])) as f:
+            self.assertEqual(f.read(), 'codeValue\n')
+          with getter.Fetch('dim.csv') as f:
+            self.assertEqual(f.read(), 'codeValue\nAA\n')
+          with getter.Fetch('slice.csv.gz') as f:
+            self.assertEqual(list(f), ['dim,measure\n', 'AA,1\n'])
+          for filename in ('missing.csv', '../../outside.csv'):
+            with self.assertRaises(IOError):
+              getter.Fetch(filename)
+        self.assertIsNone(getter.zip.fp)
+
+  def test_ZipFileGetter_Errors(self):
+    # The archive is closed when the getter fails to load.
+    archives = []
+    open_zip = zipfile.ZipFile
+
+    def OpenZip(*args):
+      archives.append(open_zip(*args))
+      return archives[-1]
+    with mock.patch.object(zipfile, 'ZipFile', side_effect=OpenZip), \
+         self.assertRaises(RuntimeError):
+      ZipFileGetter(self._MakeZip({'dim.csv': 'codeValue\nAA\n'}))
+    self.assertIsNone(archives[0].fp)
+    with self.assertRaises(RuntimeError):
+      ZipFileGetter(self._MakeZip({
+          'a.json': json.dumps(_Dataset),
+          'b.json': json.dumps(_Dataset),
+      }))
+
+  def test_InternetFileGetter_Retries(self):
+    server, base = self._StartServer()
+    server.failures['/dim.csv'] = 1
+    getter = InternetFileGetter(base + 'dataset.json')
+    self.assertEqual(getter.Fetch('dim.csv').read(), 'codeValue\nAA\n')
+    with self.assertRaises(requests.HTTPError):
+      getter.Fetch('footnotes.csv')
+    getter.session.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,132 @@
+from dspl2.filegetter import InternetFileGetter
+from dspl2.httpcache import HttpCache
+from dspl2.tests.test_filegetter import _Dataset, _StartServer
+import json
+from pathlib import Path
+import requests
+import tempfile
+import unittest
+
+
+class HttpCacheTests(unittest.TestCase):
+  def setUp(self):
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tempdir.cleanup)
+    self.server, self.base = _StartServer(self, {
+        '/dataset.json': json.dumps(_Dataset),
+        '/a.csv': 'a\n' + 'x' * 100 + '\n',
+        '/b.csv': 'b\n' + 'y' * 100 + '\n',
+        '/c.csv': 'c\n' + 'z' * 100 + '\n',
+        '/dim.csv': 'codeValue\nAA\n',
+        '/slice.csv': 'dim,measure\nAA,1\n',
+    })
+    self.session = requests.Session()
+    self.addCleanup(self.session.close)
+
+  def _Read(self, cache, path):
+    fileobj, content_type, encoding = cache.Open(self.session,
+                                                 self.base + path)
+    self.assertEqual(content_type, 'application/ld+json')
+    with fileobj:
+      return fileobj.read().decode(encoding)
+
+  def _Validators(self):
+    return [headers.get('If-None-Match') or headers.get('If-Modified-Since')
+            for _, headers in self.server.requests]
+
+  def test_Revalidate(self):
+    cache = HttpCache(self.tempdir.name)
+    self.assertEqual(self._Read(cache, 'a.csv')[:2], 'a\n')
+    self.assertEqual(self._Read(cache, 'a.csv')[:2], 'a\n')
+    self.assertEqual(self._Validators(), [None, '"0"'])
+
+    self.server.files['/a.csv'] = 'a\nchanged\n'
+    self.server.versions['/a.csv'] = 1
+    cache = HttpCache(self.tempdir.name)
+    self.assertEqual(self._Read(cache, 'a.csv'), 'a\nchanged\n')
+    self.assertEqual(self._Read(cache, 'a.csv'), 'a\nchanged\n')
+    self.assertEqual(self._Validators()[2:], ['"0"', '"1"'])
+
+  def test_RevalidateLastModified(self):
+    self.server.etags = False
+    cache = HttpCache(self.tempdir.name)
+    self._Read(cache, 'a.csv')
+    self.assertEqual(self._Read(cache, 'a.csv')[:2], 'a\n')
+    self.assertEqual(self._Validators(),
+                     [None, 'Mon, 01 Jul 2019 00:00:00 GMT'])
+
+  def test_Ttl(self):
+    cache = HttpCache(self.tempdir.name, ttl=3600)
+    for _ in range(3):
+      self.assertEqual(self._Read(cache, 'a.csv')[:2], 'a\n')
+    self.assertEqual(len(self.server.requests), 1)
+    cache = HttpCache(self.tempdir.name, ttl=0)
+    self._Read(cache, 'a.csv')
+    self.assertEqual(len(self.server.requests), 2)
+
+  def test_Evict(self):
+    cache = HttpCache(self.tempdir.name, max_size=250)
+    self._Read(cache, 'a.csv')
+    self._Read(cache, 'b.csv')
+    self._Read(cache, 'a.csv')
+    self._Read(cache, 'c.csv')
+    self.assertEqual(set(cache.manifest),
+                     {self.base + 'a.csv', self.base + 'c.csv'})
+    self.server.requests.clear()
+    self._Read(cache, 'b.csv')
+    self.assertEqual(self._Validators(), [None])
+
+  def test_SharedDirectory(self):
+    # Caches sharing a directory, as separate processes would, keep each
+    # other's entries when they save.
+    cache = HttpCache(self.tempdir.name, ttl=3600)
+    other = HttpCache(self.tempdir.name, ttl=3600)
+    self._Read(cache, 'a.csv')
+    self._Read(other, 'b.csv')
+    self._Read(cache, 'c.csv')
+    self.assertEqual(set(HttpCache(self.tempdir.name).manifest),
+                     {self.base + 'a.csv', self.base + 'b.csv',
+                      self.base + 'c.csv'})
+
+    # A body removed by the other cache is fetched again.
+    (Path(self.tempdir.name) / other.manifest[self.base + 'a.csv']['file']
+     ).unlink()
+    self.server.requests.clear()
+    self.assertEqual(self._Read(other, 'a.csv')[:2], 'a\n')
+    self.assertEqual(self._Validators(), [None])
+
+  def test_TtlDoesNotSave(self):
+    cache = HttpCache(self.tempdir.name, ttl=3600)
+    self._Read(cache, 'a.csv')
+    manifest_path = Path(self.tempdir.name) / 'manifest.json'
+    saved = manifest_path.read_text()
+    used = cache.manifest[self.base + 'a.csv']['used']
+    self._Read(cache, 'a.csv')
+    self.assertEqual(manifest_path.read_text(), saved)
+    cache.Save()
+    self.assertGreater(
+        HttpCache(self.tempdir.name).manifest[self.base + 'a.csv']['used'],
+        used)
+
+  def test_Errors(self):
+    cache = HttpCache(self.tempdir.name)
+    with self.assertRaises(requests.HTTPError):
+      self._Read(cache, 'missing.csv')
+    self.assertEqual(cache.manifest, {})
+
+  def test_InternetFileGetter(self):
+    cache = HttpCache(self.tempdir.name, ttl=3600)
+    for _ in range(2):
+      self.server.requests.clear()
+      getter = InternetFileGetter(self.base + 'dataset.json', cache=cache)
+      self.assertEqual(getter.Fetch('dim.csv').read(), 'codeValue\nAA\n')
+      getter.Prefetch()
+      self.assertEqual(getter.Fetch('slice.csv').read(), 'dim,measure\nAA,1\n')
+      getter.session.close()
+    # Only the missing footnotes file is requested again.
+    self.assertEqual([path for path, _ in self.server.requests],
+                     ['/footnotes.csv'])
+
+
+if __name__ == '__main__':
+  unittest.main()
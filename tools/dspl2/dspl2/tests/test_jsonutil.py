@@ -1,5 +1,9 @@
-from dspl2.jsonutil import (AsList, GetSchemaProp, JsonToKwArgsDict,
-                            MakeIdKeyedDict, GetSchemaId, GetSchemaType, GetUrl)
+from dspl2.jsonutil import (AsList, CompactObservations,
+                            ExpandCompactObservations, GetSchemaProp,
+                            JsonToKwArgsDict, MakeIdKeyedDict, GetSchemaId,
+                            GetSchemaType, GetUrl, WriteJson)
+from io import StringIO
+import json
 import unittest
 
 
@@ -39,5 +43,53 @@ class JsonUtilTests(unittest.TestCase):
     self.assertEqual(GetUrl('val'), 'val')
 
 
+  def test_CompactObservations(self):
+    observations = [{
+        '@type': 'Observation',
+        'slice': '#slice',
+        'dimensionValue': [
+            {'@type': 'DimensionValue', 'dimension': '#dim',
+             'codeValue': code},
+            {'@type': 'DimensionValue', 'dimension': '#year',
+             'value': {'@type': 'Date', '@value': '2019'}},
+        ],
+        'measureValue': [
+            {'@type': 'MeasureValue', 'measure': '#measure', 'value': value},
+        ],
+    } for code, value in (('AA', '1.5'), ('BB', '2'), ('CC', '3'))]
+    observations[1]['measureValue'][0]['footnote'] = ['#footnote=p']
+    compact = CompactObservations(iter(observations))
+    self.assertEqual(compact, {
+        'slice': '#slice',
+        'dimensionValue': [
+            {'dimension': '#dim', 'codeValue': ['AA', 'BB', 'CC']},
+            {'dimension': '#year',
+             'value': {'type': 'Date', 'values': ['2019', '2019', '2019']}},
+        ],
+        'measureValue': [
+            {'measure': '#measure', 'value': ['1.5', '2', '3'],
+             'footnote': [None, ['#footnote=p'], None]},
+        ],
+    })
+    self.assertEqual(ExpandCompactObservations(compact), observations)
+    self.assertEqual(ExpandCompactObservations(CompactObservations([])), [])
+
+  def test_WriteJson(self):
+    val = {'a': [1, {'b': [], 'c': {}}], 'd': 'x\ny', 'e': [{'f': 1}, 2]}
+    for indent in (None, 2):
+      out = StringIO()
+      WriteJson(val, out, indent=indent)
+      self.assertEqual(out.getvalue(), json.dumps(val, indent=indent))
+
+      lazy = dict(val)
+      lazy['a'] = iter(val['a'])
+      lazy['e'] = (item for item in val['e'])
+      lazy['g'] = iter([])
+      out = StringIO()
+      WriteJson(lazy, out, indent=indent)
+      self.assertEqual(out.getvalue(),
+                       json.dumps(dict(val, g=[]), indent=indent))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,20 @@
-from dspl2.rdfutil import (LoadGraph, FrameGraph, SelectFromGraph)
+from dspl2.filegetter import LocalFileGetter
+import dspl2.rdfutil
+from dspl2.rdfutil import (LoadGraph, FrameGraph, NTriplesWriter,
+                           MakeSparqlSelectQuery, SelectFromGraph,
+                           _DataFileFrame, _FrameGraphWithPyld, _FullFrame,
+                           _DocumentLoader, _LoadCachedJson, _ParseJsonLd)
+import copy
 from io import StringIO
 import json
+import os
+from pathlib import Path
+from pyld import jsonld
 import rdflib
 import rdflib.compare
+import tempfile
 import unittest
+from unittest import mock
 
 
 _SampleJson = '''{
@@ -48,6 +59,42 @@ _SampleJson = '''{
   }
 }'''
 
+_ValuesJson = {
+    '@context': 'http://schema.org',
+    '@type': 'StatisticalDataset',
+    '@id': '#ds',
+    'name': [{'@value': 'Name', '@language': 'en'}, 'Plain name'],
+    'version': 2,
+    'ratingValue': 4.5,
+    'isAccessibleForFree': True,
+    'dateCreated': '2019-01-01',
+    'dataset': '',
+    'sameAs': ['other.json', 'xsd:Year', '_:other'],
+    'identifier': {'@value': '2019', '@type': 'xsd:gYear'},
+    'keywords': {'@set': ['a', ['b']]},
+    'schema:alternateName': 'Alternate',
+    'unknownProperty': None,
+    'measure': {'@id': '#measure', 'name': 'Measure'},
+}
+_SamplesPath = Path(__file__).parents[4] / 'samples'
+_FrameSamples = [
+    'bls/unemployment/bls-unemployment.jsonld',
+    'eurostat/population_density/eurostat_population_density.json',
+    'us_census/population/census-totpop.json',
+]
+
+
+def _Canonicalize(val):
+  """Sorts lists and drops blank node labels, which depend on graph order."""
+  if isinstance(val, list):
+    return sorted((_Canonicalize(item) for item in val),
+                  key=lambda item: json.dumps(item, sort_keys=True))
+  elif isinstance(val, dict):
+    return {key: _Canonicalize(item) for key, item in val.items()}
+  elif isinstance(val, str) and val.startswith('_:'):
+    return '_:'
+  return val
+
 
 class RdfUtilTests(unittest.TestCase):
   def test_LoadGraph(self):
@@ -57,6 +104,28 @@ class RdfUtilTests(unittest.TestCase):
     self.assertTrue(rdflib.compare.isomorphic(graph1, graph2))
     self.assertTrue(rdflib.compare.isomorphic(graph1, graph3))
 
+  def test_LoadGraph_MatchesRdflib(self):
+    docs = {'_SampleJson': json.loads(_SampleJson), '_ValuesJson': _ValuesJson}
+    for path in _FrameSamples:
+      if (_SamplesPath / path).exists():
+        with (_SamplesPath / path).open() as f:
+          docs[path] = json.load(f)
+    for name, doc in docs.items():
+      with self.subTest(doc=name):
+        graph = LoadGraph(copy.deepcopy(doc), 'http://foo.invalid/ds.json')
+        expected = _ParseJsonLd(copy.deepcopy(doc), 'http://foo.invalid/ds.json',
+                                'default')
+        self.assertTrue(rdflib.compare.isomorphic(graph, expected))
+        self.assertEqual(sorted(graph.namespaces()),
+                         sorted(expected.namespaces()))
+
+  def test_LoadGraph_Unsupported(self):
+    doc = dict(_ValuesJson, keywords={'@list': ['a', 'b']})
+    graph = LoadGraph(copy.deepcopy(doc), 'http://foo.invalid/ds.json')
+    self.assertTrue(rdflib.compare.isomorphic(graph, _ParseJsonLd(
+        copy.deepcopy(doc), 'http://foo.invalid/ds.json', 'default')))
+    self.assertIn((None, rdflib.RDF.first, rdflib.Literal('a')), graph)
+
   def test_FrameGraph(self):
     json_val = FrameGraph(LoadGraph(_SampleJson, ''))
     self.assertEqual(json_val['@context'], 'http://schema.org')
@@ -86,6 +155,65 @@ class RdfUtilTests(unittest.TestCase):
     self.assertEqual(json_val['publisher']['contactPoint']['contactType'], 'User Support')
     self.assertEqual(json_val['publisher']['contactPoint']['url'], 'https://ec.europa.eu/eurostat/help/support')
 
+  def test_FrameGraph_MatchesPyld(self):
+    graphs = {'_SampleJson': LoadGraph(_SampleJson, '')}
+    for path in _FrameSamples:
+      if (_SamplesPath / path).exists():
+        graphs[path] = LocalFileGetter(str(_SamplesPath / path)).graph
+    for name, graph in graphs.items():
+      for frame in (_DataFileFrame, _FullFrame):
+        with self.subTest(graph=name, full=frame is _FullFrame):
+          expected = {'@context': 'http://schema.org'}
+          for node in _FrameGraphWithPyld(graph, frame):
+            expected.update(node)
+          self.assertEqual(_Canonicalize(FrameGraph(graph, frame)),
+                           _Canonicalize(expected))
+
+  def test_FrameGraph_Offline(self):
+    frame = {'@context': 'http://schema.org', '@type': 'StatisticalDataset'}
+    with mock.patch.object(jsonld, '_default_document_loader',
+                           jsonld.dummy_document_loader()):
+      json_val = FrameGraph(LoadGraph(_SampleJson, ''), frame)
+    self.assertEqual(json_val['name'], 'Eurostat Population Density')
+    self.assertEqual(json_val['publisher']['name'], 'Eurostat')
+
+  def test_DocumentLoader(self):
+    url = 'http://foo.invalid/context.jsonld'
+    remote = {
+        'contentType': 'application/ld+json',
+        'contextUrl': None,
+        'documentUrl': url,
+        'document': '{"@context": {"foo": "http://foo.invalid/foo"}}',
+    }
+    loader = mock.Mock(return_value=remote)
+    with tempfile.TemporaryDirectory() as tempdir, \
+        mock.patch.object(dspl2.rdfutil, '_CachePath', Path(tempdir)), \
+        mock.patch.object(jsonld, '_default_document_loader', loader):
+      for _ in range(2):
+        doc = _DocumentLoader(url, {})
+        self.assertEqual(doc['documentUrl'], url)
+        self.assertEqual(doc['document'],
+                         {'@context': {'foo': 'http://foo.invalid/foo'}})
+      loader.assert_called_once()
+      doc = _DocumentLoader('https://schema.org/', {})
+      self.assertIn('StatisticalDataset', doc['document']['@context'])
+      loader.assert_called_once()
+
+  def test_LoadCachedJson(self):
+    with tempfile.TemporaryDirectory() as tempdir:
+      path = Path(tempdir) / 'test.json'
+      cache_path = Path(tempdir) / 'cache'
+      path.write_text('{"a": [1, 2]}')
+      with mock.patch.object(dspl2.rdfutil, '_CachePath', cache_path):
+        self.assertEqual(_LoadCachedJson(path), {'a': [1, 2]})
+        self.assertTrue((cache_path / 'test.json.pickle').exists())
+        self.assertEqual(_LoadCachedJson(path), {'a': [1, 2]})
+        path.write_text('{"a": [1, 2, 3]}')
+        os.utime(path, ns=(0, 0))
+        self.assertEqual(_LoadCachedJson(path), {'a': [1, 2, 3]})
+        (cache_path / 'test.json.pickle').write_bytes(b'garbage')
+        self.assertEqual(_LoadCachedJson(path), {'a': [1, 2, 3]})
+
   def test_SelectFromGraph(self):
     graph = LoadGraph(_SampleJson, '')
     results = list(SelectFromGraph(
@@ -95,6 +223,76 @@ class RdfUtilTests(unittest.TestCase):
     self.assertEqual(len(results), 1)
     self.assertEqual(results[0]['name'], 'Eurostat Population Density')
 
+  def test_SelectFromGraph_MatchesSparql(self):
+    graph = LoadGraph(_SampleJson, '')
+    graph.add((rdflib.URIRef('http://foo.invalid/a'), rdflib.RDF.type,
+               rdflib.URIRef('http://foo.invalid/a')))
+    for constraints in [
+        (('?ds', 'a', 'schema:StatisticalDataset'),
+         ('?ds', 'schema:name', '?name')),
+        (('?org', 'schema:url', '?url'),
+         ('?org', 'rdf:type', 'schema:Organization')),
+        (('?ds', '<http://schema.org/publisher>', '?pub'),
+         ('?pub', 'schema:contactPoint', '?cp'),
+         ('?cp', '?prop', '?val')),
+        (('?x', 'a', '?x'),),
+        (('?x', 'schema:noSuchProperty', '?y'),),
+        (('?s', '?p', '?o'),),
+    ]:
+      with self.subTest(constraints=constraints):
+        expected = [{str(k): str(v) for k, v in binding.items()}
+                    for binding in graph.query(
+                        MakeSparqlSelectQuery(*constraints)).bindings]
+        key = lambda result: sorted(result.items())
+        self.assertEqual(sorted(SelectFromGraph(graph, *constraints), key=key),
+                         sorted(expected, key=key))
+
+  def test_SelectFromGraph_Sparql(self):
+    graph = LoadGraph(_SampleJson, '')
+    constraints = (('?ds', 'schema:name', '"Eurostat Population Density"'),
+                   ('?ds', 'schema:identifier', '?id'))
+    results = SelectFromGraph(graph, *constraints)
+    self.assertEqual(results, [{'ds': results[0]['ds'], 'id': 'met_d3dens'}])
+    misses = dspl2.rdfutil._PrepareQuery.cache_info().misses
+    self.assertEqual(SelectFromGraph(graph, *constraints), results)
+    cache_info = dspl2.rdfutil._PrepareQuery.cache_info()
+    self.assertEqual(cache_info.misses, misses)
+    self.assertEqual(cache_info.maxsize, dspl2.rdfutil._PreparedQueriesSize)
+
+  def test_NTriplesWriter(self):
+    graph = LoadGraph(_SampleJson, '')
+    graph.add((rdflib.URIRef('http://foo.invalid/'),
+               rdflib.URIRef('http://schema.org/description'),
+               rdflib.Literal('Quoted "text"\nwith\\escapes', lang='en')))
+    out = StringIO()
+    NTriplesWriter(out).write(graph)
+    self.assertTrue(rdflib.compare.isomorphic(
+        graph, rdflib.Graph().parse(data=out.getvalue(), format='nt')))
+
+  def test_NTriplesWriter_IriEscapes(self):
+    out = StringIO()
+    NTriplesWriter(out).add(
+        (rdflib.URIRef('http://foo.invalid/slice/month=APR 1948/<"x">'),
+         rdflib.URIRef('http://schema.org/codeValue'),
+         rdflib.Literal('APR 1948')))
+    graph = rdflib.Graph().parse(data=out.getvalue(), format='nt')
+    self.assertEqual(list(graph), [(
+        rdflib.URIRef('http://foo.invalid/slice/month=APR%201948/%3C%22x%22%3E'),
+        rdflib.URIRef('http://schema.org/codeValue'),
+        rdflib.Literal('APR 1948'))])
+
+  def test_NTriplesWriter_Quads(self):
+    out = StringIO()
+    NTriplesWriter(out, rdflib.URIRef('http://foo.invalid/ds')).add(
+        (rdflib.URIRef('http://foo.invalid/a'),
+         rdflib.URIRef('http://schema.org/value'),
+         rdflib.Literal('2019', datatype=rdflib.XSD.gYear)))
+    self.assertEqual(
+        out.getvalue(),
+        '<http://foo.invalid/a> <http://schema.org/value> '
+        '"2019"^^<http://www.w3.org/2001/XMLSchema#gYear> '
+        '<http://foo.invalid/ds> .\n')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+from dspl2.expander import Dspl2RdfExpander
+from dspl2.rdfutil import LoadGraph, SCHEMA, SelectFromGraph
+from dspl2.sqlitestore import SqliteStore
+from dspl2.tests.test_expander import (DummyGetter, _MakeSliceGraph,
+                                       _SliceCsv, _SliceCsvId)
+from dspl2.tests.test_rdfutil import _SampleJson
+import json
+import os
+from pathlib import Path
+import rdflib
+import rdflib.compare
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+_ScriptsPath = Path(__file__).parents[2] / 'scripts'
+_Dataset = {
+    '@context': 'http://schema.org',
+    '@type': 'StatisticalDataset',
+    '@id': '#ds',
+    'dimension': {
+        '@id': '#dim',
+        '@type': 'CategoricalDimension',
+        'codeList': 'dim.csv',
+    },
+    'measure': {'@id': '#measure', '@type': 'StatisticalMeasure'},
+    'slice': {
+        '@id': '#slice',
+        '@type': 'DataSlice',
+        'dimension': '#dim',
+        'measure': '#measure',
+        'data': 'slice.csv',
+    },
+}
+
+
+class SqliteStoreTests(unittest.TestCase):
+  def setUp(self):
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tempdir.name, 'graph.db')
+
+  def tearDown(self):
+    self.tempdir.cleanup()
+
+  def test_Terms(self):
+    graph = rdflib.Graph(store=SqliteStore(self.path))
+    triples = [
+        (rdflib.URIRef('http://foo.invalid/a'), SCHEMA.name,
+         rdflib.Literal('Quoted "text"\nwith\\escapes', lang='en')),
+        (rdflib.URIRef('http://foo.invalid/a'), SCHEMA.value,
+         rdflib.Literal('1.5', datatype=rdflib.XSD.decimal)),
+        (rdflib.URIRef('http://foo.invalid/a'), SCHEMA.footnote,
+         rdflib.BNode('fn')),
+    ]
+    for triple in triples:
+      graph.add(triple)
+    graph.add(triples[0])
+    self.assertEqual(len(graph), 3)
+    self.assertEqual(set(graph), set(triples))
+    graph.remove((None, SCHEMA.footnote, None))
+    self.assertEqual(set(graph), set(triples[:2]))
+    graph.close()
+
+    graph = rdflib.Graph(store=SqliteStore(self.path))
+    self.assertEqual(set(graph), set(triples[:2]))
+    graph.close()
+
+  def test_LoadGraph(self):
+    graph = LoadGraph(_SampleJson, '', store=SqliteStore(self.path))
+    self.assertTrue(rdflib.compare.isomorphic(graph,
+                                              LoadGraph(_SampleJson, '')))
+    results = list(SelectFromGraph(
+        graph,
+        ('?ds', 'rdf:type', 'schema:StatisticalDataset'),
+        ('?ds', 'schema:name', '?name')))
+    self.assertEqual(len(results), 1)
+    self.assertEqual(results[0]['name'], 'Eurostat Population Density')
+    graph.close()
+
+  def test_Expand(self):
+    graph = rdflib.Graph(store=SqliteStore(self.path))
+    graph += _MakeSliceGraph()
+    getter = DummyGetter(graph)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    Dspl2RdfExpander(getter).Expand()
+    expected = _MakeSliceGraph()
+    getter = DummyGetter(expected)
+    getter.Set(_SliceCsvId, _SliceCsv)
+    Dspl2RdfExpander(getter).Expand()
+    self.assertTrue(rdflib.compare.isomorphic(graph, expected))
+    graph.close()
+
+  def test_ExpandScript(self):
+    path = Path(self.tempdir.name)
+    (path / 'dataset.json').write_text(json.dumps(_Dataset))
+    (path / 'dim.csv').write_text('codeValue,name\nAA,A\nBB,B\n')
+    (path / 'slice.csv').write_text('dim,measure\nAA,1\nBB,2\n')
+    env = dict(os.environ, PYTHONPATH=str(_ScriptsPath.parent))
+    subprocess.run(
+        [sys.executable, str(_ScriptsPath / 'dspl2-expand.py'), '--rdf',
+         '--sqlite_store', self.path, str(path / 'dataset.json')],
+        check=True, env=env, stdout=subprocess.DEVNULL)
+    graph = rdflib.Graph(store=SqliteStore(self.path))
+    self.assertEqual(
+        len(set(graph.subjects(rdflib.RDF.type, SCHEMA.Observation))), 2)
+    graph.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -8,26 +8,134 @@
 from absl import app
 from absl import flags
 from dspl2 import (Dspl2RdfExpander, Dspl2JsonLdExpander, FrameGraph,
-                   LocalFileGetter)
+                   HybridFileGetter, LocalFileGetter, NTriplesWriter,
+                   SliceFilter, WriteJson, ZipFileGetter)
+from dspl2.expansioncache import ExpansionCache
+from dspl2.httpcache import HttpCache
+from dspl2.rdfutil import SCHEMA
+from dspl2.sqlitestore import SqliteStore
 import json
+import rdflib
 import sys
+from urllib.parse import urlparse
 
 
 flags.DEFINE_boolean('rdf', False, 'Process the JSON-LD as RDF.')
+flags.DEFINE_boolean('stream', False,
+                     'Write the output as the CSV files are read.')
+flags.DEFINE_boolean('compact', False,
+                     'Write slice data in compact, columnar form. Cannot be '
+                     'used with --rdf or --stream.')
+flags.DEFINE_enum('rdf_format', 'nt', ['nt', 'nquads'],
+                  'Serialization to use with --rdf --stream.')
+flags.DEFINE_integer('max_workers', None,
+                     'Number of processes to expand slices in parallel with.')
+flags.DEFINE_string('cache_dir', None,
+                    'Directory in which to cache expanded CSV files, so that '
+                    'later runs only expand the files that changed.')
+flags.DEFINE_string('http_cache_dir', None,
+                    'Directory in which to cache files downloaded from a '
+                    'dataset URL, which are revalidated on later runs.')
+flags.DEFINE_integer('http_cache_ttl', None,
+                     'Seconds for which files in --http_cache_dir are used '
+                     'without revalidating them.')
+flags.DEFINE_string('sqlite_store', None,
+                    'SQLite file to hold the graph in instead of memory. '
+                    'Requires --rdf.')
+flags.DEFINE_list('slices', None, 'IDs of the only slices to expand.')
+flags.DEFINE_multi_string('dimension_values', [],
+                          'DIMENSION:CODE,CODE... code values to expand '
+                          'rows for.')
+flags.DEFINE_string('time_start', None,
+                    'First time dimension value to expand rows for.')
+flags.DEFINE_string('time_end', None,
+                    'Last time dimension value to expand rows for.')
 
 
-def main(args):
-  if len(args) != 2:
-    print(f'Usage: {args[0]} [DSPL file]', file=sys.stderr)
-    exit(1)
-  getter = LocalFileGetter(args[1])
+def _GetSliceFilter():
+  if not (flags.FLAGS.slices or flags.FLAGS.dimension_values or
+          flags.FLAGS.time_start or flags.FLAGS.time_end):
+    return None
+  codeValues = {}
+  for dimension_values in flags.FLAGS.dimension_values:
+    dim, _, codes = dimension_values.rpartition(':')
+    codeValues[dim] = codes.split(',')
+  return SliceFilter(slices=flags.FLAGS.slices, codeValues=codeValues,
+                     timeRange=(flags.FLAGS.time_start, flags.FLAGS.time_end))
+
+
+def _Expand(path, store):
+  if urlparse(path).scheme in ('http', 'https'):
+    http_cache = None
+    if flags.FLAGS.http_cache_dir:
+      http_cache = HttpCache(flags.FLAGS.http_cache_dir,
+                             ttl=flags.FLAGS.http_cache_ttl)
+    _ExpandFiles(HybridFileGetter(path, store=store, cache=http_cache))
+  elif path.endswith('.zip'):
+    with ZipFileGetter(path, store=store) as getter:
+      _ExpandFiles(getter)
+  else:
+    _ExpandFiles(LocalFileGetter(path, store=store))
+
+
+def _ExpandFiles(getter):
+  cache = None
+  if flags.FLAGS.cache_dir:
+    cache = ExpansionCache(flags.FLAGS.cache_dir)
+  sliceFilter = _GetSliceFilter()
+  if flags.FLAGS.stream and not flags.FLAGS.rdf:
+    dspl = Dspl2JsonLdExpander(getter).Expand(lazySlices=True, cache=cache,
+                                              sliceFilter=sliceFilter)
+    WriteJson(dspl, sys.stdout, indent=2)
+    return
+  if flags.FLAGS.stream:
+    graph_id = None
+    if flags.FLAGS.rdf_format == 'nquads':
+      graph_id = getter.graph.value(predicate=rdflib.RDF.type,
+                                    object=SCHEMA.StatisticalDataset)
+    Dspl2RdfExpander(getter).Expand(
+        stream=NTriplesWriter(sys.stdout, graph_id),
+        max_workers=flags.FLAGS.max_workers, cache=cache,
+        sliceFilter=sliceFilter)
+    return
   if flags.FLAGS.rdf:
-    graph = Dspl2RdfExpander(getter).Expand()
+    graph = Dspl2RdfExpander(getter).Expand(
+        max_workers=flags.FLAGS.max_workers, cache=cache,
+        sliceFilter=sliceFilter)
     dspl = FrameGraph(getter.graph)
   else:
-    dspl = Dspl2JsonLdExpander(getter).Expand()
+    dspl = Dspl2JsonLdExpander(getter).Expand(
+        compactSlices=flags.FLAGS.compact,
+        max_workers=flags.FLAGS.max_workers, cache=cache,
+        sliceFilter=sliceFilter)
   json.dump(dspl, sys.stdout, indent=2)
 
 
+def main(args):
+  if len(args) != 2:
+    print(f'Usage: {args[0]} [DSPL file, zip file or URL]', file=sys.stderr)
+    exit(1)
+  if flags.FLAGS.compact and (flags.FLAGS.rdf or flags.FLAGS.stream):
+    print('--compact cannot be used with --rdf or --stream', file=sys.stderr)
+    exit(1)
+  if flags.FLAGS.sqlite_store and not flags.FLAGS.rdf:
+    print('--sqlite_store requires --rdf', file=sys.stderr)
+    exit(1)
+  if (flags.FLAGS.stream and not flags.FLAGS.rdf and
+      flags.FLAGS.max_workers):
+    print('--stream cannot be used with --max_workers without --rdf',
+          file=sys.stderr)
+    exit(1)
+  store = 'default'
+  if flags.FLAGS.sqlite_store:
+    store = SqliteStore(flags.FLAGS.sqlite_store)
+  try:
+    _Expand(args[1], store)
+  finally:
+    # Commits the expanded graph to the SQLite file.
+    if flags.FLAGS.sqlite_store:
+      store.close()
+
+
 if __name__ == '__main__':
   app.run(main)
@@ -5,15 +5,18 @@
 # license that can be found in the LICENSE file or at
 # https://developers.google.com/open-source/licenses/bsd
 
+import contextlib
 from flask import Flask, request, render_template
 import json
+import os
 from pathlib import Path
 import requests
 
 import dspl2
 from dspl2 import (
-    Dspl2JsonLdExpander, Dspl2RdfExpander, InternetFileGetter,
-    JsonToKwArgsDict, LoadGraph, FrameGraph, UploadedFileGetter)
+    Dspl2JsonLdExpander, Dspl2RdfExpander, HttpCache, InternetFileGetter,
+    JsonToKwArgsDict, LoadGraph, FrameGraph, UploadedFileGetter,
+    ZipFileGetter)
 
 
 def _Display(template, json_val):
@@ -22,6 +25,10 @@ def _Display(template, json_val):
 
 template_dir = Path(dspl2.__file__).parent / 'templates'
 app = Flask('dspl2-viewer', template_folder=template_dir.as_posix())
+# Cache of the files of rendered URLs, if DSPL2_HTTP_CACHE_DIR is set.
+http_cache = None
+if os.environ.get('DSPL2_HTTP_CACHE_DIR'):
+  http_cache = HttpCache(os.environ['DSPL2_HTTP_CACHE_DIR'])
 
 @app.route('/')
 def Root():
@@ -30,52 +37,59 @@ def Root():
 
 @app.route('/render', methods=['GET', 'POST'])
 def _HandleUploads():
-  try:
-    rdf = request.args.get('rdf') == 'on'
-    url = request.args.get('url')
-    if request.method == 'POST':
-      files = request.files.getlist('files[]')
-      getter = UploadedFileGetter(files)
-    else:
-      if not url:
-        return render_template('error.html',
-                               message="No URL provided")
-      getter = InternetFileGetter(url)
-    if rdf:
-      graph = Dspl2RdfExpander(getter).Expand()
-      json_val = FrameGraph(graph)
-    else:
-      json_val = Dspl2JsonLdExpander(getter).Expand()
-    return _Display('display.html', json_val)
-  except json.JSONDecodeError as e:
-    return render_template('error.html',
-                           action="decoding",
-                           url=e.doc or url,
-                           text=str(e))
-  except IOError as e:
-    return render_template('error.html',
-                           action="loading",
-                           url=e.filename,
-                           text=str(e))
-  except RuntimeError as e:
-    return render_template('error.html',
-                           text=str(e))
-  except requests.exceptions.HTTPError as e:
-    return render_template('error.html',
-                           url=url,
-                           action="retrieving",
-                           status=e.response.status_code,
-                           text=e.response.text)
-  except requests.exceptions.RequestException as e:
-    return render_template('error.html',
-                           url=url,
-                           action="retrieving",
-                           text=str(e))
-  except Exception as e:
-    return render_template('error.html',
-                           action="processing",
-                           url=url,
-                           text=str(type(e)) + str(e))
+  # Uploaded files and archives are closed when the request is handled.
+  with contextlib.ExitStack() as stack:
+    try:
+      rdf = request.args.get('rdf') == 'on'
+      url = request.args.get('url')
+      if request.method == 'POST':
+        files = request.files.getlist('files[]')
+        if len(files) == 1 and files[0].filename.endswith('.zip'):
+          getter = stack.enter_context(
+              ZipFileGetter(files[0].stream, name=files[0].filename))
+        else:
+          getter = stack.enter_context(UploadedFileGetter(files))
+      else:
+        if not url:
+          return render_template('error.html',
+                                 message="No URL provided")
+        getter = InternetFileGetter(url, cache=http_cache)
+        getter.Prefetch()
+      if rdf:
+        graph = Dspl2RdfExpander(getter).Expand()
+        json_val = FrameGraph(graph)
+      else:
+        json_val = Dspl2JsonLdExpander(getter).Expand()
+      return _Display('display.html', json_val)
+    except json.JSONDecodeError as e:
+      return render_template('error.html',
+                             action="decoding",
+                             url=e.doc or url,
+                             text=str(e))
+    except IOError as e:
+      return render_template('error.html',
+                             action="loading",
+                             url=e.filename,
+                             text=str(e))
+    except RuntimeError as e:
+      return render_template('error.html',
+                             text=str(e))
+    except requests.exceptions.HTTPError as e:
+      return render_template('error.html',
+                             url=url,
+                             action="retrieving",
+                             status=e.response.status_code,
+                             text=e.response.text)
+    except requests.exceptions.RequestException as e:
+      return render_template('error.html',
+                             url=url,
+                             action="retrieving",
+                             text=str(e))
+    except Exception as e:
+      return render_template('error.html',
+                             action="processing",
+                             url=url,
+                             text=str(type(e)) + str(e))
 
 
 if __name__ == '__main__':
@@ -99,10 +99,15 @@ def api_slices_for_measure():
 
 
 @lru_cache(maxsize=10)
-def _ExpandDataset(dataset):
+def _ExpandDataset(dataset, slice, dimension_value):
+  dim_val_dict = dict([dim_val.split(':')
+                       for dim_val in dimension_value.split(',')])
   getter = dspl2.HybridFileGetter(dataset)
   expander = dspl2.Dspl2JsonLdExpander(getter)
-  return expander.Expand()
+  # Only expand the rows of the requested slice with the requested codes.
+  return expander.Expand(sliceFilter=dspl2.SliceFilter(
+      slices=['#' + urlparse(slice).fragment],
+      codeValues={dim: [code] for dim, code in dim_val_dict.items()}))
 
 
 def _ParseDate(text, date_pattern):
@@ -115,7 +120,7 @@ def _ParseDate(text, date_pattern):
 def _GetDataSeries(dataset, slice, measure, dimension_value):
   dim_val_dict = dict([dim_val.split(':')
                        for dim_val in dimension_value.split(',')])
-  ds = _ExpandDataset(dataset)
+  ds = _ExpandDataset(dataset, slice, dimension_value)
   # Identify the time dimension's date format
   dateFormat = "yyyy-MM-dd"  # default
   for dimension in ds['dimension']: